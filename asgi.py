@@ -0,0 +1,4 @@
+# ASGI entry point of ASYNC_MODE, e.g. `uvicorn asgi:app`
+from services.async_mode import asgi_app
+
+app = asgi_app()
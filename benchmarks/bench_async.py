@@ -0,0 +1,216 @@
+"""Concurrent connections served by the sync and ASYNC_MODE deployments.
+
+Seeds a SQLite database, then runs the app in a server subprocess once per
+mode:
+
+  sync   Werkzeug's threaded WSGI server, one thread per connection
+  async  uvicorn with asgi.AsgiApp in ASYNC_MODE (aiosqlite), one process
+
+Every SQL statement is delayed by `--latency-ms` (awaited in async mode,
+slept in sync mode) to stand in for slow database round trips. For each
+`--concurrency` level, that many clients request `--url` in a loop for
+`--duration` seconds, each over its own connection (reopened after every
+response by Werkzeug, kept alive by uvicorn). Reports requests/s, p99 latency,
+errors and the server's peak RSS; a mode's capacity is the highest level
+served without errors within `--memory-mb`.
+
+    python -m benchmarks.bench_async --concurrency 10,50,200,500 \\
+        --latency-ms 20 --memory-mb 256
+
+The async mode needs the uvicorn and aiosqlite packages.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.http_bench import build_app, percentile
+
+try:
+    import uvicorn
+except ImportError:  # optional, only the sync mode can run
+    uvicorn = None
+
+
+def add_latency(app, seconds):
+    import sqlalchemy as sa
+    from main import db
+    from services.async_mode import sleep
+
+    def delay(*args):
+        sleep(seconds)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            sa.event.listen(engine, "before_cursor_execute", delay)
+    return app
+
+
+def serve(args):
+    # Runs in the server subprocess
+    from main import init_app
+
+    latency = args.latency_ms / 1000
+
+    if args.serve == "sync":
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        app = add_latency(init_app(), latency)
+        make_server("127.0.0.1", args.port, app,
+                    threaded=True).serve_forever()
+    else:
+        from services.async_mode import AsgiApp
+
+        os.environ["ASYNC_MODE"] = "1"
+        app = AsgiApp(lambda: add_latency(init_app(), latency))
+        uvicorn.run(app, host="127.0.0.1", port=args.port, lifespan="on",
+                    log_level="warning", backlog=4096)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def client(port, url, deadline, latencies, errors):
+    # One connection issuing requests back to back, reopened whenever the
+    # server closes it
+    request = (f"GET {url} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n").encode()
+    reader = writer = None
+
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", port)
+            started = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            headers = dict(line.lower().split(b":", 1)
+                           for line in head.split(b"\r\n")[1:] if line)
+            await reader.readexactly(int(headers.get(b"content-length", 0)))
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors.append(head.split(b"\r\n")[0])
+            latencies.append(time.perf_counter() - started)
+            if headers.get(b"connection", b"").strip() == b"close":
+                writer.close()
+                reader = writer = None
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors.append(e)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, url, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, url, deadline, latencies, errors)
+                           for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def wait_for_port(port, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"server exited with status {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("server did not start")
+
+
+def run_mode(args, mode, levels):
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.bench_async", "--serve", mode,
+        "--port", str(port), "--db", args.db,
+        "--latency-ms", str(args.latency_ms)])
+    try:
+        wait_for_port(port, server)
+        # the first request loads the controllers and warms the caches
+        asyncio.run(load(port, args.url, 1, 1))
+
+        capacity = 0
+        for concurrency in levels:
+            latencies, errors, elapsed = asyncio.run(
+                load(port, args.url, concurrency, args.duration))
+            rss = peak_rss_mb(server.pid)
+            p99 = percentile(latencies, 0.99) * 1000 if latencies else 0
+            print(f"{mode:<5} {concurrency:>5} conns  "
+                  f"{len(latencies) / elapsed:>8.1f} req/s  "
+                  f"p99 {p99:>8.1f} ms  errors {len(errors):>5}  "
+                  f"rss {rss:>7.1f} MB")
+            if not errors and rss <= args.memory_mb:
+                capacity = concurrency
+        return capacity
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--concurrency", default="10,50,200,500")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--memory-mb", type=float, default=256)
+    parser.add_argument("--url", default="/feed/public?limit=10")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-async.db"))
+    parser.add_argument("--no-reseed", dest="reseed", action="store_false")
+    # internal: run as the server of one mode
+    parser.add_argument("--serve", choices=("sync", "async"),
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URI"] = f"sqlite:///{args.db}"
+    if args.serve:
+        return serve(args)
+
+    modes = args.modes.split(",")
+    if "async" in modes and uvicorn is None:
+        print("uvicorn is not installed, skipping the async mode")
+        modes.remove("async")
+
+    args.diaries_per_user = 2
+    args.entries_per_diary = 10
+    args.workers = 0
+    build_app(args)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    capacities = {mode: run_mode(args, mode, levels) for mode in modes}
+
+    for mode, capacity in capacities.items():
+        print(f"{mode}: {capacity} connections within {args.memory_mb} MB")
+
+
+if __name__ == "__main__":
+    main()
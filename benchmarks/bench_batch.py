@@ -0,0 +1,118 @@
+"""Items/s through the batch endpoints vs their single-item equivalents.
+
+Seeds a database, logs in as user1 and writes `--items` entries, comments,
+likes and entry tags twice through the Flask app: one request per item
+(POST /entries/, POST /comments/, POST /likes/, PUT /entries/<id>/tags/<id>)
+and in batches of `--batch-size` (POST /entries/batch, /comments/batch,
+/likes/batch, POST /entries/<id>/tags).
+
+    python -m benchmarks.bench_batch --items 500 --batch-size 100
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.http_bench import WRITE_BODIES, build_app
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-batch.db"))
+    args = parser.parse_args()
+
+    # Enough bulk tags and other users' entries to like and tag
+    args.users = max(10, args.items // 10)
+    args.diaries_per_user = 2
+    args.entries_per_diary = 10
+    args.workers = 0
+    args.reseed = True
+
+    app = build_app(args)
+    client = app.test_client()
+    token = client.post("/auth/login", json=WRITE_BODIES["POST /auth/login"]
+                        ).json["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    from main import db
+    from models import Entry, Like, Tag
+
+    def post(url, body, method="POST"):
+        response = client.open(url, method=method, json=body,
+                               headers=headers)
+        assert response.status_code < 300, (url, response.get_data())
+        return response.json
+
+    with app.app_context():
+        liked = {like.entry_id for like in
+                 db.session.query(Like.entry_id).filter(Like.user_id == 1)}
+        likeable = [entry_id for entry_id, in db.session.query(Entry.id)
+                    .order_by(Entry.id) if entry_id not in liked]
+        tag_ids = [tag_id for tag_id, in db.session.query(Tag.id)
+                   .order_by(Tag.id).limit(args.items)]
+
+    n = args.items
+    half = len(likeable) // 2
+    if half < n:
+        parser.error(f"only {len(likeable)} entries to like, lower --items")
+
+    def single(kind):
+        if kind == "entries":
+            for i in range(n):
+                post("/entries/", {"content": f"Entry {i}", "diary_id": 1})
+        elif kind == "comments":
+            for i in range(n):
+                post("/comments/", {"content": f"Comment {i}",
+                                    "entry_id": 1})
+        elif kind == "likes":
+            for entry_id in likeable[:n]:
+                post("/likes/", {"entry_id": entry_id})
+        else:
+            entry_id = post("/entries/", {"content": "Tagged",
+                                          "diary_id": 1})["id"]
+            for tag_id in tag_ids:
+                post(f"/entries/{entry_id}/tags/{tag_id}", None, "PUT")
+
+    def batched(kind):
+        if kind == "entries":
+            for chunk in chunks(range(n), args.batch_size):
+                post("/entries/batch", [{"content": f"Entry {i}",
+                                         "diary_id": 1} for i in chunk])
+        elif kind == "comments":
+            for chunk in chunks(range(n), args.batch_size):
+                post("/comments/batch", [{"content": f"Comment {i}",
+                                          "entry_id": 1} for i in chunk])
+        elif kind == "likes":
+            for chunk in chunks(likeable[half:half + n], args.batch_size):
+                post("/likes/batch", [{"entry_id": entry_id}
+                                      for entry_id in chunk])
+        else:
+            entry_id = post("/entries/", {"content": "Tagged",
+                                          "diary_id": 1})["id"]
+            for chunk in chunks(tag_ids, args.batch_size):
+                post(f"/entries/{entry_id}/tags", {"tag_ids": chunk})
+
+    for kind in ("entries", "comments", "likes", "tags"):
+        count = len(tag_ids) if kind == "tags" else n
+        timings = {}
+        for mode, run in (("single", single), ("batch", batched)):
+            started = time.perf_counter()
+            run(kind)
+            timings[mode] = time.perf_counter() - started
+
+        print(f"{kind:<9} {count:>5} items  single "
+              f"{count / timings['single']:>8.0f}/s  batch "
+              f"{count / timings['batch']:>8.0f}/s  "
+              f"{timings['single'] / timings['batch']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Response size and time per content encoding.
+
+Seeds a database, then requests a few heavy JSON payloads (the entries of
+the most used tag, pages of users and tags, user1's diaries and entries)
+through the Flask app once per encoding offered by services.compression
+(gzip always, br and zstd when brotli/zstandard are installed) and once
+without Accept-Encoding. Reports the body size and the median time per
+request.
+
+    python -m benchmarks.bench_compression --requests 50
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.http_bench import WRITE_BODIES, build_app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-compression.db"))
+    args = parser.parse_args()
+
+    os.environ["COMPRESSION"] = "1"
+    args.diaries_per_user = 2
+    args.entries_per_diary = 10
+    args.workers = 0
+    args.reseed = True
+
+    app = build_app(args)
+    client = app.test_client()
+    token = client.post("/auth/login", json=WRITE_BODIES["POST /auth/login"]
+                        ).json["access_token"]
+
+    import sqlalchemy as sa
+    from main import db
+    from models import EntryTag
+    from services.compression import available
+
+    with app.app_context():
+        encodings = ["identity"] + available()
+        busiest_tag = db.session.execute(
+            sa.select(EntryTag.tag_id).group_by(EntryTag.tag_id)
+            .order_by(sa.func.count().desc()).limit(1)).scalar()
+
+    urls = [f"/entries/tags/{busiest_tag}", "/users/?limit=20",
+            "/tags/?limit=100", "/entries/diaries/1", "/diaries/"]
+
+    for url in urls:
+        print(url)
+        for encoding in encodings:
+            headers = {"Authorization": f"Bearer {token}",
+                       "Accept-Encoding": encoding}
+            timings = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                response = client.get(url, headers=headers)
+                timings.append(time.perf_counter() - started)
+
+            used = response.headers.get("Content-Encoding", "identity")
+            print(f"  {used:<9} {len(response.data):>9} bytes  "
+                  f"{statistics.median(timings) * 1000:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
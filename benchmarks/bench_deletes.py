@@ -0,0 +1,152 @@
+"""Deleting a diary: the ORM cascade vs services.deletion.
+
+For every `--entries` size, a public diary of user1 is filled with that many
+entries, each with `--comments` comments, `--likes` likes and `--tags` tags
+(Core inserts, then the search index and feed are rebuilt), and deleted:
+
+  orm  db.session.delete(diary) and one commit, through the cascades the
+       models declare (every child row loaded into the session)
+  set  the delete_diary job handler, a commit per chunk of
+       `--chunk-size` entries, as the background workers run it
+
+The diary is filled again for each way. Reports the time, the statements
+sent and the tracemalloc peak; the set-based peak depends on the chunk
+size, not on the size of the diary. Both timings include the tracemalloc
+overhead.
+
+    python -m benchmarks.bench_deletes --entries 100,300,1000
+    python -m benchmarks.bench_deletes --ways set --entries 1000,10000,50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.http_bench import build_app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--entries", default="100,300,1000",
+                        help="Comma separated diary sizes")
+    parser.add_argument("--ways", default="orm,set",
+                        help="Comma separated, the ORM cascade is slow past "
+                             "a few thousand entries")
+    parser.add_argument("--comments", type=int, default=5)
+    parser.add_argument("--likes", type=int, default=5)
+    parser.add_argument("--tags", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-deletes.db"))
+    args = parser.parse_args()
+    # the likers must be distinct users; seed-bulk also makes the tags
+    args.users = max(args.likes, args.comments, 1)
+    args.diaries_per_user, args.entries_per_diary = 1, 1
+    args.workers, args.reseed = 0, True
+
+    # Jobs are driven by hand below, not by request-started workers
+    os.environ["JOB_WORKERS"] = "0"
+    os.environ["JOB_CHUNK_SIZE"] = str(args.chunk_size)
+    app = build_app(args)
+
+    import sqlalchemy as sa
+    from main import db
+    from models import Comment, Diary, Entry, EntryTag, Like, Tag, User
+    from models.diaries import PrivacyOptions
+    from services import feed, jobs
+    from services.search import rebuild_index
+    from services.sqlite import writing
+
+    with app.app_context():
+        likers = db.session.execute(
+            sa.select(User.id).order_by(User.id).limit(args.users)
+        ).scalars().all()
+        tag_ids = db.session.execute(
+            sa.select(Tag.id).order_by(Tag.id).limit(args.tags)
+        ).scalars().all()
+        db.session.rollback()
+
+    def fill(size):
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            diary_id = connection.execute(Diary.__table__.insert().values(
+                title="Benchmark diary", privacy=PrivacyOptions.PUBLIC,
+                date_created=now, user_id=likers[0])).inserted_primary_key[0]
+            first = (connection.execute(
+                sa.select(sa.func.max(Entry.id))).scalar() or 0) + 1
+            ids = range(first, first + size)
+
+            connection.execute(Entry.__table__.insert(), [
+                dict(id=i, content=f"Benchmark entry {i}", date_created=now,
+                     diary_id=diary_id, like_count=args.likes,
+                     comment_count=args.comments) for i in ids])
+            connection.execute(Comment.__table__.insert(), [
+                dict(content="Benchmark comment", user_id=user_id,
+                     entry_id=i, date_created=now)
+                for i in ids for user_id in likers[:args.comments]])
+            connection.execute(Like.__table__.insert(), [
+                dict(user_id=user_id, entry_id=i, date_created=now)
+                for i in ids for user_id in likers[:args.likes]])
+            if tag_ids:
+                connection.execute(EntryTag.__table__.insert(), [
+                    dict(entry_id=i, tag_id=tag_id)
+                    for i in ids for tag_id in tag_ids])
+
+            rebuild_index(connection)
+            feed.rebuild(connection)
+
+        return diary_id
+
+    def orm(diary_id):
+        with writing():
+            db.session.delete(db.session.get(Diary, diary_id))
+            db.session.commit()
+
+    def set_based(diary_id):
+        steps = jobs.delete_diary(diary_id)
+        finished = False
+        while not finished:
+            with writing():
+                try:
+                    next(steps)
+                except StopIteration:
+                    finished = True
+                db.session.commit()
+
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    print(f"{'entries':>8} {'rows':>8} {'way':>4} {'seconds':>8} "
+          f"{'statements':>10} {'peak MiB':>9}")
+
+    with app.app_context():
+        sa.event.listen(db.engine, "before_cursor_execute", count)
+        for size in map(int, args.entries.split(",")):
+            rows = size * (1 + args.comments + args.likes + len(tag_ids))
+
+            for name in args.ways.split(","):
+                delete = {"orm": orm, "set": set_based}[name]
+                diary_id = fill(size)
+                db.session.remove()
+
+                statements = 0
+                tracemalloc.start()
+                started = time.perf_counter()
+                delete(diary_id)
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                db.session.remove()
+
+                print(f"{size:>8} {rows:>8} {name:>4} {elapsed:>8.3f} "
+                      f"{statements:>10} {peak / 2 ** 20:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Response encoding: Flask's stdlib JSON provider vs services.json_provider.
+
+Seeds about `--entries` entries, dumps a page of EntrySchema payloads
+(`--page` entries with their diary, tags, comments and likes) and every
+diary through DiarySchema, then times building the JSON response for each
+payload, best of `--repeat`:
+
+    stdlib   Flask's DefaultJSONProvider on the schema.dump() output
+    fast     FastJSONProvider (orjson when installed) on the same output
+
+and the whole dump + encode of the request path, before and after:
+
+    before   schema.dump() then Flask's DefaultJSONProvider
+    after    the compiled native dump, which leaves datetimes and enums to
+             the encoder, then FastJSONProvider
+
+    python -m benchmarks.bench_json --page 500
+"""
+import argparse
+import os
+import tempfile
+
+from flask.json.provider import DefaultJSONProvider
+
+from benchmarks.bench_serializers import best_of
+from benchmarks.http_bench import build_app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--page", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-json.db"))
+    args = parser.parse_args()
+
+    args.users = max(1, args.entries // 20)
+    args.diaries_per_user = 2
+    args.entries_per_diary = 10
+    args.workers = 0
+    args.reseed = True
+
+    app = build_app(args)
+
+    from controllers.entries_controllers import ENTRY_GRAPH
+    from main import db
+    from models import Diary, Entry
+    from schemas.diaries import diaries_schema
+    from schemas.entries import entries_schema
+    from services.json_provider import FastJSONProvider
+    from services.serializers import compiled
+
+    stdlib = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    print(f"fast provider encoder: {'orjson' if fast.fast else 'stdlib'}")
+
+    with app.app_context():
+        entries = db.session.query(Entry).options(*ENTRY_GRAPH) \
+            .order_by(Entry.id).limit(args.page).all()
+        diaries = db.session.query(Diary).order_by(Diary.id).all()
+
+        for name, schema, rows in (("entries", entries_schema, entries),
+                                   ("diaries", diaries_schema, diaries)):
+            dumped = schema.dump(rows)
+            native = compiled(schema, native=True)(rows)
+            assert fast.loads(fast.response(native).get_data()) == \
+                stdlib.loads(stdlib.response(dumped).get_data()), name
+
+            timings = {
+                "stdlib": best_of(args.repeat, stdlib.response, dumped),
+                "fast": best_of(args.repeat, fast.response, dumped),
+                "before": best_of(args.repeat, lambda: stdlib.response(
+                    schema.dump(rows))),
+                "after": best_of(args.repeat, lambda: fast.response(
+                    compiled(schema, native=True)(rows))),
+            }
+            size = len(fast.response(native).get_data())
+            print(f"{name:<8} {len(rows):>5} rows {size / 1024:>6.0f} KiB  "
+                  + "  ".join(f"{mode} {seconds * 1000:>7.2f} ms"
+                              for mode, seconds in timings.items()))
+            print(f"{'':<8} encode {timings['stdlib'] / timings['fast']:.1f}x"
+                  f"  dump + encode "
+                  f"{timings['before'] / timings['after']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Measure bcrypt login throughput per core at several cost factors.
+
+    python -m benchmarks.bench_passwords --costs 10 11 12 --seconds 3
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+PASSWORD = b"correct horse battery staple"
+
+
+def _checks_for(password_hash, seconds):
+    # Verify `password_hash` in a loop; returns the number of checks done
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        bcrypt.checkpw(PASSWORD, password_hash)
+        done += 1
+    return done
+
+
+def run(costs, seconds, workers):
+    print(f"{'cost':>4} {'ms/login':>9} {'logins/s/core':>14} "
+          f"{'logins/s (' + str(workers) + ' workers)':>22}")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for cost in costs:
+            password_hash = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(cost))
+
+            single = _checks_for(password_hash, seconds) / seconds
+            pooled = sum(pool.map(_checks_for, [password_hash] * workers,
+                                  [seconds] * workers)) / seconds
+
+            print(f"{cost:>4} {1000 / single:>9.1f} {single:>14.1f} "
+                  f"{pooled:>22.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--costs", type=int, nargs="+",
+                        default=[4, 8, 10, 12])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    run(args.costs, args.seconds, args.workers)
+
+
+if __name__ == "__main__":
+    main()
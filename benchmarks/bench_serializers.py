@@ -0,0 +1,137 @@
+"""marshmallow schema.dump vs the compiled serializers of services.serializers.
+
+Seeds a database with about `--entries` entries (with their tags, comments
+and likes), loads them once through the ENTRY_GRAPH eager options and times
+`entries_schema.dump` against its compiled version, best of `--repeat`.
+A flat EntrySchema is also timed over Core result rows.
+
+--check is the differential test: every schema instance in schemas/, single
+and many, is dumped both ways over every row of its model and the JSON text
+must be identical, key order included. When the app's JSON provider encodes
+datetimes and enums itself, the native variant must encode to the same text
+through it. It exits non-zero on a mismatch.
+
+    python -m benchmarks.bench_serializers --entries 10000
+    python -m benchmarks.bench_serializers --check
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.http_bench import build_app
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def schema_instances():
+    # (name, schema, model) of every module level schema
+    import schemas.comments
+    import schemas.diaries
+    import schemas.entries
+    import schemas.jobs
+    import schemas.likes
+    import schemas.tags
+    import schemas.users
+    from marshmallow import Schema
+
+    for module in (schemas.comments, schemas.diaries, schemas.entries,
+                   schemas.jobs, schemas.likes, schemas.tags, schemas.users):
+        for name, value in vars(module).items():
+            if isinstance(value, Schema):
+                yield f"{module.__name__}.{name}", value, value.opts.model
+
+
+def check(app):
+    from main import db
+    from services.serializers import compiled, native_values
+
+    failures = 0
+    with app.app_context():
+        for name, schema, model in schema_instances():
+            rows = db.session.query(model).order_by(model.id).all()
+            samples = [rows] if schema.many else rows
+
+            for sample in samples:
+                dumped = schema.dump(sample)
+                expected = (json.dumps(dumped), app.json.dumps(dumped))
+                actual = (json.dumps(compiled(schema)(sample)),
+                          app.json.dumps(compiled(schema, native_values())(sample)))
+                if expected != actual:
+                    failures += 1
+                    print(f"MISMATCH {name}\n  marshmallow {expected}"
+                          f"\n  compiled    {actual}")
+                    break
+            else:
+                print(f"ok       {name} ({len(rows)} rows)")
+
+    return failures
+
+
+def benchmark(app, repeat):
+    import sqlalchemy as sa
+    from controllers.entries_controllers import ENTRY_GRAPH
+    from main import db
+    from models import Entry
+    from schemas.entries import EntrySchema, entries_schema
+    from services.serializers import compiled
+
+    with app.app_context():
+        entries = db.session.query(Entry).options(*ENTRY_GRAPH) \
+            .order_by(Entry.id).all()
+        flat_schema = EntrySchema(many=True, exclude=(
+            "diary", "tags", "comments", "likes"))
+        core_rows = db.session.execute(
+            sa.select(Entry.__table__).order_by(Entry.id)).all()
+
+        cases = {
+            "orm graph": (entries_schema, entries),
+            "core flat": (flat_schema, core_rows),
+        }
+        for case, (schema, rows) in cases.items():
+            assert compiled(schema)(rows) == schema.dump(rows), case
+
+            before = best_of(repeat, schema.dump, rows)
+            after = best_of(repeat, compiled(schema), rows)
+            print(f"{case:<10} {len(rows):>6} entries  marshmallow "
+                  f"{before * 1000:>8.1f} ms  compiled {after * 1000:>8.1f}"
+                  f" ms  {before / after:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true",
+                        help="Only run the differential test")
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-serializers.db"))
+    args = parser.parse_args()
+
+    # 10 entries per diary, 2 diaries per user
+    args.users = max(1, args.entries // 20) if not args.check else 20
+    args.diaries_per_user = 2
+    args.entries_per_diary = 10
+    args.workers = 0
+    args.reseed = True
+
+    app = build_app(args)
+
+    if args.check:
+        sys.exit(1 if check(app) else 0)
+
+    benchmark(app, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
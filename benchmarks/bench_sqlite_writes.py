@@ -0,0 +1,129 @@
+"""Writes/s under mixed read/write load, with and without SQLITE_PRODUCTION.
+
+Each profile runs in its own process against its own freshly seeded SQLite
+file: writer threads create entries and comments while reader threads list
+and fetch entries, all through the Flask app, for a fixed duration. Failed
+requests (e.g. "database is locked") are counted separately.
+
+    python -m benchmarks.bench_sqlite_writes --seconds 10 --writers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.http_bench import WRITE_BODIES, build_app, percentile
+
+PROFILES = ("default", "production")
+
+
+def run_profile(args):
+    os.environ["SQLITE_PRODUCTION"] = "1" if args.profile == "production" \
+        else "0"
+    args.db = os.path.join(tempfile.gettempdir(),
+                           f"diary-writes-{args.profile}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    args.reseed = True
+
+    app = build_app(args)
+    token = app.test_client().post(
+        "/auth/login", json=WRITE_BODIES["POST /auth/login"]
+    ).json["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    latencies = {"write": [], "read": []}
+    failures = {"write": 0, "read": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def loop(kind, requests):
+        client = app.test_client()
+        count = 0
+
+        while time.perf_counter() < deadline:
+            method, url, body = requests[count % len(requests)]
+            count += 1
+            t0 = time.perf_counter()
+            response = client.open(url, method=method, json=body,
+                                   headers=headers)
+            elapsed = time.perf_counter() - t0
+
+            with lock:
+                if response.status_code < 400:
+                    latencies[kind].append(elapsed)
+                else:
+                    failures[kind] += 1
+
+    writes = [("POST", "/entries/", {"content": "Benchmark entry",
+                                     "diary_id": 1}),
+              ("POST", "/comments/", {"content": "Benchmark comment",
+                                      "entry_id": 1})]
+    reads = [("GET", "/entries/diaries/1?limit=20", None),
+             ("GET", "/entries/1", None)]
+
+    threads = [threading.Thread(target=loop, args=("write", writes))
+               for _ in range(args.writers)]
+    threads += [threading.Thread(target=loop, args=("read", reads))
+                for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = {}
+    for kind in ("write", "read"):
+        samples = latencies[kind] or [0]
+        result[kind] = {
+            "ok_per_s": round(len(latencies[kind]) / args.seconds, 1),
+            "failed": failures[kind],
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--diaries-per-user", type=int, default=2)
+    parser.add_argument("--entries-per-diary", type=int, default=10)
+    parser.add_argument("--profile", choices=PROFILES,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.workers = 0
+
+    if args.profile:
+        return run_profile(args)
+
+    results = {}
+    for profile in PROFILES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sqlite_writes",
+             "--profile", profile] + sys.argv[1:],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+
+        for kind, stats in results[profile].items():
+            print(f"{profile:<11} {kind:<6} {stats['ok_per_s']:>8} ok/s "
+                  f"{stats['failed']:>6} failed  p50 {stats['p50_ms']} ms  "
+                  f"p95 {stats['p95_ms']} ms")
+
+    before = results["default"]["write"]["ok_per_s"]
+    after = results["production"]["write"]["ok_per_s"]
+    if before:
+        print(f"writes/s: {after / before:.2f}x with SQLITE_PRODUCTION")
+
+
+if __name__ == "__main__":
+    main()
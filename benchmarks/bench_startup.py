@@ -0,0 +1,115 @@
+"""Cold start cost of the app, with and without FAST_STARTUP.
+
+Every sample is a fresh interpreter. The app samples time `import main`,
+`init_app()` and the first request; the CLI samples time a whole
+`flask db --help` process. Medians are reported per mode.
+
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --importtime   # slowest imports
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {"default": "0", "fast": "1"}
+
+APP_SAMPLE = """
+import json, time
+t0 = time.perf_counter()
+from main import init_app
+t1 = time.perf_counter()
+app = init_app()
+t2 = time.perf_counter()
+status = app.test_client().get("/tags/").status_code
+t3 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "init_ms": (t2 - t1) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000, "status": status}))
+"""
+
+
+def environment(mode, db):
+    return dict(os.environ, FAST_STARTUP=MODES[mode],
+                DATABASE_URI=f"sqlite:///{db}")
+
+
+def run(command, env):
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def sample_app(mode, db):
+    wall, result = run([sys.executable, "-c", APP_SAMPLE],
+                       environment(mode, db))
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = wall
+    return timings
+
+
+def sample_cli(mode, db):
+    wall, _ = run([sys.executable, "-m", "flask", "db", "--help"],
+                  environment(mode, db))
+    return {"cli_ms": wall}
+
+
+def import_profile(db, limit):
+    # Modules with the largest cumulative import time under init_app()
+    _, result = run([sys.executable, "-X", "importtime", "-c",
+                     "from main import init_app; init_app()"],
+                    environment("default", db))
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        rows.append((int(cumulative), module.rstrip()))
+
+    for cumulative, module in sorted(rows, reverse=True)[:limit]:
+        print(f"{cumulative / 1000:>9.1f} ms {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(),
+                                                     "diary-startup.db"))
+    parser.add_argument("--importtime", type=int, nargs="?", const=25,
+                        metavar="N", help="Print the N slowest imports")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    # One eager boot creates the schema the fast mode expects to exist
+    sample_app("default", args.db)
+
+    if args.importtime:
+        import_profile(args.db, args.importtime)
+        return
+
+    report = {}
+    for mode in MODES:
+        samples = [dict(sample_app(mode, args.db), **sample_cli(mode, args.db))
+                   for _ in range(args.runs)]
+        report[mode] = {
+            metric: round(statistics.median(s[metric] for s in samples), 1)
+            for metric in ("import_ms", "init_ms", "first_request_ms",
+                           "process_ms", "cli_ms")
+        }
+        print(f"{mode:<8} " + "  ".join(
+            f"{metric} {value:>7}" for metric, value in report[mode].items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
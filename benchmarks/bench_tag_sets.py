@@ -0,0 +1,109 @@
+"""Tag set queries: services.tag_postings vs the equivalent SQL INTERSECT.
+
+Seeds a database, builds the posting lists and runs a few "all / any /
+none" queries over the busiest tags both ways, each producing the first
+page (`--limit` ids after an optional cursor) of public entries:
+
+  index  candidates from the posting lists, then one IN query keeping the
+         public ones (what GET /entries/tags does before loading entries)
+  sql    entry_tags INTERSECT / EXCEPT compound (IN for `any`), joined
+         to entries and diaries for the privacy filter, ordered and
+         limited
+
+Both must return the same ids. Reports the best of `--repeat` runs.
+
+    python -m benchmarks.bench_tag_sets --users 2000 --repeat 20
+"""
+import argparse
+import os
+import tempfile
+from itertools import islice
+
+from benchmarks.bench_serializers import best_of
+from benchmarks.http_bench import build_app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--diaries-per-user", type=int, default=2)
+    parser.add_argument("--entries-per-diary", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-tag-sets.db"))
+    parser.add_argument("--no-reseed", dest="reseed", action="store_false")
+    args = parser.parse_args()
+    args.workers = 0
+
+    app = build_app(args)
+
+    import sqlalchemy as sa
+    from main import db
+    from models import Diary, Entry, EntryTag
+    from models.diaries import PrivacyOptions
+    from services.tag_postings import tag_postings
+
+    def tagged(tag_id):
+        return sa.select(EntryTag.entry_id).where(EntryTag.tag_id == tag_id)
+
+    def public_ids(where):
+        return list(db.session.execute(
+            sa.select(Entry.id).join(Entry.diary)
+            .where(where, Diary.privacy == PrivacyOptions.PUBLIC)
+            .order_by(Entry.id).limit(args.limit)).scalars())
+
+    def by_index(all_of, any_of, none_of, after):
+        matches = tag_postings().matches(db.session, all_of, any_of,
+                                         none_of, after)
+        ids, wanted = [], args.limit
+        while len(ids) < args.limit:
+            chunk = list(islice(matches, wanted))
+            if not chunk:
+                break
+            ids += public_ids(Entry.id.in_(chunk))
+            wanted *= 2
+        return ids[:args.limit]
+
+    def by_sql(all_of, any_of, none_of, after):
+        parts = [tagged(tag_id) for tag_id in all_of]
+        if any_of:
+            parts.append(sa.select(EntryTag.entry_id)
+                         .where(EntryTag.tag_id.in_(any_of)))
+        compound = sa.intersect(*parts) if len(parts) > 1 else parts[0]
+        if none_of:
+            compound = sa.except_(compound, *(tagged(tag_id)
+                                              for tag_id in none_of))
+        return public_ids(sa.and_(Entry.id.in_(compound), Entry.id > after))
+
+    with app.app_context():
+        tag_postings().load(db.session)
+        a, b, c, d = db.session.execute(
+            sa.select(EntryTag.tag_id).group_by(EntryTag.tag_id)
+            .order_by(sa.func.count().desc()).limit(4)).scalars()
+        middle = db.session.execute(sa.select(sa.func.max(Entry.id))
+                                    ).scalar() // 2
+
+        queries = [
+            (f"all={a},{b}", {a, b}, set(), set(), 0),
+            (f"all={a},{b},{c}", {a, b, c}, set(), set(), 0),
+            (f"all={a}&none={b}", {a}, set(), {b}, 0),
+            (f"any={b},{c}&none={a}", set(), {b, c}, {a}, 0),
+            (f"all={a}&any={c},{d} after {middle}", {a}, {c, d}, set(),
+             middle),
+        ]
+
+        for label, *query in queries:
+            expected = by_sql(*query)
+            assert by_index(*query) == expected, label
+
+            index = best_of(args.repeat, by_index, *query)
+            sql = best_of(args.repeat, by_sql, *query)
+            print(f"{label:<32} {len(expected):>4} ids  index "
+                  f"{index * 1000:>7.3f} ms  sql {sql * 1000:>7.3f} ms  "
+                  f"{sql / index:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
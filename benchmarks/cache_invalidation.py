@@ -0,0 +1,77 @@
+"""Check that writes invalidate every cached response nesting what they change.
+
+Builds the app with RESPONSE_CACHE=memory against a freshly seeded SQLite
+database. Each step GETs its urls, runs a write as user1 and GETs them again:
+every url must come back with a new ETag and a body without the stale text.
+A url still answering with its old ETag fails the check (exit status 1).
+
+Tag 1 is nested in the responses of the entries carrying it, so renaming or
+deleting it must also reach responses built for their other tags.
+
+    python -m benchmarks.cache_invalidation
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.http_bench import WRITE_BODIES, build_app
+
+# (write method, write url, json body, urls nesting the change, stale text)
+STEPS = (
+    ("PUT", "/tags/1", {"name": "Renamed tag"},
+     ("/tags/", "/tags/1", "/entries/tags/1", "/entries/tags/2"), "Tag1"),
+    ("DELETE", "/tags/1", None,
+     ("/tags/", "/entries/tags/2"), "Renamed tag"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(
+        tempfile.gettempdir(), "diary-cache-invalidation.db"))
+    args = parser.parse_args()
+    args.users, args.diaries_per_user, args.entries_per_diary = 1, 1, 1
+    args.workers, args.reseed = 0, True
+
+    os.environ["RESPONSE_CACHE"] = "memory"
+    app = build_app(args)
+    client = app.test_client()
+    token = client.post(
+        "/auth/login", json=WRITE_BODIES["POST /auth/login"]
+    ).json["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    failures = 0
+    for method, url, body, urls, stale in STEPS:
+        before = {}
+        for cached in urls:
+            # the second GET is served from the cache
+            client.get(cached, headers=headers)
+            before[cached] = client.get(cached, headers=headers)
+
+        status = client.open(url, method=method, json=body,
+                             headers=headers).status_code
+        print(f"{method} {url} [{status}]")
+        if not 200 <= status < 300:
+            failures += 1
+            print(f"  UNEXPECTED STATUS {status}")
+            continue
+
+        for cached in urls:
+            response = client.get(cached, headers=headers)
+            if response.headers.get("ETag") == \
+                    before[cached].headers.get("ETag") or \
+                    stale in response.get_data(as_text=True):
+                failures += 1
+                print(f"  STALE {cached}")
+            else:
+                print(f"  ok    {cached}")
+
+    print(f"{failures} stale or failed response(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""HTTP latency/throughput benchmark for every blueprint route.
+
+Builds the app with main.init_app against a freshly seeded SQLite database,
+then drives each route of controllers.registered_controllers through Flask's
+test client and through a real threaded WSGI server, reporting per endpoint:
+p50/p95/p99 latency, requests/s, SQL statements per request, the Python heap
+peak of one call and how much the process RSS grew while it ran. The peak
+RSS of the whole process is reported once, in "meta".
+GET routes answering with an ETag (RESPONSE_CACHE) are also checked to
+answer a conditional GET for it with 304. A failed check, or a route
+answering anything but 2xx, exits non-zero.
+
+    python -m benchmarks.http_bench --output before.json
+    python -m benchmarks.http_bench --output after.json --compare before.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# Sample ids every route is called with; they all belong to user1 from
+# "flask db seed", so authorised routes answer 200
+URL_VALUES = {
+    "user_id": 1,
+    "diary_id": 1,
+    "entry_id": 1,
+    "tag_id": 1,
+    "comment_id": 1,
+    "like_id": 1,
+    "job_id": 1,
+}
+
+# Query strings of routes that answer 400 without one
+QUERY_STRINGS = {
+    "GET /entries/tags": "all=1&any=2,3",
+}
+
+# Write routes need a body. Deletes are skipped: they would remove the
+# fixtures the other routes read.
+WRITE_BODIES = {
+    "POST /auth/login": {"email": "user1@example.com",
+                         "password": "password"},
+    "POST /diaries/": {"title": "Benchmark diary", "privacy": "PUBLIC"},
+    "PUT /diaries/<int:diary_id>": {"title": "User1 Diary1",
+                                    "privacy": "PUBLIC"},
+    "POST /entries/": {"content": "Benchmark entry", "diary_id": 1},
+    "PUT /entries/<int:entry_id>": {"content": "Diary1 Entry1",
+                                    "diary_id": 1},
+    "POST /comments/": {"content": "Benchmark comment", "entry_id": 1},
+    "PUT /comments/<int:comment_id>": {"content": "Comment by user1 on "
+                                                  "entry1", "entry_id": 1},
+}
+
+# Metrics compared by --compare; higher is worse for all of them
+COMPARED = ("p50_ms", "p95_ms", "sql_per_request")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "req_per_s": round(len(latencies) / elapsed, 1),
+    }
+
+
+def peak_rss_kb():
+    # Highest RSS of the process so far, not of any one endpoint; ru_maxrss
+    # is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def current_rss_kb():
+    # RSS right now, from /proc (Linux); None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * resource.getpagesize() // 1024
+
+
+def rss_growth_kb(before):
+    after = current_rss_kb()
+    return None if before is None or after is None else after - before
+
+
+def build_app(args):
+    os.environ["DATABASE_URI"] = f"sqlite:///{args.db}"
+    os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+
+    from main import init_app
+
+    app = init_app()
+    runner = app.test_cli_runner()
+
+    if args.reseed:
+        for command in (["db", "drop"], ["db", "create"], ["db", "seed"],
+                        ["db", "seed-bulk", "--users", str(args.users),
+                         "--diaries-per-user", str(args.diaries_per_user),
+                         "--entries-per-diary", str(args.entries_per_diary),
+                         "--workers", str(args.workers)],
+                        # a finished job for GET /jobs/<job_id>
+                        ["db", "reconcile-counters", "--background"],
+                        ["db", "run-jobs"]):
+            result = runner.invoke(args=command)
+            if result.exception:
+                raise result.exception
+
+    return app
+
+
+def collect_routes(app):
+    from controllers import registered_controllers
+    from services.startup import load_controllers
+
+    load_controllers(app)
+
+    blueprints = {blueprint.name for blueprint in registered_controllers}
+    routes = []
+
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if rule.endpoint.split(".")[0] not in blueprints:
+            continue
+
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            name = f"{method} {rule.rule}"
+
+            if method == "DELETE" or (method != "GET"
+                                      and name not in WRITE_BODIES):
+                continue
+
+            url = rule.rule
+            for argument in rule.arguments:
+                url = re.sub(rf"<[^>]*{argument}>",
+                             str(URL_VALUES[argument]), url)
+            if name in QUERY_STRINGS:
+                url += "?" + QUERY_STRINGS[name]
+
+            routes.append((name, method, url, WRITE_BODIES.get(name)))
+
+    return routes
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        import sqlalchemy as sa
+
+        self.count = 0
+        sa.event.listen(engine, "before_cursor_execute", self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def bench_test_client(app, routes, token, counter, args):
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+
+    for name, method, url, body in routes:
+        def call():
+            response = client.open(url, method=method, json=body,
+                                   headers=headers)
+            response.get_data()
+            return response.status_code
+
+        rss_before = current_rss_kb()
+        # the status reported is the first call's, also with --warmup 0
+        status = call()
+        for _ in range(args.warmup):
+            call()
+
+        counter.count = 0
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        statements = counter.count
+
+        # One extra traced call gives the Python heap peak of the endpoint
+        tracemalloc.start()
+        call()
+        _, peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # None when the route sends no ETag
+        not_modified = None
+        if method == "GET":
+            etag = client.get(url, headers=headers).headers.get("ETag")
+            if etag:
+                not_modified = client.get(url, headers=dict(
+                    headers, **{"If-None-Match": etag})).status_code == 304
+
+        results[name] = dict(
+            summarize(latencies, elapsed),
+            status=status,
+            sql_per_request=round(statements / args.requests, 2),
+            peak_alloc_kb=peak_alloc // 1024,
+            rss_growth_kb=rss_growth_kb(rss_before),
+            not_modified=not_modified,
+        )
+        print(f"  {name:<45} {results[name]['p50_ms']:>9.2f} ms "
+              f"{results[name]['req_per_s']:>9.1f} req/s "
+              f"{results[name]['sql_per_request']:>6} sql "
+              f"[{status}]")
+
+    return results
+
+
+def bench_wsgi(app, routes, token, counter, args):
+    from werkzeug.serving import make_server
+
+    # keep the per-request access log out of the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    headers = {"Authorization": f"Bearer {token}",
+               "Content-Type": "application/json"}
+    results = {}
+
+    try:
+        for name, method, url, body in routes:
+            payload = json.dumps(body) if body is not None else None
+            latencies = []
+
+            def call():
+                connection = http.client.HTTPConnection(
+                    "127.0.0.1", server.server_port)
+                connection.request(method, url, body=payload,
+                                   headers=headers)
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                return response.status
+
+            rss_before = current_rss_kb()
+            status = call()
+            for _ in range(args.warmup):
+                call()
+
+            # Clients hammer the endpoint concurrently; latency is per call
+            def worker(count):
+                for _ in range(count):
+                    t0 = time.perf_counter()
+                    call()
+                    latencies.append(time.perf_counter() - t0)
+
+            counter.count = 0
+            per_client = max(1, args.requests // args.concurrency)
+            clients = [threading.Thread(target=worker, args=(per_client,))
+                       for _ in range(args.concurrency)]
+            started = time.perf_counter()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - started
+
+            results[name] = dict(
+                summarize(latencies, elapsed),
+                status=status,
+                sql_per_request=round(counter.count / len(latencies), 2),
+                rss_growth_kb=rss_growth_kb(rss_before),
+            )
+            print(f"  {name:<45} {results[name]['p50_ms']:>9.2f} ms "
+                  f"{results[name]['req_per_s']:>9.1f} req/s [{status}]")
+    finally:
+        server.shutdown()
+
+    return results
+
+
+def compare(baseline, current, threshold):
+    # Print metrics that got worse by more than `threshold` (a fraction);
+    # returns the number of regressions found
+    regressions = 0
+
+    for mode, endpoints in current["results"].items():
+        for name, metrics in endpoints.items():
+            before = baseline["results"].get(mode, {}).get(name)
+            if not before:
+                continue
+
+            for metric in COMPARED:
+                if metric not in metrics or not before.get(metric):
+                    continue
+
+                change = metrics[metric] / before[metric] - 1
+                if change > threshold:
+                    regressions += 1
+                    print(f"REGRESSION [{mode}] {name} {metric}: "
+                          f"{before[metric]} -> {metrics[metric]} "
+                          f"(+{change:.0%})")
+
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True,
+            stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(),
+                                                     "diary-bench.db"))
+    parser.add_argument("--no-reseed", dest="reseed", action="store_false",
+                        help="Reuse the database from a previous run")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--diaries-per-user", type=int, default=2)
+    parser.add_argument("--entries-per-diary", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=["test-client", "wsgi", "both"],
+                        default="both")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to diff against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    app = build_app(args)
+    routes = collect_routes(app)
+
+    from main import db
+    with app.app_context():
+        counter = StatementCounter(db.engine)
+
+    token = app.test_client().post(
+        "/auth/login", json=WRITE_BODIES["POST /auth/login"]
+    ).json["access_token"]
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "date": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    if args.mode in ("test-client", "both"):
+        print("test client:")
+        report["results"]["test_client"] = bench_test_client(
+            app, routes, token, counter, args)
+
+    if args.mode in ("wsgi", "both"):
+        print(f"wsgi server ({args.concurrency} concurrent clients):")
+        report["results"]["wsgi"] = bench_wsgi(app, routes, token, counter,
+                                               args)
+
+    report["meta"]["process_peak_rss_kb"] = peak_rss_kb()
+    print(f"process peak RSS: {report['meta']['process_peak_rss_kb']} KiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    failures = 0
+    for mode, endpoints in report["results"].items():
+        for name, metrics in endpoints.items():
+            if not 200 <= metrics["status"] < 300:
+                failures += 1
+                print(f"UNEXPECTED STATUS [{mode}] {name}: "
+                      f"{metrics['status']}")
+            if metrics.get("not_modified") is False:
+                failures += 1
+                print(f"CONDITIONAL GET FAILED {name}: no 304 for its ETag")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        print(f"{regressions} regression(s) over {args.threshold:.0%}")
+        failures += regressions
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Check that every SQL statement the controllers issue is served by an index.
+
+Calls each blueprint route (GET, writes with a body, a second page through the
+Link header, then the deletes) against a freshly seeded SQLite database,
+captures the SELECT/UPDATE/DELETE statements they run and asks the database
+for their plans with EXPLAIN QUERY PLAN. Any full table scan fails the check
+(exit status 1), sorts done in a temporary B-tree are reported as warnings.
+So does a route answering 4xx/5xx, as it may stop before its queries run;
+the routes get valid ids and query strings from benchmarks.http_bench.
+
+    python -m benchmarks.query_plans
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+
+from benchmarks.http_bench import (URL_VALUES, WRITE_BODIES, build_app,
+                                   collect_routes)
+
+# Deletes run last, children first, so every one of them finds its row
+DELETE_ORDER = ("/entries/<int:entry_id>/tags/<int:tag_id>", "/likes/",
+                "/comments/", "/entries/", "/diaries/", "/tags/", "/users/")
+
+# Query strings for routes whose interesting path needs one
+EXTRA_URLS = ("/entries/search?q=entry", "/users/?limit=1", "/tags/?limit=1",
+              "/diaries/?limit=1", "/entries/diaries/1?limit=1",
+              "/comments/entries/2?limit=1", "/likes/entries/1?limit=1",
+              "/feed/public?limit=1", "/feed/public/tags/1?limit=1",
+              "/tags/suggest?prefix=tag", "/tags/stats?limit=5",
+              "/entries/tags?all=1&any=2,3&none=4&limit=1")
+
+# Tables listed in primary key order with nothing to filter on: the rowid
+# walk stops at the page LIMIT, so it is not a full scan in practice
+PAGED_BY_PRIMARY_KEY = {"users", "tags"}
+
+EXPLAINED = re.compile(r"^\s*(SELECT|UPDATE|DELETE)\b", re.IGNORECASE)
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def delete_routes(app):
+    routes = []
+
+    for rule in app.url_map.iter_rules():
+        if "DELETE" not in rule.methods:
+            continue
+
+        url = rule.rule
+        for argument in rule.arguments:
+            url = re.sub(rf"<[^>]*{argument}>", str(URL_VALUES[argument]),
+                         url)
+
+        order = next(i for i, prefix in enumerate(DELETE_ORDER)
+                     if rule.rule.startswith(prefix))
+        routes.append((order, f"DELETE {rule.rule}", url))
+
+    return [(name, "DELETE", url, None) for _, name, url in sorted(routes)]
+
+
+def capture(app, routes, token):
+    import sqlalchemy as sa
+    from main import db
+    from services.jobs import runner
+
+    statements = defaultdict(set)
+    current = []
+    errors = 0
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current and not executemany and EXPLAINED.match(statement):
+            statements[(statement, tuple(parameters or ()))].add(current[0])
+
+    with app.app_context():
+        engine = db.engine
+    sa.event.listen(engine, "before_cursor_execute", record)
+
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    try:
+        for name, method, url, body in routes:
+            current[:] = [name]
+            response = client.open(url, method=method, json=body,
+                                   headers=headers)
+
+            # follow the keyset cursor once so its predicate is checked too
+            link = response.headers.get("Link")
+            if link:
+                current[:] = [f"{name} (next page)"]
+                client.get(link[1:link.index(">")], headers=headers)
+
+            if response.status_code >= 400:
+                errors += 1
+                print(f"ERROR: {name} answered {response.status_code}")
+
+        # the background work queued by the routes, e.g. cascading deletes
+        current[:] = ["queued jobs"]
+        runner.drain(app)
+    finally:
+        current.clear()
+        sa.event.remove(engine, "before_cursor_execute", record)
+
+    return engine, statements, errors
+
+
+def explain(engine, statements):
+    failures = warnings = 0
+
+    with engine.connect() as connection:
+        for (statement, parameters), callers in sorted(statements.items()):
+            plan = [row[-1] for row in connection.exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + statement, parameters)]
+
+            problems = []
+            for step in plan:
+                scan = FULL_SCAN.match(step)
+                if scan and scan.group(1) not in PAGED_BY_PRIMARY_KEY:
+                    problems.append(("FULL SCAN", step))
+                elif "USE TEMP B-TREE" in step:
+                    problems.append(("warning", step))
+
+            for kind, step in problems:
+                if kind == "FULL SCAN":
+                    failures += 1
+                else:
+                    warnings += 1
+                print(f"{kind}: {step}\n  in {', '.join(sorted(callers))}\n"
+                      f"  {' '.join(statement.split())[:200]}")
+
+    return failures, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(),
+                                                     "diary-plans.db"))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--diaries-per-user", type=int, default=2)
+    parser.add_argument("--entries-per-diary", type=int, default=5)
+    args = parser.parse_args()
+    args.reseed = True
+    args.workers = 0
+    # queued jobs run in capture(), not on workers racing the routes
+    os.environ["JOB_WORKERS"] = "0"
+
+    app = build_app(args)
+
+    from main import db
+    with app.app_context():
+        if db.engine.dialect.name != "sqlite":
+            sys.exit("EXPLAIN QUERY PLAN checks need a SQLite database")
+
+    token = app.test_client().post(
+        "/auth/login", json=WRITE_BODIES["POST /auth/login"]
+    ).json["access_token"]
+
+    routes = collect_routes(app)
+    routes += [(f"GET {url}", "GET", url, None) for url in EXTRA_URLS]
+    routes += delete_routes(app)
+
+    engine, statements, errors = capture(app, routes, token)
+    failures, warnings = explain(engine, statements)
+
+    print(f"{len(statements)} statements from {len(routes)} calls: "
+          f"{failures} full scan(s), {errors} failed call(s), "
+          f"{warnings} warning(s)")
+    sys.exit(1 if failures or errors else 0)
+
+
+if __name__ == "__main__":
+    main()
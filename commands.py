@@ -1,9 +1,15 @@
-from flask import Blueprint
+import click
+from flask import Blueprint, current_app
 from datetime import datetime
 
-from main import db, bcrypt
+from main import db
 from models import User, Diary, Entry, Like, Comment, Tag
 from models.diaries import PrivacyOptions
+from services import counters, feed, jobs, migrations
+from services.passwords import passwords
+from services.response_cache import touch_all
+from services.seeding import make_plan, seed_bulk
+from services.search import rebuild_index
 
 db_commands = Blueprint("db", __name__)
 
@@ -11,25 +17,124 @@ db_commands = Blueprint("db", __name__)
 @db_commands.cli.command("create")
 def create_db():
     db.create_all()
+    # fresh tables already match the latest migration
+    migrations.stamp(db.engine)
     print("Tables are created")
 
 
 @db_commands.cli.command("drop")
 def drop_db():
     db.drop_all()
+    with db.engine.begin() as connection:
+        migrations.schema_migrations.drop(connection, checkfirst=True)
+    # ids are handed out again by the next create
+    touch_all()
     print("Tables are dropped")
 
 
+@db_commands.cli.command("upgrade")
+def upgrade_db():
+    # Bring an existing database up to the models, one migration at a time
+    applied = migrations.upgrade(db.engine)
+    if applied:
+        touch_all()
+    print(f"Applied {len(applied)} migration(s)" if applied
+          else "Database is up to date")
+
+
+def enqueue_job(kind):
+    job = jobs.enqueue(db.session, kind)
+    db.session.commit()
+    print(f"Queued job {job.id}, follow it at /jobs/{job.id}")
+
+
+@db_commands.cli.command("reindex-search")
+@click.option("--background", is_flag=True,
+              help="Queue a job for the app's workers instead")
+def reindex_search(background):
+    if background:
+        return enqueue_job("reindex_search")
+
+    with db.engine.begin() as connection:
+        rebuild_index(connection)
+    print("Search index rebuilt")
+
+
+@db_commands.cli.command("reconcile-counters")
+@click.option("--background", is_flag=True,
+              help="Queue a job for the app's workers, which reconciles "
+                   "in chunks")
+def reconcile_counters(background):
+    if background:
+        return enqueue_job("reconcile_counters")
+
+    with db.engine.begin() as connection:
+        repaired = counters.reconcile(connection)
+    if any(repaired.values()):
+        touch_all()
+    for column, count in repaired.items():
+        print(f"Repaired {column} on {count} entries")
+
+
+@db_commands.cli.command("run-jobs")
+def run_jobs():
+    # Run the queued jobs in this process, e.g. with JOB_WORKERS=0
+    ran = jobs.runner.drain(current_app)
+    print(f"Ran {ran} job(s)")
+
+
+@db_commands.cli.command("seed-bulk")
+@click.option("--users", default=1000, show_default=True)
+@click.option("--diaries-per-user", default=3, show_default=True)
+@click.option("--entries-per-diary", default=30, show_default=True)
+@click.option("--tags", default=500, show_default=True)
+@click.option("--max-likes", default=100, show_default=True,
+              help="Upper bound of the Zipf-distributed likes per entry")
+@click.option("--max-comments", default=20, show_default=True,
+              help="Upper bound of the Zipf-distributed comments per entry")
+@click.option("--max-tags-per-entry", default=4, show_default=True)
+@click.option("--public-ratio", default=0.3, show_default=True)
+@click.option("--days", default=365, show_default=True,
+              help="Time span the generated dates are spread over")
+@click.option("--batch-size", default=10000, show_default=True,
+              help="Rows per INSERT batch")
+@click.option("--workers", default=0, show_default=True,
+              help="Processes generating rows (0 = generate inline)")
+@click.option("--seed", default=1, show_default=True,
+              help="Random seed, the same seed gives the same data")
+def seed_bulk_db(users, diaries_per_user, entries_per_diary, tags, max_likes,
+                 max_comments, max_tags_per_entry, public_ratio, days,
+                 batch_size, workers, seed):
+    plan = make_plan(users, diaries_per_user, entries_per_diary, tags,
+                     max_likes, max_comments, max_tags_per_entry,
+                     public_ratio, days, seed)
+
+    # every generated user gets the password "password", hashed only once
+    totals = seed_bulk(db.engine, db.metadata, plan,
+                       passwords.hash("password"), workers=workers,
+                       batch_size=batch_size)
+
+    # Core inserts skip the ORM events that feed the search index and the
+    # public timeline
+    with db.engine.begin() as connection:
+        rebuild_index(connection)
+        feed.rebuild(connection)
+    touch_all()
+
+    print(f"Inserted {users} users, {tags} tags, " + ", ".join(
+        f"{count} {name}" for name, count in totals.items()))
+
+
 @db_commands.cli.command("seed")
 def seed_db():
     # create User objects
     user1 = User(
         email="user1@example.com",
-        password=bcrypt.generate_password_hash("password").decode("utf-8")
+        password=passwords.hash("password")
     )
     user2 = User(
         email="user2@example.com",
-        password=bcrypt.generate_password_hash("password").decode("utf-8")
+        password=passwords.hash("password")
     )
 
     # add all users object to db
@@ -1,6 +1,22 @@
 import os
 
 
+def engine_options(uri):
+    # Pool settings for server databases. SQLite keeps SQLAlchemy's own pool
+    # choice for its driver.
+    if uri.startswith("sqlite"):
+        return {}
+
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        # seconds before a connection is replaced, under server-side timeouts
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+    }
+
+
 class BaseConfig(object):
     @property
     def SQLALCHEMY_DATABASE_URI(self):
@@ -11,23 +27,266 @@ class BaseConfig(object):
 
         return db
 
+    @property
+    def SQLALCHEMY_ENGINE_OPTIONS(self):
+        return engine_options(self.SQLALCHEMY_DATABASE_URI)
+
+    @property
+    def SQLALCHEMY_BINDS(self):
+        # Optional read replica, used by the views marked with read_replica
+        replica = os.environ.get("DATABASE_REPLICA_URI")
+
+        if not replica:
+            return {}
+
+        return {"replica": {"url": replica, **engine_options(replica)}}
+
     @property
     def JWT_SECRET_KEY(self):
         secret_key = os.environ.get("JWT_SECRET")
 
         return secret_key or "super-secret"
 
+    @property
+    def BCRYPT_LOG_ROUNDS(self):
+        # bcrypt cost factor; login rehashes passwords stored with another
+        return int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+
+    @property
+    def PASSWORD_WORKERS(self):
+        # Processes hashing passwords (0 = hash on the request thread)
+        return int(os.environ.get("PASSWORD_WORKERS", os.cpu_count() or 1))
+
+    @property
+    def PASSWORD_QUEUE_SIZE(self):
+        # Hash requests allowed to wait for a worker before callers block
+        return int(os.environ.get("PASSWORD_QUEUE_SIZE", 32))
+
+    @property
+    def PASSWORD_QUEUE_TIMEOUT(self):
+        # Seconds a caller blocks on a full queue before getting a 503
+        return float(os.environ.get("PASSWORD_QUEUE_TIMEOUT", 5))
+
+    @property
+    def USER_CACHE_SIZE(self):
+        # Authenticated users kept in the per-process lookup cache
+        return int(os.environ.get("USER_CACHE_SIZE", 1024))
+
+    @property
+    def USER_CACHE_TTL(self):
+        # Seconds a cached user stays valid in other worker processes
+        return int(os.environ.get("USER_CACHE_TTL", 60))
+
+    @property
+    def QUERY_BUDGET(self):
+        # Max SQL statements a single request may issue (unset = no limit)
+        budget = os.environ.get("QUERY_BUDGET")
+
+        return int(budget) if budget else None
+
+    @property
+    def PAGE_DEFAULT_LIMIT(self):
+        return int(os.environ.get("PAGE_DEFAULT_LIMIT", 50))
+
+    @property
+    def PAGE_MAX_LIMIT(self):
+        return int(os.environ.get("PAGE_MAX_LIMIT", 200))
+
+    @property
+    def STREAM_BATCH_SIZE(self):
+        # Rows fetched per round trip when streaming NDJSON responses
+        return int(os.environ.get("STREAM_BATCH_SIZE", 500))
+
+    @property
+    def BATCH_MAX_ITEMS(self):
+        # Items accepted by a single batch request
+        return int(os.environ.get("BATCH_MAX_ITEMS", 500))
+
+    @property
+    def FEED_HOT_WINDOW(self):
+        # Newest keys of each feed kept in memory (0 = always read the table)
+        return int(os.environ.get("FEED_HOT_WINDOW", 1000))
+
+    @property
+    def FEED_HOT_TTL(self):
+        # Seconds a feed window is trusted; commits in this process drop it
+        # right away, other processes' commits show up after this long
+        return float(os.environ.get("FEED_HOT_TTL", 5))
+
+    @property
+    def FEED_HOT_FEEDS(self):
+        # Feeds (the public one and per tag) with a window in memory
+        return int(os.environ.get("FEED_HOT_FEEDS", 256))
+
+    @property
+    def TAG_INDEX_TTL(self):
+        # Seconds before the in-memory tag name index is reloaded, picking up
+        # tags written by other processes
+        return float(os.environ.get("TAG_INDEX_TTL", 60))
+
+    @property
+    def TAG_SUGGEST_LIMIT(self):
+        # Default number of GET /tags/suggest results
+        return int(os.environ.get("TAG_SUGGEST_LIMIT", 10))
+
+    @property
+    def TAG_POSTINGS_TTL(self):
+        # Seconds before the in-memory tag -> entries index is rebuilt,
+        # picking up entry tags written by other processes
+        return float(os.environ.get("TAG_POSTINGS_TTL", 300))
+
+    @property
+    def JOB_WORKERS(self):
+        # Background job workers per process (0 = only `flask db run-jobs`
+        # runs queued jobs)
+        return int(os.environ.get("JOB_WORKERS", 2))
+
+    @property
+    def JOB_POLL_INTERVAL(self):
+        # Seconds an idle worker waits before looking for jobs queued by
+        # other processes
+        return float(os.environ.get("JOB_POLL_INTERVAL", 1))
+
+    @property
+    def JOB_CHUNK_SIZE(self):
+        # Rows a job handles per transaction
+        return int(os.environ.get("JOB_CHUNK_SIZE", 500))
+
+    @property
+    def JOB_LEASE(self):
+        # Seconds without progress before another worker takes a running
+        # job over
+        return float(os.environ.get("JOB_LEASE", 300))
+
+    @property
+    def JOB_MAX_ATTEMPTS(self):
+        return int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+    @property
+    def JSON_PROVIDER(self):
+        # "orjson" encodes responses with orjson when it is installed,
+        # "json" keeps Flask's stdlib provider
+        return os.environ.get("JSON_PROVIDER", "orjson")
+
+    @property
+    def SQLITE_PRODUCTION(self):
+        # WAL, tuned pragmas and a single-writer path for SQLite databases
+        return os.environ.get("SQLITE_PRODUCTION", "0") == "1"
+
+    @property
+    def SQLITE_MMAP_SIZE(self):
+        # Bytes of the database file memory-mapped by each connection
+        return int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+    @property
+    def SQLITE_CACHE_SIZE(self):
+        # Page cache per connection; negative values are KiB
+        return int(os.environ.get("SQLITE_CACHE_SIZE", -64 * 1024))
+
+    @property
+    def SQLITE_BUSY_TIMEOUT(self):
+        # Milliseconds a connection waits for a lock held by another process
+        return int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+
+    @property
+    def SQLITE_WRITE_RETRIES(self):
+        # Retries of a write view that still found the database locked
+        return int(os.environ.get("SQLITE_WRITE_RETRIES", 3))
+
+    @property
+    def ASYNC_MODE(self):
+        # Async drivers (asyncpg, aiosqlite) under an ASGI server; set by
+        # asgi.py, the WSGI app and the CLI keep the sync drivers
+        return os.environ.get("ASYNC_MODE", "0") == "1"
+
+    @property
+    def ASYNC_OFFLOAD_BYTES(self):
+        # In ASYNC_MODE, bodies at least this large are compressed on the
+        # thread pool instead of the event loop
+        return int(os.environ.get("ASYNC_OFFLOAD_BYTES", 64 * 1024))
+
+    @property
+    def ASYNC_OFFLOAD_ITEMS(self):
+        # In ASYNC_MODE, lists at least this long are dumped, and batches
+        # loaded, on the thread pool instead of the event loop
+        return int(os.environ.get("ASYNC_OFFLOAD_ITEMS", 100))
+
+    @property
+    def FAST_STARTUP(self):
+        # Skip the schema checks at boot and register the controllers on the
+        # first request
+        return os.environ.get("FAST_STARTUP", "0") == "1"
+
+    @property
+    def RESPONSE_CACHE(self):
+        # Backend caching public GET responses: memory, filesystem or sqlite
+        # (unset = no caching)
+        return os.environ.get("RESPONSE_CACHE")
+
+    @property
+    def RESPONSE_CACHE_PATH(self):
+        # Directory (filesystem) or file (sqlite); defaults to the instance
+        # folder
+        return os.environ.get("RESPONSE_CACHE_PATH")
+
+    @property
+    def RESPONSE_CACHE_SIZE(self):
+        # Responses kept by the memory and sqlite backends
+        return int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+
+    @property
+    def INSTRUMENTATION(self):
+        # Server-Timing headers and GET /metrics (off unless set to 1)
+        return os.environ.get("INSTRUMENTATION", "0") == "1"
+
+    @property
+    def COMPRESSION(self):
+        # Negotiated gzip/br/zstd compression of JSON responses
+        return os.environ.get("COMPRESSION", "0") == "1"
+
+    @property
+    def COMPRESSION_ENCODINGS(self):
+        # Offered encodings, preferred first; br and zstd need the brotli
+        # and zstandard packages
+        return [encoding.strip() for encoding in os.environ.get(
+            "COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")]
+
+    @property
+    def COMPRESSION_LEVELS(self):
+        return {
+            "gzip": int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6)),
+            "br": int(os.environ.get("COMPRESSION_BR_LEVEL", 4)),
+            "zstd": int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3)),
+        }
+
+    @property
+    def COMPRESSION_MIN_SIZE(self):
+        # Bodies smaller than this (in bytes) are sent uncompressed
+        return int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
 
 
 class ProductionConfig(BaseConfig):
-    pass
+    @property
+    def SQLITE_PRODUCTION(self):
+        return os.environ.get("SQLITE_PRODUCTION", "1") == "1"
+
+    @property
+    def COMPRESSION(self):
+        return os.environ.get("COMPRESSION", "1") == "1"
 
 
 class TestConfig(BaseConfig):
-    pass
+    @property
+    def BCRYPT_LOG_ROUNDS(self):
+        return int(os.environ.get("BCRYPT_LOG_ROUNDS", 4))
+
+    @property
+    def QUERY_BUDGET(self):
+        return super().QUERY_BUDGET or 25
 
 
 env = os.environ.get("FLASK_ENV")
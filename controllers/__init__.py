@@ -5,6 +5,8 @@ from controllers.likes_controllers import likes
 from controllers.tags_controllers import tags
 from controllers.comments_controllers import comments
 from controllers.auth_controllers import auths
+from controllers.feed_controllers import feed
+from controllers.jobs_controllers import jobs
 
 registered_controllers = [
     users,
@@ -13,5 +15,7 @@ registered_controllers = [
     entries,
     likes,
     comments,
-    tags
+    tags,
+    feed,
+    jobs
 ]
\ No newline at end of file
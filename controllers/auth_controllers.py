@@ -1,11 +1,14 @@
+import sqlalchemy as sa
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import create_access_token
 from marshmallow import ValidationError
-from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.exc import IntegrityError, DataError, OperationalError
 
-from main import db, bcrypt
+from main import db
 from models.users import User
 from schemas.users import user_schema
+from services.passwords import PasswordServiceBusy, passwords
+from services.sqlite import is_locked, write_transaction, writing
 
 # /auth
 auths = Blueprint("auth", __name__, url_prefix="/auth")
@@ -31,23 +34,29 @@ def data_error_handler(e):
     return jsonify({"error": f"Data Error - `{e}`"}), 400
 
 
+@auths.errorhandler(PasswordServiceBusy)
+def password_service_busy_handler(e):
+    return jsonify({"error": f"Service busy - `{e}`"}), 503
+
+
 @auths.route("/register", methods=["POST"])
+@write_transaction
 def register_user():
     user_json = user_schema.load(request.json)
+    # Hashed before anything touches the database, so the write lock taken
+    # by the first query is not held while bcrypt runs
+    password_hash = passwords.hash(user_json["password"])
 
     user = User(
         **{
             "email": user_json["email"],
-            "password": (
-                bcrypt.generate_password_hash(user_json["password"])
-                .decode("utf")
-            )
+            "password": password_hash
         }
     )
     db.session.add(user)
     db.session.commit()
 
-    access_token = create_access_token(identity=user_json["email"])
+    access_token = create_access_token(identity=user.id)
 
     return jsonify(access_token=access_token)
 
@@ -61,9 +70,30 @@ def login_user():
     # email and get the first record found (None if no record found).
     user = db.session.query(User).filter_by(email=email).first()
 
-    if not user or not bcrypt.check_password_hash(user.password, password):
+    if not user or not passwords.check(user.password, password):
         return jsonify({"message": "Incorrect username and password!"}), 401
 
-    access_token = create_access_token(identity=request.json["email"])
+    user_id = user.id
+
+    # Upgrade hashes made with a different cost factor while we still have
+    # the plain-text password. Hashed before the write lock is taken, and
+    # written in a transaction of its own; a busy database leaves it for the
+    # next login.
+    if passwords.needs_rehash(user.password):
+        old_hash, new_hash = user.password, passwords.hash(password)
+        db.session.rollback()
+        try:
+            with writing():
+                db.session.execute(
+                    sa.update(User)
+                    .where(User.id == user_id, User.password == old_hash)
+                    .values(password=new_hash))
+                db.session.commit()
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_locked(e):
+                raise
+
+    access_token = create_access_token(identity=user_id)
 
     return jsonify(access_token=access_token)
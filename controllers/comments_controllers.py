@@ -1,18 +1,28 @@
 from datetime import datetime
 
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import current_user, jwt_required
 from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError
 
 from main import db
-from models import User, Entry
+from models import Entry
 from models.comments import Comment
 from schemas.comments import comment_schema, comments_schema
+from services.batch import (existing_ids, insert_comments, item_result,
+                            load_many)
+from services.loaders import eager
+from services.pagination import paginated_response
+from services.response_cache import cached
+from services.routing import read_replica
+from services.sqlite import write_transaction
 
 # Create a Blueprint for comments
 comments = Blueprint("comments", __name__, url_prefix="/comments")
 
+# Relationships serialized by CommentSchema
+COMMENT_GRAPH = eager(Comment, "user", "entry.diary.user")
+
 
 # Add your controller functions here
 @comments.errorhandler(KeyError)
@@ -37,6 +47,8 @@ def data_error_handler(e):
 
 # Add your controller functions here
 @comments.route("/entries/<int:entry_id>", methods=["GET"])
+@cached("entry:{entry_id}")
+@read_replica
 def get_comments(entry_id: int):
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
@@ -44,10 +56,10 @@ def get_comments(entry_id: int):
     if entry:
         # Query the "comments" table in the database for records with the given
         # entry ID and get all the records found (None if no record found).
-        all_comments = db.session.query(Comment).filter_by(
-            entry_id=entry_id).all()
-        result = comments_schema.dump(all_comments)
-        return jsonify(result)
+        all_comments = db.session.query(Comment).options(
+            *COMMENT_GRAPH).filter_by(entry_id=entry_id)
+        return paginated_response(all_comments, comments_schema,
+                                  Comment.date_created, Comment.id)
 
     return jsonify({"message": "Entry not found"}), 404
 
@@ -66,12 +78,11 @@ def get_comment(comment_id: int):
 
 
 @comments.route("/", methods=["POST"])
+@write_transaction
 @jwt_required()
 def create_comment():
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     comment_json = comment_schema.load(request.json)
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
@@ -90,13 +101,47 @@ def create_comment():
     return jsonify({"message": "Entry not found"}), 404
 
 
+@comments.route("/batch", methods=["POST"])
+@write_transaction
+@jwt_required()
+def create_comments():
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
+
+    # Every item is validated on its own; the response holds one result
+    # per item, in request order
+    items, errors = load_many(comments_schema, request.json)
+
+    # Entries referenced by the batch that exist, in one query
+    found = existing_ids(db.session, Entry.id,
+                         [item["entry_id"] for item in items if item])
+
+    results = []
+    accepted = []
+    for index, item in enumerate(items):
+        if item is None:
+            results.append(item_result(400, error=errors[index]))
+        elif item["entry_id"] not in found:
+            results.append(item_result(404, error="Entry not found"))
+        else:
+            results.append(None)
+            accepted.append((index, item))
+
+    comment_ids = insert_comments(db.session, user.id,
+                                  [item for _, item in accepted])
+    for (index, _), comment_id in zip(accepted, comment_ids):
+        results[index] = item_result(201, id=comment_id)
+
+    db.session.commit()
+    return jsonify(results)
+
+
 @comments.route("/<int:comment_id>", methods=["PUT"])
+@write_transaction
 @jwt_required()
 def update_comment(comment_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "comments" table in the database for a record with the given
     # id and get the record found (None if no record found).
     comment = Comment.query.get(comment_id)
@@ -119,12 +164,11 @@ def update_comment(comment_id: int):
 
 
 @comments.route("/<int:comment_id>", methods=["DELETE"])
+@write_transaction
 @jwt_required()
 def delete_comment(comment_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "comments" table in the database for a record with the given
     # id and get the record found (None if no record found).
     comment = Comment.query.get(comment_id)
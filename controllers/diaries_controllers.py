@@ -1,18 +1,25 @@
 from datetime import datetime
 
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import current_user, jwt_required
 from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError
 
+from controllers.jobs_controllers import accepted
 from main import db
-from models import User
 from models.diaries import Diary
 from schemas.diaries import diary_schema, diaries_schema
+from services import jobs
+from services.loaders import eager
+from services.pagination import paginated_response
+from services.sqlite import write_transaction
 
 # Create a Blueprint for diaries
 diaries = Blueprint("diaries", __name__, url_prefix="/diaries")
 
+# Relationships serialized by DiarySchema
+DIARY_GRAPH = eager(Diary, "entries", "user")
+
 
 @diaries.errorhandler(KeyError)
 def key_error_handler(e):
@@ -38,25 +45,22 @@ def data_error_handler(e):
 @diaries.route("/", methods=["GET"])
 @jwt_required()
 def get_diaries():
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
 
     # Query the "diaries" table in the database for records with the given
     # user ID and get all the records found (None if no record found).
-    all_diaries = db.session.query(Diary).filter_by(user_id=user.id).all()
-    result = diaries_schema.dump(all_diaries)
-    return jsonify(result)
+    all_diaries = db.session.query(Diary).options(*DIARY_GRAPH).filter_by(
+        user_id=user.id)
+    return paginated_response(all_diaries, diaries_schema,
+                              Diary.date_created, Diary.id)
 
 
 @diaries.route("/<int:diary_id>", methods=["GET"])
 @jwt_required()
 def get_diary(diary_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "diaries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     diary = Diary.query.get(diary_id)
@@ -74,12 +78,11 @@ def get_diary(diary_id: int):
 
 
 @diaries.route("/", methods=["POST"])
+@write_transaction
 @jwt_required()
 def create_diary():
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
 
     diary_json = diary_schema.load(request.json)
     diary = Diary(**diary_json)
@@ -93,12 +96,11 @@ def create_diary():
 
 
 @diaries.route("/<int:diary_id>", methods=["PUT"])
+@write_transaction
 @jwt_required()
 def update_diary(diary_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "diaries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     diary = Diary.query.get(diary_id)
@@ -122,21 +124,22 @@ def update_diary(diary_id: int):
 
 
 @diaries.route("/<int:diary_id>", methods=["DELETE"])
+@write_transaction
 @jwt_required()
 def delete_diary(diary_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "diaries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     diary = Diary.query.get(diary_id)
 
     if diary:
         if diary.user_id == user.id:
-            db.session.delete(diary)
+            # Its entries, comments and likes go in chunks, in the background
+            job = jobs.enqueue(db.session, "delete_diary", owner_id=user.id,
+                               diary_id=diary.id)
             db.session.commit()
-            return jsonify({"message": "Diary deleted successfully"})
+            return accepted(job)
 
         return (
             jsonify({"message": "User is not authorized to delete the diary"}),
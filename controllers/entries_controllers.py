@@ -1,19 +1,38 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 
+import sqlalchemy as sa
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import current_user, jwt_required
 from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError
 
 from main import db
-from models import Tag, User, Diary
+from models import Tag, Diary, EntryTag
 from models.diaries import PrivacyOptions
 from models.entries import Entry
 from schemas.entries import entry_schema, entries_schema
+from services import deletion
+from services.batch import (existing_ids, insert_entries, insert_entry_tags,
+                            item_result, load_ids, load_many)
+from services.loaders import eager
+from services.pagination import (decode_cursor, encode_cursor,
+                                 link_next_page, page_limit,
+                                 paginated_response)
+from services.search import search_entries
+from services.serializers import dump
+from services.streaming import stream_response, wants_stream
+from services.response_cache import cached
+from services.routing import read_replica
+from services.sqlite import write_transaction
+from services.tag_postings import tag_postings
 
 # Create a Blueprint for entries
 entries = Blueprint("entries", __name__, url_prefix="/entries")
 
+# Relationships serialized by EntrySchema
+ENTRY_GRAPH = eager(Entry, "diary.user", "tags", "comments.user", "likes.user")
+
 
 @entries.errorhandler(KeyError)
 def key_error_handler(e):
@@ -37,12 +56,11 @@ def data_error_handler(e):
 
 # Add your controller functions here
 @entries.route("/diaries/<int:diary_id>", methods=["GET"])
+@read_replica
 @jwt_required()
 def get_entries(diary_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "diaries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     diary = Diary.query.get(diary_id)
@@ -52,10 +70,10 @@ def get_entries(diary_id: int):
             # Query the "entries" table in the database for records with the
             # given diary ID and get all the records found
             # (None if no record found).
-            all_entries = db.session.query(Entry).filter_by(
-                diary_id=diary_id).all()
-            result = entries_schema.dump(all_entries)
-            return jsonify(result)
+            all_entries = db.session.query(Entry).options(
+                *ENTRY_GRAPH).filter_by(diary_id=diary_id)
+            return paginated_response(all_entries, entries_schema,
+                                      Entry.date_created, Entry.id)
 
         return (
             jsonify({"message": "User is not authorized to access the diary"}),
@@ -65,13 +83,49 @@ def get_entries(diary_id: int):
     return jsonify({"message": "Diary not found"}), 404
 
 
+def parse_date_arg(name, end_of_day=False):
+    value = request.args.get(name)
+
+    if not value:
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValidationError("Invalid date, expected YYYY-MM-DD", name)
+
+    # A bare date used as an upper bound includes the whole day
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+
+    return parsed
+
+
+@entries.route("/search", methods=["GET"])
+@jwt_required()
+def search():
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
+
+    # Search the user's own entries and entries in PUBLIC diaries, ranked by
+    # relevance to the keywords in `q`
+    found_entries = search_entries(
+        db.session.query(Entry).options(*ENTRY_GRAPH),
+        user,
+        terms=request.args.get("q"),
+        date_from=parse_date_arg("from"),
+        date_to=parse_date_arg("to", end_of_day=True),
+    ).limit(page_limit()).all()
+
+    result = dump(entries_schema, found_entries)
+    return jsonify(result)
+
+
 @entries.route("/<int:entry_id>", methods=["GET"])
 @jwt_required()
 def get_entry(entry_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     entry = Entry.query.get(entry_id)
@@ -89,12 +143,11 @@ def get_entry(entry_id: int):
 
 
 @entries.route("/", methods=["POST"])
+@write_transaction
 @jwt_required()
 def create_entry():
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
 
     entry_json = entry_schema.load(request.json)
     # Query the "diaries" table in the database for a record with the given
@@ -118,13 +171,52 @@ def create_entry():
     return jsonify({"message": "Diary not found"}), 404
 
 
+@entries.route("/batch", methods=["POST"])
+@write_transaction
+@jwt_required()
+def create_entries():
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
+
+    # Every item is validated on its own; the response holds one result
+    # per item, in request order
+    items, errors = load_many(entries_schema, request.json)
+
+    # Owners of all the diaries referenced by the batch, in one query
+    diary_ids = {item["diary_id"] for item in items if item}
+    owners = dict(
+        db.session.query(Diary.id, Diary.user_id)
+        .filter(Diary.id.in_(diary_ids))
+    ) if diary_ids else {}
+
+    results = []
+    accepted = []
+    for index, item in enumerate(items):
+        if item is None:
+            results.append(item_result(400, error=errors[index]))
+        elif item["diary_id"] not in owners:
+            results.append(item_result(404, error="Diary not found"))
+        elif owners[item["diary_id"]] != user.id:
+            results.append(item_result(
+                403, error="User is not authorized to create the entry"))
+        else:
+            results.append(None)
+            accepted.append((index, item))
+
+    entry_ids = insert_entries(db.session, [item for _, item in accepted])
+    for (index, _), entry_id in zip(accepted, entry_ids):
+        results[index] = item_result(201, id=entry_id)
+
+    db.session.commit()
+    return jsonify(results)
+
+
 @entries.route("/<int:entry_id>", methods=["PUT"])
+@write_transaction
 @jwt_required()
 def update_entry(entry_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     entry = Entry.query.get(entry_id)
@@ -146,19 +238,19 @@ def update_entry(entry_id: int):
 
 
 @entries.route("/<int:entry_id>", methods=["DELETE"])
+@write_transaction
 @jwt_required()
 def delete_entry(entry_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     entry = Entry.query.get(entry_id)
 
     if entry:
         if entry.diary.user_id == user.id:
-            db.session.delete(entry)
+            # Comments, likes and tags go with one statement each
+            deletion.delete_entries(db.session, [entry.id])
             db.session.commit()
             return jsonify({"message": "Entry deleted successfully"})
 
@@ -171,12 +263,11 @@ def delete_entry(entry_id: int):
 
 
 @entries.route("/<int:entry_id>/tags/<int:tag_id>", methods=["PUT"])
+@write_transaction
 @jwt_required()
 def add_tag(entry_id: int, tag_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     entry = Entry.query.get(entry_id)
@@ -202,19 +293,60 @@ def add_tag(entry_id: int, tag_id: int):
         return (jsonify({"message": "The tag already exists on this entry"}),
                 409)
 
-    entry.tags.append(tag)
     db.session.commit()
     result = entry_schema.dump(entry)
     return jsonify(result)
 
 
+@entries.route("/<int:entry_id>/tags", methods=["POST"])
+@write_transaction
+@jwt_required()
+def add_tags(entry_id: int):
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
+    # Query the "entries" table in the database for a record with the given
+    # id and get the record found (None if no record found).
+    entry = Entry.query.get(entry_id)
+
+    if not entry:
+        return jsonify({"message": "Entry not found"}), 404
+
+    if entry.diary.user_id != user.id:
+        return (
+            jsonify({"message": "User is not authorized to update the entry"}),
+            403  # Forbidden
+        )
+
+    tag_ids = load_ids(request.json, "tag_ids")
+
+    # Tags that exist and tags already on the entry, one query each
+    found = existing_ids(db.session, Tag.id, tag_ids)
+    present = {tag.id for tag in entry.tags}
+
+    results = []
+    added = []
+    for tag_id in tag_ids:
+        if tag_id not in found:
+            results.append(item_result(404, error="Tag not found"))
+        elif tag_id in present:
+            results.append(item_result(
+                409, error="The tag already exists on this entry"))
+        else:
+            results.append(item_result(201, id=tag_id))
+            present.add(tag_id)
+            added.append(tag_id)
+
+    insert_entry_tags(db.session, entry_id, added)
+    db.session.commit()
+    return jsonify(results)
+
+
 @entries.route("/<int:entry_id>/tags/<int:tag_id>", methods=["DELETE"])
+@write_transaction
 @jwt_required()
 def remove_tag(entry_id: int, tag_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     entry = Entry.query.get(entry_id)
@@ -240,24 +372,94 @@ def remove_tag(entry_id: int, tag_id: int):
         return (jsonify({"message": "The tag does not exists on this entry"}),
                 400)
 
-    entry.tags.remove(tag)
     db.session.commit()
     result = entry_schema.dump(entry)
     return jsonify(result)
 
 
+def parse_id_list(name):
+    # "1,2,3" -> {1, 2, 3}
+    try:
+        return {int(value) for value in
+                request.args.get(name, "").split(",") if value.strip()}
+    except ValueError:
+        raise ValidationError("Expected comma separated ids", name)
+
+
+@entries.route("/tags", methods=["GET"])
+@read_replica
+def get_entries_by_tags():
+    # Entries of PUBLIC diaries carrying every tag of `all`, at least one of
+    # `any` and none of `none`, in id order. The tag posting lists pick the
+    # candidates; the database only sees the ids of one page.
+    all_of, any_of = parse_id_list("all"), parse_id_list("any")
+    none_of = parse_id_list("none")
+    if not (all_of or any_of):
+        raise ValidationError("Pass tag ids in `all` or `any`", "all")
+
+    cursor = request.args.get("cursor")
+    after = decode_cursor(cursor, [Entry.id])[0] if cursor else 0
+    limit = page_limit()
+
+    matches = tag_postings().matches(db.session, all_of, any_of, none_of,
+                                     after)
+
+    # Keep the public candidates, asking for twice as many each round in
+    # case most of them are private
+    ids, wanted = [], limit + 1
+    while len(ids) <= limit:
+        chunk = list(islice(matches, wanted))
+        if not chunk:
+            break
+        # sorted here: the chunk is a handful of ids, not worth a B-tree
+        ids += sorted(db.session.execute(
+            sa.select(Entry.id).join(Entry.diary)
+            .filter(Entry.id.in_(chunk),
+                    Diary.privacy == PrivacyOptions.PUBLIC)
+        ).scalars())
+        wanted *= 2
+
+    page_ids = ids[:limit]
+    found = db.session.query(Entry).options(*ENTRY_GRAPH) \
+        .filter(Entry.id.in_(page_ids)).order_by(Entry.id).all() \
+        if page_ids else []
+
+    def wanted_tags(entry):
+        # the index may lag other processes: the loaded tags decide
+        tag_ids = {tag.id for tag in entry.tags}
+        return all_of <= tag_ids and (not any_of or any_of & tag_ids) \
+            and not none_of & tag_ids
+
+    response = jsonify(dump(entries_schema,
+                            [entry for entry in found if wanted_tags(entry)]))
+    return link_next_page(response, encode_cursor(page_ids[-1:])
+                          if len(ids) > limit else None)
+
+
 @entries.route("/tags/<int:tag_id>", methods=["GET"])
+@cached("tag:{tag_id}")
+@read_replica
 def get_entries_by_tag(tag_id: int):
     # Query the "tags" table in the database for a record with the given
     # id and get the record found (None if no record found).
     tag = Tag.query.get(tag_id)
 
     if tag:
-        #  Filter out all the entries belonging to PRIVATE diaries
-        all_public_entries = [entry for entry in tag.entries if
-                              entry.diary.privacy == PrivacyOptions.PUBLIC]
+        #  Filter out all the entries belonging to PRIVATE diaries. The
+        #  (tag_id, entry_id) index yields the tag's entries in id order.
+        all_public_entries = (
+            db.session.query(Entry).options(*ENTRY_GRAPH)
+            .join(EntryTag, EntryTag.entry_id == Entry.id)
+            .join(Entry.diary)
+            .filter(EntryTag.tag_id == tag_id,
+                    Diary.privacy == PrivacyOptions.PUBLIC)
+            .order_by(EntryTag.entry_id)
+        )
+
+        if wants_stream():
+            return stream_response(all_public_entries, entry_schema)
 
-        result = entries_schema.dump(all_public_entries)
+        result = dump(entries_schema, all_public_entries.all())
         return jsonify(result)
 
     return jsonify({"message": "Tag not found"}), 404
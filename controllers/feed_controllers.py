@@ -0,0 +1,62 @@
+from flask import Blueprint, jsonify, request
+from marshmallow import ValidationError
+
+from controllers.entries_controllers import ENTRY_GRAPH
+from main import db
+from models import FeedItem, Tag
+from models.entries import Entry
+from schemas.entries import entries_schema
+from services import feed as timeline
+from services.pagination import (decode_cursor, encode_cursor,
+                                 link_next_page, page_limit)
+from services.routing import read_replica
+from services.serializers import dump
+
+# /feed
+feed = Blueprint("feed", __name__, url_prefix="/feed")
+
+# Cursor keys of the feeds, newest first
+FEED_KEYS = (FeedItem.date_created, FeedItem.entry_id)
+
+
+@feed.errorhandler(ValidationError)
+def validation_error_handler(e):
+    return jsonify({"error": f"Validation error - `{e}`"}), 400
+
+
+def feed_response(tag_id):
+    # One page of a feed: keys from services.feed, then the entries by
+    # primary key, put back in feed order
+    cursor = request.args.get("cursor")
+    cursor = tuple(decode_cursor(cursor, FEED_KEYS)) if cursor else None
+
+    keys, has_more = timeline.page_keys(db.session, tag_id, cursor,
+                                        page_limit())
+    ids = [entry_id for _, entry_id in keys]
+
+    by_id = {entry.id: entry for entry in
+             db.session.query(Entry).options(*ENTRY_GRAPH)
+             .filter(Entry.id.in_(ids))} if ids else {}
+    # an entry deleted since the keys were read is simply left out
+    page = [by_id[entry_id] for entry_id in ids if entry_id in by_id]
+
+    response = jsonify(dump(entries_schema, page))
+    return link_next_page(response,
+                          encode_cursor(keys[-1]) if has_more else None)
+
+
+@feed.route("/public", methods=["GET"])
+@read_replica
+def get_public_feed():
+    # Newest entries of every PUBLIC diary
+    return feed_response(None)
+
+
+@feed.route("/public/tags/<int:tag_id>", methods=["GET"])
+@read_replica
+def get_public_tag_feed(tag_id: int):
+    # Newest entries of PUBLIC diaries carrying the tag
+    if Tag.query.get(tag_id) is None:
+        return jsonify({"message": "Tag not found"}), 404
+
+    return feed_response(tag_id)
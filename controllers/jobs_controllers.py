@@ -0,0 +1,38 @@
+from flask import Blueprint, jsonify, url_for
+from flask_jwt_extended import get_current_user, jwt_required
+
+from main import db
+from models.jobs import Job
+from schemas.jobs import job_schema
+
+# /jobs
+jobs = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+
+def accepted(job):
+    # 202 for a request whose work was queued as `job`, pointing at its
+    # status. `job` must have been committed, to have an id.
+    response = jsonify(job_schema.dump(job))
+    response.status_code = 202  # Accepted
+    response.headers["Location"] = url_for("jobs.get_job", job_id=job.id)
+    return response
+
+
+@jobs.route("/<int:job_id>", methods=["GET"])
+@jwt_required(optional=True)
+def get_job(job_id: int):
+    # None without a JWT
+    user = get_current_user()
+    job = db.session.get(Job, job_id)
+
+    if job:
+        # Jobs queued on behalf of a user are only shown to them
+        if job.owner_id is None or (user is not None
+                                    and job.owner_id == user.id):
+            return jsonify(job_schema.dump(job))
+        return (
+            jsonify({"message": "User is not authorized to view the job"}),
+            403  # Forbidden
+        )
+
+    return jsonify({"message": "Job not found"}), 404
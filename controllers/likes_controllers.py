@@ -1,17 +1,28 @@
 from datetime import datetime
 
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import current_user, jwt_required
+from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError
 
 from main import db
-from models import User, Entry
+from models import Entry
 from models.likes import Like
 from schemas.likes import like_schema, likes_schema
+from services.batch import (existing_ids, insert_likes, item_result,
+                            load_many)
+from services.loaders import eager
+from services.pagination import paginated_response
+from services.response_cache import cached
+from services.routing import read_replica
+from services.sqlite import write_transaction
 
 # Create a Blueprint for likes
 likes = Blueprint("likes", __name__, url_prefix="/likes")
 
+# Relationships serialized by LikeSchema
+LIKE_GRAPH = eager(Like, "user", "entry.diary.user")
+
 
 # Add your controller functions here
 
@@ -20,6 +31,11 @@ def key_error_handler(e):
     return jsonify({"error": f"Key Error - `{e}`"}), 400
 
 
+@likes.errorhandler(ValidationError)
+def validation_error_handler(e):
+    return jsonify({"error": f"Validation error - `{e}`"}), 400
+
+
 @likes.errorhandler(IntegrityError)
 def integrity_error_handler(e):
     return jsonify({"error": f"Integrity Error - `{e}`"}), 400
@@ -32,6 +48,8 @@ def data_error_handler(e):
 
 # Add your controller functions here
 @likes.route("/entries/<int:entry_id>", methods=["GET"])
+@cached("entry:{entry_id}")
+@read_replica
 def get_likes(entry_id: int):
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
@@ -39,9 +57,10 @@ def get_likes(entry_id: int):
     if entry:
         # Query the "likes" table in the database for records with the given
         # entry ID and get all the records found (None if no record found).
-        all_likes = db.session.query(Like).filter_by(entry_id=entry_id).all()
-        result = likes_schema.dump(all_likes)
-        return jsonify(result)
+        all_likes = db.session.query(Like).options(*LIKE_GRAPH).filter_by(
+            entry_id=entry_id)
+        return paginated_response(all_likes, likes_schema,
+                                  Like.date_created, Like.id)
 
     return jsonify({"message": "Entry not found"}), 404
 
@@ -60,29 +79,31 @@ def get_like(like_id: int):
 
 
 @likes.route("/", methods=["POST"])
+@write_transaction
 @jwt_required()
 def create_like():
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     like_json = like_schema.load(request.json)
     # Query the "entries" table in the database for a record with the given
     # id and get the record found (None if no record found).
     entry = Entry.query.get(like_json['entry_id'])
 
     if entry:
-        #  Check if the user has already liked the entry
-        if any([like.user_id == user.id for like in entry.likes]):
-            return (
-                jsonify({"message": "The user has already liked this entry."}),
-                409  # Conflict
-            )
         like = Like(**like_json)
         like.user_id = user.id
         like.date_created = datetime.utcnow()
         db.session.add(like)
-        db.session.commit()
+
+        #  The unique (user_id, entry_id) constraint rejects a second like
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return (
+                jsonify({"message": "The user has already liked this entry."}),
+                409  # Conflict
+            )
 
         result = like_schema.dump(like)
         return jsonify(result), 201
@@ -90,13 +111,57 @@ def create_like():
     return jsonify({"message": "Entry not found"}), 404
 
 
+@likes.route("/batch", methods=["POST"])
+@write_transaction
+@jwt_required()
+def create_likes():
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
+
+    # Every item is validated on its own; the response holds one result
+    # per item, in request order
+    items, errors = load_many(likes_schema, request.json)
+    entry_ids = {item["entry_id"] for item in items if item}
+
+    # Entries referenced by the batch that exist, and the ones the user
+    # already liked, one query each
+    found = existing_ids(db.session, Entry.id, entry_ids)
+    liked = {
+        like.entry_id for like in
+        db.session.query(Like.entry_id)
+        .filter(Like.user_id == user.id, Like.entry_id.in_(entry_ids))
+    } if entry_ids else set()
+
+    results = []
+    accepted = []
+    for index, item in enumerate(items):
+        if item is None:
+            results.append(item_result(400, error=errors[index]))
+        elif item["entry_id"] not in found:
+            results.append(item_result(404, error="Entry not found"))
+        elif item["entry_id"] in liked:
+            results.append(item_result(
+                409, error="The user has already liked this entry."))
+        else:
+            results.append(None)
+            liked.add(item["entry_id"])
+            accepted.append((index, item))
+
+    like_ids = insert_likes(db.session, user.id,
+                            [item for _, item in accepted])
+    for (index, _), like_id in zip(accepted, like_ids):
+        results[index] = item_result(201, id=like_id)
+
+    db.session.commit()
+    return jsonify(results)
+
+
 @likes.route("/<int:like_id>", methods=["DELETE"])
+@write_transaction
 @jwt_required()
 def delete_like(like_id: int):
-    email = get_jwt_identity()
-    # Query the "users" table in the database for a record with the given
-    # email and get the first record found (None if no record found).
-    user = db.session.query(User).filter_by(email=email).first()
+    # The user the JWT was issued to, resolved once per request
+    user = current_user
     # Query the "likes" table in the database for a record with the given
     # id and get the record found (None if no record found).
     like = Like.query.get(like_id)
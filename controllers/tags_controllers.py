@@ -1,14 +1,25 @@
-from flask import Blueprint, jsonify, request
+import sqlalchemy as sa
+from flask import Blueprint, current_app, jsonify, request
 from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError
 
 from main import db
+from models.tag_stats import TagStat
 from models.tags import Tag
 from schemas.tags import tag_schema, tags_schema
+from services.loaders import eager
+from services.pagination import page_limit, paginated_response
+from services.response_cache import cached
+from services.routing import read_replica
+from services.sqlite import write_transaction
+from services.tag_index import tag_index
 
 # /tags
 tags = Blueprint("tags", __name__, url_prefix="/tags")
 
+# Relationships serialized by TagSchema
+TAG_GRAPH = eager(Tag, "entries.diary.user")
+
 
 @tags.errorhandler(KeyError)
 def key_error_handler(e):
@@ -32,15 +43,54 @@ def data_error_handler(e):
 
 # Add your controller functions here
 @tags.route("/", methods=["GET"])
+@cached("tags")
+@read_replica
 def get_tags():
     # Query the "tags" table in the database and get all the records found
     # (None if no record found).
-    all_tags = Tag.query.all()
-    result = tags_schema.dump(all_tags)
-    return jsonify(result)
+    all_tags = Tag.query.options(*TAG_GRAPH)
+    return paginated_response(all_tags, tags_schema, Tag.id)
+
+
+@tags.route("/suggest", methods=["GET"])
+def suggest_tags():
+    # Tags whose name starts with `prefix` (any case), from the in-memory
+    # index: no query unless the index is due for a reload
+    prefix = request.args.get("prefix", "")
+    limit = request.args.get("limit", type=int) or \
+        current_app.config["TAG_SUGGEST_LIMIT"]
+    limit = max(1, min(limit, current_app.config["PAGE_MAX_LIMIT"]))
+
+    found = tag_index().suggest(db.session, prefix, limit)
+    return jsonify([{"id": tag_id, "name": name} for tag_id, name in found])
+
+
+@tags.route("/stats", methods=["GET"])
+@cached("tags")
+@read_replica
+def get_tag_stats():
+    # Tags with the most entries in PUBLIC diaries, from the totals kept in
+    # tag_stats
+    rows = db.session.execute(
+        sa.select(Tag.id, Tag.name, TagStat.public_entries)
+        .join(Tag, Tag.id == TagStat.tag_id)
+        .order_by(TagStat.public_entries.desc(), TagStat.tag_id.desc())
+        .limit(page_limit())
+    )
+    return jsonify([{"id": tag_id, "name": name, "public_entries": count}
+                    for tag_id, name, count in rows])
+
+
+def name_taken(name, tag_id=None):
+    # Whether another tag already has `name`. The index answers misses; a
+    # hit is confirmed by primary key, in case it was deleted elsewhere.
+    found = tag_index().find(db.session, name)
+    return found is not None and found != tag_id and \
+        Tag.query.get(found) is not None
 
 
 @tags.route("/<int:tag_id>", methods=["GET"])
+@cached("tag:{tag_id}")
 def get_tag(tag_id: int):
     # Query the "tags" table in the database for a record with the given
     # id and get the record found (None if no record found).
@@ -54,8 +104,12 @@ def get_tag(tag_id: int):
 
 
 @tags.route("/", methods=["POST"])
+@write_transaction
 def create_tag():
     tag_json = tag_schema.load(request.json)
+    if name_taken(tag_json["name"]):
+        return jsonify({"message": "Tag already exists"}), 409
+
     tag = Tag(**tag_json)
     db.session.add(tag)
     db.session.commit()
@@ -65,6 +119,7 @@ def create_tag():
 
 
 @tags.route("/<int:tag_id>", methods=["PUT"])
+@write_transaction
 def update_tag(tag_id: int):
     # Query the "tags" table in the database for a record with the given
     # id and get the record found (None if no record found).
@@ -72,6 +127,9 @@ def update_tag(tag_id: int):
 
     if tag:
         tag_data = tag_schema.load(request.json)
+        if name_taken(tag_data['name'], tag_id):
+            return jsonify({"message": "Tag already exists"}), 409
+
         tag.name = tag_data['name']
         db.session.commit()
         result = tag_schema.dump(tag)
@@ -81,6 +139,7 @@ def update_tag(tag_id: int):
 
 
 @tags.route("/<int:tag_id>", methods=["DELETE"])
+@write_transaction
 def delete_tag(tag_id: int):
     # Query the "tags" table in the database for a record with the given
     # id and get the record found (None if no record found).
@@ -2,13 +2,24 @@ from flask import Blueprint, jsonify, request
 from marshmallow.exceptions import ValidationError
 from sqlalchemy.exc import IntegrityError, DataError
 
-from main import db, bcrypt
+from controllers.jobs_controllers import accepted
+from main import db
 from models.users import User
 from schemas.users import user_schema, users_schema
+from services import jobs
+from services.identity import forget_user
+from services.loaders import eager
+from services.passwords import PasswordServiceBusy, passwords
+from services.pagination import paginated_response
+from services.streaming import stream_response, wants_stream
+from services.sqlite import write_transaction
 
 # /users
 users = Blueprint("users", __name__, url_prefix="/users")
 
+# Relationships serialized by UserSchema
+USER_GRAPH = eager(User, "diaries", "comments", "likes")
+
 
 @users.errorhandler(KeyError)
 def key_error_handler(e):
@@ -30,14 +41,22 @@ def data_error_handler(e):
     return jsonify({"error": f"Data Error - `{e}`"}), 400
 
 
+@users.errorhandler(PasswordServiceBusy)
+def password_service_busy_handler(e):
+    return jsonify({"error": f"Service busy - `{e}`"}), 503
+
+
 # GET all users
 @users.route("/", methods=["GET"])
 def get_users():
     # Query the "users" table in the database get all records found (None if no
     # record found).
-    all_users = User.query.all()
-    result = users_schema.dump(all_users)
-    return jsonify(result)
+    all_users = User.query.options(*USER_GRAPH)
+
+    if wants_stream():
+        return stream_response(all_users.order_by(User.id), user_schema)
+
+    return paginated_response(all_users, users_schema, User.id)
 
 
 # GET a single user by ID
@@ -56,13 +75,12 @@ def get_user(user_id):
 
 # CREATE a new user
 @users.route("/", methods=["POST"])
+@write_transaction
 def create_user():
     try:
         user = user_schema.load(request.json)
 
-        password_hash = (
-            bcrypt.generate_password_hash(user["password"]).decode("utf")
-        )
+        password_hash = passwords.hash(user["password"])
         user = User(**user)
         user.password = password_hash
         db.session.add(user)
@@ -76,17 +94,21 @@ def create_user():
 
 # UPDATE a user by ID
 @users.route("/<int:user_id>", methods=["PUT"])
+@write_transaction
 def update_user(user_id):
+    # Hash before the first query, which takes the write lock: bcrypt must
+    # not hold up the other writers
+    user_data = user_schema.load(request.json)
+    password_hash = passwords.hash(user_data["password"])
+
     # Query the "users" table in the database for a record with the given
     # id and get the record found (None if no record found).
     user = User.query.get(user_id)
 
     if user:
-        user_data = user_schema.load(request.json)
+        forget_user(user)
         user.email = user_data["email"]
-        user.password = (
-            bcrypt.generate_password_hash(user_data["password"]).decode("utf")
-        )
+        user.password = password_hash
         db.session.commit()
         result = user_schema.dump(user)
         return jsonify(result)
@@ -96,14 +118,17 @@ def update_user(user_id):
 
 # DELETE a user by ID
 @users.route("/<int:user_id>", methods=["DELETE"])
+@write_transaction
 def delete_user(user_id):
     # Query the "users" table in the database for a record with the given
     # id and get the record found (None if no record found).
     user = User.query.get(user_id)
 
     if user:
-        db.session.delete(user)
+        # Its diaries, entries, comments and likes go in chunks, in the
+        # background
+        job = jobs.enqueue(db.session, "delete_user", user_id=user.id)
         db.session.commit()
-        return jsonify({"message": "User deleted successfully"})
+        return accepted(job)
 
     return jsonify({"message": "User not found"}), 404
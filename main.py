@@ -1,15 +1,14 @@
 import os
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from config import app_config
 import sqlalchemy as sa
+from services.async_mode import AsyncAwareSQLAlchemy
+from services.routing import RoutingSession
 
 # Create instances of Flask extensions
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+db = AsyncAwareSQLAlchemy(session_options={"class_": RoutingSession})
 ma = Marshmallow()
 
 
@@ -25,9 +24,25 @@ def init_app():
     app.config.from_object("config.app_config")
     jwt = JWTManager(app)
 
+    # encode responses to bytes with orjson, when it is installed
+    from services.json_provider import init_json_provider
+    init_json_provider(app)
+
+    # hash passwords off the request thread
+    from services.passwords import passwords
+    passwords.init_app(app)
+
     # connect to DB
     db.init_app(app)
 
+    # send reads of replica-safe views to the replica, when one is set
+    from services.routing import init_routing
+    init_routing(app)
+
+    # WAL and a single-writer path when running on SQLite
+    from services.sqlite import init_sqlite
+    init_sqlite(app)
+
     # connect to schemas
     ma.init_app(app)
 
@@ -35,24 +50,89 @@ def init_app():
     from commands import db_commands
     app.register_blueprint(db_commands)
 
-    # connect blueprint controllers
-    from controllers import registered_controllers
+    # connect blueprint controllers, now or on the first request
+    from services.startup import defer_controllers, register_controllers
+
+    if app.config["FAST_STARTUP"]:
+        defer_controllers(app)
+    else:
+        register_controllers(app)
+
+    # resolve flask_jwt_extended.current_user through the user cache
+    from services.identity import init_user_loader
+    init_user_loader(app, jwt)
+
+    # fail requests that go over the configured SQL statement budget
+    from services.loaders import init_query_budget
+    init_query_budget(app)
+
+    # keep the entry full-text index in sync with the entries table
+    from services.search import init_search_index
+    init_search_index(app)
+
+    # keep the like/comment counters on entries in step with their rows
+    from services.counters import init_counters
+    init_counters(app)
+
+    # keep the public feed timeline in step with entries and diaries
+    from services.feed import init_feed
+    init_feed(app)
 
-    for controller in registered_controllers:
-        app.register_blueprint(controller)
+    # in-memory tag name index behind GET /tags/suggest
+    from services.tag_index import init_tag_index, warm_tag_index
+    init_tag_index(app)
 
-    #  create db engine
-    db_engine = sa.create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-    db_inspector = sa.inspect(db_engine)
+    # in-memory tag -> entries posting lists behind GET /entries/tags
+    from services.tag_postings import init_tag_postings, warm_tag_postings
+    init_tag_postings(app)
 
-    if not db_inspector.has_table("users"):
+    # durable background jobs, run by workers started on the first request
+    from services.jobs import init_jobs
+    init_jobs(app)
+
+    # opt-in cache of public GET responses, invalidated on commit
+    from services.response_cache import init_response_cache
+    init_response_cache(app)
+
+    # negotiated compression of JSON responses
+    from services.compression import init_compression
+    init_compression(app)
+
+    # opt-in Server-Timing headers and Prometheus metrics
+    from services.instrumentation import init_instrumentation
+    init_instrumentation(app)
+
+    # in fast startup the schema is only managed by `flask db create` and
+    # `flask db upgrade`, so booting never touches the database
+    if app.config["FAST_STARTUP"]:
+        return app
+
+    from services import migrations
+
+    # inspect through the app's own (pooled) primary engine
+    with app.app_context():
+        has_schema = sa.inspect(db.engine).has_table("users")
+
+    if not has_schema:
         with app.app_context():
             # delete all the database tables
             # db.drop_all()
             # create the tables for all the defined models
             db.create_all()
+            # they already match the latest migration
+            migrations.stamp(db.engine)
             app.logger.info("New database initialized!")
     else:
         app.logger.info("Database already exists!")
 
+        with app.app_context():
+            outdated = migrations.pending(db.engine)
+        if outdated:
+            app.logger.warning(
+                "Database schema is behind, run `flask db upgrade` to apply: "
+                + ", ".join(version for version, _ in outdated))
+
+    warm_tag_index(app)
+    warm_tag_postings(app)
+
     return app
@@ -0,0 +1,9 @@
+# A user can like an entry only once: drop repeated likes, then enforce it
+from models import Like
+from services.migrations import create_index, delete_duplicates
+
+
+def upgrade(connection):
+    delete_duplicates(connection, Like.__table__, ["user_id", "entry_id"])
+    create_index(connection, "likes", "uq_likes_user_entry",
+                 ["user_id", "entry_id"], unique=True)
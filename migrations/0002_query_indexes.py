@@ -0,0 +1,16 @@
+# Indexes matching the controllers' lookups: foreign keys followed by the
+# (date_created, id) keyset the list endpoints page over, and the
+# entry_tags pair in both directions. Built online on Postgres.
+from models import Comment, Diary, Entry, EntryTag, Like
+from services.migrations import create_model_index, delete_duplicates
+
+TRANSACTIONAL = False
+
+
+def upgrade(connection):
+    # The add-tag endpoint used to insert the same pair twice
+    delete_duplicates(connection, EntryTag.__table__, ["entry_id", "tag_id"])
+
+    for model in (Diary, Entry, Comment, Like, EntryTag):
+        for index in sorted(model.__table__.indexes, key=lambda i: i.name):
+            create_model_index(connection, index)
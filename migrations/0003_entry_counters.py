@@ -0,0 +1,15 @@
+# Denormalized like/comment counters on entries, backfilled from their rows
+from services import counters
+from services.migrations import has_column
+
+
+def upgrade(connection):
+    for column in ("like_count", "comment_count"):
+        if not has_column(connection, "entries", column):
+            connection.exec_driver_sql(
+                f"ALTER TABLE entries ADD COLUMN {column} "
+                f"INTEGER NOT NULL DEFAULT 0"
+            )
+
+    # Cheap now that 0002 indexed likes and comments by entry_id
+    counters.reconcile(connection)
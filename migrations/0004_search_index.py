@@ -0,0 +1,6 @@
+# Full-text index over entry content (FTS5 table on SQLite, GIN on Postgres)
+from services.search import rebuild_index
+
+
+def upgrade(connection):
+    rebuild_index(connection)
@@ -0,0 +1,8 @@
+# Materialized public timeline (services.feed), filled from existing entries
+from models import FeedItem
+from services import feed
+
+
+def upgrade(connection):
+    FeedItem.__table__.create(connection, checkfirst=True)
+    feed.rebuild(connection)
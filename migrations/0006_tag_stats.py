@@ -0,0 +1,8 @@
+# Per-tag public entry totals (services.tag_stats), counted from feed_items
+from models import TagStat
+from services import tag_stats
+
+
+def upgrade(connection):
+    TagStat.__table__.create(connection, checkfirst=True)
+    tag_stats.rebuild(connection)
@@ -0,0 +1,6 @@
+# Durable background job queue (services.jobs)
+from models import Job
+
+
+def upgrade(connection):
+    Job.__table__.create(connection, checkfirst=True)
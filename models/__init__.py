@@ -2,6 +2,9 @@ from models.comments import Comment
 from models.diaries import Diary
 from models.entries import Entry
 from models.entrytags import EntryTag
+from models.feed import FeedItem
+from models.jobs import Job
 from models.likes import Like
+from models.tag_stats import TagStat
 from models.tags import Tag
 from models.users import User
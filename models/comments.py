@@ -3,6 +3,13 @@ from main import db
 
 class Comment(db.Model):
     __tablename__ = "comments"
+    __table_args__ = (
+        # An entry's comments, listed oldest first
+        db.Index('ix_comments_entry_created', 'entry_id', 'date_created',
+                 'id'),
+        # Comments removed together with their user
+        db.Index('ix_comments_user', 'user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -10,6 +10,10 @@ class PrivacyOptions(Enum):
 
 class Diary(db.Model):
     __tablename__ = "diaries"
+    # A user's diaries, listed oldest first
+    __table_args__ = (
+        db.Index('ix_diaries_user_created', 'user_id', 'date_created', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
@@ -3,12 +3,24 @@ from main import db
 
 class Entry(db.Model):
     __tablename__ = "entries"
+    __table_args__ = (
+        # A diary's entries, listed oldest first
+        db.Index('ix_entries_diary_created', 'diary_id', 'date_created',
+                 'id'),
+        # Search results without terms, newest first
+        db.Index('ix_entries_created', 'date_created', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     date_created = db.Column(db.DateTime, nullable=False)
     diary_id = db.Column(db.Integer, db.ForeignKey('diaries.id'),
                          nullable=False)
+    # Denormalized counters, maintained by services.counters
+    like_count = db.Column(db.Integer, nullable=False, default=0,
+                           server_default="0")
+    comment_count = db.Column(db.Integer, nullable=False, default=0,
+                              server_default="0")
 
     diary = db.relationship(
         'Diary',
@@ -3,6 +3,13 @@ from main import db
 
 class EntryTag(db.Model):
     __tablename__ = "entry_tags"
+    __table_args__ = (
+        # A tag is added to an entry only once; also serves entry -> tags
+        db.Index('uq_entry_tags_entry_tag', 'entry_id', 'tag_id',
+                 unique=True),
+        # tag -> entries
+        db.Index('ix_entry_tags_tag_entry', 'tag_id', 'entry_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     entry_id = db.Column(db.Integer, db.ForeignKey('entries.id'),
@@ -0,0 +1,29 @@
+from main import db
+
+
+class FeedItem(db.Model):
+    # Materialized timeline of the entries in PUBLIC diaries: one row per
+    # public entry with tag_id NULL (the public feed) and one per tag it
+    # carries (the tag feeds). Derived from entries, diaries and entry_tags
+    # by services.feed; no foreign keys, so they never order or block writes
+    # to the tables they are built from.
+    __tablename__ = "feed_items"
+    __table_args__ = (
+        # A feed, newest first
+        db.Index('ix_feed_items_feed', 'tag_id', 'date_created',
+                 'entry_id'),
+        # Rows of an entry, rebuilt when it changes
+        db.Index('ix_feed_items_entry', 'entry_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, nullable=False)
+    tag_id = db.Column(db.Integer)
+    date_created = db.Column(db.DateTime, nullable=False)
+
+    entry = db.relationship(
+        'Entry',
+        primaryjoin='foreign(FeedItem.entry_id) == Entry.id',
+        viewonly=True,
+        lazy=True
+    )
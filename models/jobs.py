@@ -0,0 +1,47 @@
+from enum import Enum
+
+from main import db
+
+
+class JobStatus(Enum):
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+
+
+class Job(db.Model):
+    # Durable queue of background work (services.jobs). A job is written in
+    # the transaction of the request that asks for it, so it exists exactly
+    # when that request's other writes do, and survives restarts until a
+    # worker has finished it.
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Next job to claim, oldest first
+        db.Index('ix_jobs_status', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.Enum(JobStatus), nullable=False,
+                       default=JobStatus.QUEUED)
+    # The user who may read the job's status (NULL = anyone). Not a foreign
+    # key, so deleting the user never has to wait for their jobs.
+    owner_id = db.Column(db.Integer)
+    # Progress, in units of the job's kind (e.g. entries deleted)
+    done = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    date_created = db.Column(db.DateTime, nullable=False)
+    date_started = db.Column(db.DateTime)
+    date_finished = db.Column(db.DateTime)
+    # Last sign of life of the worker running it; a RUNNING job whose
+    # heartbeat is older than JOB_LEASE is taken over by another worker
+    heartbeat = db.Column(db.DateTime)
+
+    @property
+    def is_finished(self):
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
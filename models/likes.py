@@ -3,6 +3,13 @@ from main import db
 
 class Like(db.Model):
     __tablename__ = "likes"
+    # A user can like an entry only once
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'entry_id',
+                            name='uq_likes_user_entry'),
+        # An entry's likes, listed oldest first
+        db.Index('ix_likes_entry_created', 'entry_id', 'date_created', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
@@ -0,0 +1,22 @@
+from main import db
+
+
+class TagStat(db.Model):
+    # Number of entries in PUBLIC diaries carrying each tag, i.e. the size of
+    # the tag's feed in feed_items, maintained by services.tag_stats
+    # alongside it. Tags without public entries have no row.
+    __tablename__ = "tag_stats"
+    __table_args__ = (
+        # Busiest tags first, for the tag cloud
+        db.Index('ix_tag_stats_public_entries', 'public_entries', 'tag_id'),
+    )
+
+    tag_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    public_entries = db.Column(db.Integer, nullable=False, default=0)
+
+    tag = db.relationship(
+        'Tag',
+        primaryjoin='foreign(TagStat.tag_id) == Tag.id',
+        viewonly=True,
+        lazy=True
+    )
@@ -5,6 +5,10 @@ from schemas.common import TrimmedString
 
 
 class PrivacyStringField(fields.Field):
+    # The app's JSON provider writes enum members as their value, so the
+    # compiled serializers may pass them through as they are
+    json_native = True
+
     def _serialize(self, value, attr, obj, **kwargs):
         if value is None:
             return None
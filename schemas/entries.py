@@ -15,6 +15,8 @@ class EntrySchema(ma.SQLAlchemyAutoSchema):
                             )  # Sanitize and validate content
     date_created = fields.DateTime(dump_only=True)
     diary_id = fields.Int(required=True, load_only=True)
+    like_count = fields.Int(dump_only=True)
+    comment_count = fields.Int(dump_only=True)
     diary = fields.Nested('DiarySchema', exclude=('entries',))
     tags = fields.Nested('TagSchema', many=True, exclude=('entries',))
     comments = fields.Nested('CommentSchema', many=True,
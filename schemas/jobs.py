@@ -0,0 +1,16 @@
+from main import ma
+from marshmallow import fields
+from models.jobs import Job
+
+
+class JobSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Job
+        exclude = ('params', 'owner_id', 'heartbeat')
+
+    id = fields.Int(dump_only=True)
+    status = fields.Function(lambda job: job.status.value)
+    result = fields.Raw()
+
+
+job_schema = JobSchema()
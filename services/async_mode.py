@@ -0,0 +1,275 @@
+import asyncio
+import contextvars
+import io
+import os
+import sys
+import time
+
+import sqlalchemy as sa
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.util import await_only, greenlet_spawn
+
+# ASYNC_MODE serves the unchanged Flask app from an ASGI server on one event
+# loop. Each request runs in its own greenlet (SQLAlchemy's greenlet_spawn,
+# the machinery behind AsyncSession), and the engines are the sync facades
+# of asyncpg/aiosqlite async engines: every database round trip awaits on
+# the loop instead of blocking a thread, so concurrency costs a greenlet
+# rather than a worker thread or process.
+#
+# Code on the request path must therefore not block the thread while it
+# waits: sleep(), wait() and acquire() below yield to the loop in a request
+# greenlet and behave like their blocking counterparts anywhere else, and
+# offload() moves long CPU work to the loop's thread pool. bcrypt and
+# compression release the GIL; schema dumps and loads do not, but the
+# interpreter's switch interval still hands the loop a turn every few
+# milliseconds instead of stalling it for the whole list.
+
+# Driver to use in ASYNC_MODE for each sync driver
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+# True inside the greenlet of a request (or of the boot) on the event loop
+_in_loop = contextvars.ContextVar("in_loop", default=False)
+
+
+def in_event_loop():
+    return _in_loop.get()
+
+
+def sleep(seconds):
+    if in_event_loop():
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
+
+
+def wait(future):
+    # Result of a concurrent.futures.Future
+    if in_event_loop():
+        return await_only(asyncio.wrap_future(future))
+    return future.result()
+
+
+def acquire(primitive, timeout=None):
+    # primitive.acquire() for a threading Lock or Semaphore. On the loop a
+    # blocking acquire would stall the holder too, so it is polled instead,
+    # with a growing pause between attempts.
+    if not in_event_loop():
+        return primitive.acquire(timeout=-1 if timeout is None else timeout)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    pause = 0.001
+    while not primitive.acquire(blocking=False):
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        sleep(pause)
+        pause = min(pause * 2, 0.05)
+    return True
+
+
+def _off_loop(fn, *args):
+    _in_loop.set(False)
+    return fn(*args)
+
+
+def offload(fn, *args):
+    # fn(*args) on the loop's thread pool, with the caller's context (app
+    # and request contexts included), when called on the loop
+    if not in_event_loop():
+        return fn(*args)
+
+    context = contextvars.copy_context()
+    return await_only(asyncio.get_running_loop().run_in_executor(
+        None, context.run, _off_loop, fn, *args))
+
+
+def _on_loop(fn):
+    def run(*args):
+        token = _in_loop.set(True)
+        try:
+            return fn(*args)
+        finally:
+            _in_loop.reset(token)
+
+    return run
+
+
+async def spawn(fn, *args):
+    # fn(*args) in a new greenlet on the loop, like a request
+    return await greenlet_spawn(_on_loop(fn), *args)
+
+
+class AsyncAwareSQLAlchemy(SQLAlchemy):
+    # Flask-SQLAlchemy creating the sync facade of an async engine for every
+    # bind when ASYNC_MODE is on. Sessions, queries and events are the usual
+    # sync ones; only the DBAPI underneath awaits.
+
+    def _make_engine(self, bind_key, options, app):
+        if not app.config.get("ASYNC_MODE"):
+            return super()._make_engine(bind_key, options, app)
+
+        options = dict(options)
+        url = sa.engine.make_url(options.pop("url"))
+        url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername,
+                                                   url.drivername))
+
+        if not url.get_dialect().is_async:
+            raise RuntimeError(
+                f"ASYNC_MODE has no async driver for {url.drivername}")
+
+        try:
+            return create_async_engine(url, **options).sync_engine
+        except ImportError as e:
+            raise RuntimeError(
+                f"ASYNC_MODE needs the {e.name} package for "
+                f"{url.drivername}") from e
+
+
+def _environ(scope, body):
+    # WSGI environ of an ASGI http scope
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    # the whole body has been read, chunked or not
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+def _respond(app, environ, send):
+    # Run the WSGI app and stream its response, in the request greenlet
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and started.get("sent"):
+            raise exc_info[1].with_traceback(exc_info[2])
+
+        started["message"] = {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(name.lower().encode("latin-1"),
+                         value.encode("latin-1"))
+                        for name, value in headers],
+        }
+        return write
+
+    def write(chunk):
+        if not started.get("sent"):
+            await_only(send(started["message"]))
+            started["sent"] = True
+        if chunk:
+            await_only(send({"type": "http.response.body", "body": chunk,
+                             "more_body": True}))
+
+    iterable = app(environ, start_response)
+    try:
+        for chunk in iterable:
+            write(chunk)
+        write(b"")
+        await_only(send({"type": "http.response.body", "body": b"",
+                         "more_body": False}))
+    finally:
+        close = getattr(iterable, "close", None)
+        if close is not None:
+            close()
+
+
+class AsgiApp:
+    # ASGI application serving the Flask app returned by `factory`, which
+    # is called on the event loop (at lifespan startup or on the first
+    # request) so that the connections it opens belong to the loop
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.app = None
+        self._loading = None
+
+    async def load(self):
+        if self.app is None:
+            if self._loading is None:
+                self._loading = asyncio.Lock()
+            async with self._loading:
+                if self.app is None:
+                    self.app = await spawn(self.factory)
+        return self.app
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.load()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed",
+                                "message": str(e)})
+                    raise
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                from services.jobs import runner
+                from services.passwords import passwords
+                runner.shutdown()
+                passwords.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope {scope['type']}")
+
+        app = await self.load()
+
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        await spawn(_respond, app, _environ(scope, b"".join(body)), send)
+
+
+def asgi_app():
+    # The ASGI application of `uvicorn asgi:app`
+    os.environ["ASYNC_MODE"] = "1"
+
+    from main import init_app
+    return AsgiApp(init_app)
@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import current_app
+from marshmallow import ValidationError
+
+from models import Comment, Entry, EntryTag, Like
+from services.async_mode import in_event_loop, offload
+from services import counters, tag_postings
+from services.feed import refresh_entries
+from services.response_cache import invalidate_entries
+from services.search import index_entries
+
+# Batch endpoints validate every item, check them all with one IN query and
+# insert the accepted ones with a single Core executemany, in the request's
+# one transaction. Core inserts skip the mapper events, so everything the
+# events would maintain is done here explicitly: the SQLite full-text index,
+# the public feed, the tag posting lists, the like/comment counters and the
+# response cache tokens.
+
+
+def load_many(schema, payload):
+    # Validate a batch with a many=True schema. Returns the loaded items,
+    # with None in place of the invalid ones, and the errors by position.
+    if not isinstance(payload, list):
+        raise ValidationError("Expected a list of items")
+
+    limit = current_app.config["BATCH_MAX_ITEMS"]
+    if len(payload) > limit:
+        raise ValidationError(f"A batch holds at most {limit} items")
+
+    try:
+        if in_event_loop() and \
+                len(payload) >= current_app.config["ASYNC_OFFLOAD_ITEMS"]:
+            return offload(schema.load, payload), {}
+        return schema.load(payload), {}
+    except ValidationError as e:
+        if not all(isinstance(index, int) for index in e.messages):
+            raise
+        items = [None if index in e.messages else item
+                 for index, item in enumerate(e.valid_data)]
+        return items, e.messages
+
+
+def load_ids(payload, key):
+    # A {key: [id, ...]} body, held to the same limit as load_many
+    ids = payload.get(key) if isinstance(payload, dict) else None
+    if not isinstance(ids, list) or not all(type(id_) is int for id_ in ids):
+        raise ValidationError("Expected a list of ids", key)
+
+    limit = current_app.config["BATCH_MAX_ITEMS"]
+    if len(ids) > limit:
+        raise ValidationError(f"A batch holds at most {limit} items", key)
+    return ids
+
+
+def item_result(status, **fields):
+    # One element of a batch response
+    return {"status": status, **fields}
+
+
+def existing_ids(session, column, ids):
+    # The subset of `ids` present in `column`, in one IN query
+    ids = set(ids)
+    if not ids:
+        return set()
+    return set(session.execute(
+        sa.select(column).where(column.in_(ids))).scalars())
+
+
+def _insert(session, table, rows):
+    # Insert `rows` in one executemany and return their new ids in order
+    if not rows:
+        return []
+
+    return list(session.execute(
+        sa.insert(table).returning(table.c.id, sort_by_parameter_order=True),
+        rows,
+    ).scalars())
+
+
+def insert_entries(session, items):
+    now = datetime.utcnow()
+    rows = [{"content": item["content"], "diary_id": item["diary_id"],
+             "date_created": now} for item in items]
+    ids = _insert(session, Entry.__table__, rows)
+
+    index_entries(session.connection(),
+                  [(entry_id, row["content"])
+                   for entry_id, row in zip(ids, rows)])
+    refresh_entries(session, ids)
+    return ids
+
+
+def insert_comments(session, user_id, items):
+    now = datetime.utcnow()
+    rows = [{"content": item["content"], "entry_id": item["entry_id"],
+             "user_id": user_id, "date_created": now} for item in items]
+    ids = _insert(session, Comment.__table__, rows)
+
+    counters.adjust_many(session.connection(), "comment_count",
+                         Counter(row["entry_id"] for row in rows))
+    invalidate_entries(session, {row["entry_id"] for row in rows})
+    return ids
+
+
+def insert_likes(session, user_id, items):
+    now = datetime.utcnow()
+    rows = [{"entry_id": item["entry_id"], "user_id": user_id,
+             "date_created": now} for item in items]
+    ids = _insert(session, Like.__table__, rows)
+
+    counters.adjust_many(session.connection(), "like_count",
+                         Counter(row["entry_id"] for row in rows))
+    invalidate_entries(session, {row["entry_id"] for row in rows})
+    return ids
+
+
+def insert_entry_tags(session, entry_id, tag_ids):
+    _insert(session, EntryTag.__table__, [
+        {"entry_id": entry_id, "tag_id": tag_id} for tag_id in tag_ids])
+
+    # after the insert, so the new tags are invalidated too
+    invalidate_entries(session, {entry_id})
+    refresh_entries(session, {entry_id})
+    tag_postings.add(session, entry_id, tag_ids)
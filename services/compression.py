@@ -0,0 +1,155 @@
+import gzip
+import zlib
+
+from flask import current_app, has_request_context, request
+
+from services.async_mode import offload
+
+try:
+    import brotli
+except ImportError:  # optional, "br" is simply not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, "zstd" is simply not offered
+    zstandard = None
+
+# Content types worth compressing; everything else goes out as it is
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+
+def available():
+    # Encodings of COMPRESSION_ENCODINGS whose library is installed, in the
+    # server's order of preference
+    installed = {"gzip": True, "br": brotli is not None,
+                 "zstd": zstandard is not None}
+    return [encoding for encoding in current_app.config[
+        "COMPRESSION_ENCODINGS"] if installed.get(encoding)]
+
+
+def negotiate():
+    # Best encoding for the current request by Accept-Encoding quality, the
+    # server's preference breaking ties. None when compression is off or
+    # the client accepts none of them.
+    if not has_request_context() \
+            or "compression" not in current_app.extensions:
+        return None
+
+    accepted = request.accept_encodings
+    candidates = [(accepted.quality(encoding), -index, encoding)
+                  for index, encoding in enumerate(available())]
+    quality, _, encoding = max(candidates, default=(0, 0, None))
+    return encoding if quality > 0 else None
+
+
+def compress(body, encoding):
+    level = current_app.config["COMPRESSION_LEVELS"][encoding]
+
+    # zlib, brotli and zstandard release the GIL: large bodies are
+    # compressed in parallel with the event loop in ASYNC_MODE
+    if len(body) >= current_app.config["ASYNC_OFFLOAD_BYTES"]:
+        return offload(_compress, body, encoding, level)
+    return _compress(body, encoding, level)
+
+
+def _compress(body, encoding, level):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+def _compressor(encoding):
+    # (compress, finish) pair of an incremental compressor
+    level = current_app.config["COMPRESSION_LEVELS"][encoding]
+
+    if encoding == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.finish
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+def _stream(chunks, encoding):
+    # Compress a streamed body as it is produced; only what the compressor
+    # emits is yielded, so memory stays bounded by its window
+    process, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            output = process(chunk)
+            if output:
+                yield output
+        output = finish()
+        if output:
+            yield output
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def variant_etag(etag, encoding):
+    # A strong ETag of the encoded representation: '"abc"' -> '"abc-gzip"'
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def compressible(mimetype):
+    return mimetype is not None and mimetype.startswith(COMPRESSIBLE)
+
+
+def encoding_for(body, mimetype):
+    # Encoding a complete body should be sent with, or None
+    if len(body) < current_app.config["COMPRESSION_MIN_SIZE"] \
+            or not compressible(mimetype):
+        return None
+    return negotiate()
+
+
+def _compress_response(response):
+    if not compressible(response.mimetype) or response.direct_passthrough:
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    # Nothing to encode, or already encoded (e.g. a compressed variant
+    # served by the response cache)
+    if response.status_code < 200 or response.status_code in (204, 304) \
+            or "Content-Encoding" in response.headers:
+        return response
+
+    if not response.is_streamed and response.calculate_content_length() \
+            < current_app.config["COMPRESSION_MIN_SIZE"]:
+        return response
+
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+
+    response.headers["Content-Encoding"] = encoding
+    etag = response.headers.get("ETag")
+    if etag:
+        response.headers["ETag"] = variant_etag(etag, encoding)
+
+    return response
+
+
+def init_compression(app):
+    # Opt-in with COMPRESSION=1 (the default in production)
+    if not app.config.get("COMPRESSION"):
+        return
+
+    app.extensions["compression"] = True
+    app.after_request(_compress_response)
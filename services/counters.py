@@ -0,0 +1,91 @@
+import sqlalchemy as sa
+
+from models.comments import Comment
+from models.entries import Entry
+from models.likes import Like
+
+entries_table = Entry.__table__
+
+# counter column on "entries" -> child table it counts
+COUNTERS = {
+    "like_count": Like.__table__,
+    "comment_count": Comment.__table__,
+}
+
+
+def adjust(connection, entry_id, column, delta):
+    # Atomic "SET x = x + delta": concurrent writers never lose an update
+    # because the new value is computed by the database, not read-modify-write
+    connection.execute(
+        sa.update(entries_table)
+        .where(entries_table.c.id == entry_id)
+        .values({column: entries_table.c[column] + delta})
+    )
+
+
+def adjust_many(connection, column, deltas):
+    # adjust() for several entries in one executemany; `deltas` maps entry
+    # ids to the amount to add
+    if not deltas:
+        return
+
+    connection.execute(
+        sa.update(entries_table)
+        .where(entries_table.c.id == sa.bindparam("entry_id"))
+        .values({column: entries_table.c[column] + sa.bindparam("delta")}),
+        [{"entry_id": entry_id, "delta": delta}
+         for entry_id, delta in deltas.items()]
+    )
+
+
+def reconcile(connection, *where):
+    # Recompute every counter from its child table, touching only the rows
+    # that drifted (among the entries matching `where`, if given). Returns
+    # the number of repaired rows per counter.
+    repaired = {}
+
+    for column, child in COUNTERS.items():
+        actual = (
+            sa.select(sa.func.count(child.c.id))
+            .where(child.c.entry_id == entries_table.c.id)
+            .scalar_subquery()
+        )
+        result = connection.execute(
+            sa.update(entries_table)
+            .where(entries_table.c[column] != actual, *where)
+            .values({column: actual})
+        )
+        repaired[column] = result.rowcount
+
+    return repaired
+
+
+def _like_inserted(mapper, connection, like):
+    adjust(connection, like.entry_id, "like_count", 1)
+
+
+def _like_deleted(mapper, connection, like):
+    adjust(connection, like.entry_id, "like_count", -1)
+
+
+def _comment_inserted(mapper, connection, comment):
+    adjust(connection, comment.entry_id, "comment_count", 1)
+
+
+def _comment_deleted(mapper, connection, comment):
+    adjust(connection, comment.entry_id, "comment_count", -1)
+
+
+def init_counters(app):
+    # Maintain the counters inside the flush that inserts or deletes the
+    # child row, so they commit or roll back together with it
+    listeners = [
+        (Like, "after_insert", _like_inserted),
+        (Like, "after_delete", _like_deleted),
+        (Comment, "after_insert", _comment_inserted),
+        (Comment, "after_delete", _comment_deleted),
+    ]
+
+    for target, identifier, fn in listeners:
+        if not sa.event.contains(target, identifier, fn):
+            sa.event.listen(target, identifier, fn)
@@ -0,0 +1,118 @@
+from collections import Counter, defaultdict
+
+import sqlalchemy as sa
+
+from models import Comment, Diary, Entry, EntryTag, Like, User
+from services import counters, tag_postings
+from services.feed import refresh_entries
+from services.identity import forget_user
+from services.response_cache import invalidate, invalidate_entries
+from services.search import unindex_entries
+
+# Set-based deletes. The ORM cascades on User, Diary and Entry load every
+# child row into the session and delete them one statement each; here a
+# set of rows goes with one DELETE ... WHERE id IN (...) per table, children
+# before parents, so the work per call is a fixed number of statements and
+# only the ids are ever held in memory. The callers pick the set size (the
+# background jobs delete JOB_CHUNK_SIZE rows per transaction) and commit.
+#
+# Core deletes skip the mapper and flush events, so everything those would
+# maintain is done here explicitly: the public feed and tag totals, the
+# full-text index, the tag posting lists, the like/comment counters of the
+# entries that stay and the response cache tokens.
+
+comments = Comment.__table__
+likes = Like.__table__
+entry_tags = EntryTag.__table__
+entries = Entry.__table__
+diaries = Diary.__table__
+users = User.__table__
+
+
+def delete_entries(session, entry_ids):
+    # Delete entries with their comments, likes and entry_tags rows.
+    # Returns the number of entries deleted.
+    entry_ids = list(entry_ids)
+    if not entry_ids:
+        return 0
+
+    connection = session.connection()
+
+    # Read while the entry_tags rows still exist
+    tagged = defaultdict(list)
+    for entry_id, tag_id in connection.execute(
+            sa.select(entry_tags.c.entry_id, entry_tags.c.tag_id)
+            .where(entry_tags.c.entry_id.in_(entry_ids))):
+        tagged[entry_id].append(tag_id)
+    invalidate_entries(session, entry_ids)
+
+    for child in (comments, likes, entry_tags):
+        connection.execute(
+            child.delete().where(child.c.entry_id.in_(entry_ids)))
+
+    unindex_entries(connection, entry_ids)
+    deleted = connection.execute(
+        entries.delete().where(entries.c.id.in_(entry_ids))).rowcount
+
+    # With the entries gone this only removes their feed rows
+    refresh_entries(session, entry_ids)
+    for entry_id, tag_ids in tagged.items():
+        tag_postings.remove(session, entry_id, tag_ids)
+
+    return deleted
+
+
+def _delete_children(session, table, column, ids):
+    # Delete comments or likes by id, taking them off the counters of the
+    # entries they belong to
+    ids = list(ids)
+    if not ids:
+        return 0
+
+    connection = session.connection()
+    per_entry = Counter(connection.execute(
+        sa.select(table.c.entry_id).where(table.c.id.in_(ids))).scalars())
+
+    deleted = connection.execute(
+        table.delete().where(table.c.id.in_(ids))).rowcount
+    counters.adjust_many(connection, column, {
+        entry_id: -count for entry_id, count in per_entry.items()})
+    invalidate_entries(session, per_entry)
+
+    return deleted
+
+
+def delete_comments(session, comment_ids):
+    return _delete_children(session, comments, "comment_count", comment_ids)
+
+
+def delete_likes(session, like_ids):
+    return _delete_children(session, likes, "like_count", like_ids)
+
+
+def delete_diaries(session, diary_ids):
+    # Delete diaries whose entries have already been deleted
+    diary_ids = list(diary_ids)
+    if not diary_ids:
+        return 0
+
+    invalidate(session, "diaries")
+    return session.connection().execute(
+        diaries.delete().where(diaries.c.id.in_(diary_ids))).rowcount
+
+
+def delete_users(session, user_ids):
+    # Delete users whose diaries, comments and likes have already been
+    # deleted
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+
+    connection = session.connection()
+    for user in connection.execute(sa.select(users.c.id, users.c.email)
+                                   .where(users.c.id.in_(user_ids))):
+        forget_user(user)
+
+    invalidate(session, "users")
+    return connection.execute(
+        users.delete().where(users.c.id.in_(user_ids))).rowcount
@@ -0,0 +1,218 @@
+import bisect
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from models import Diary, Entry, EntryTag, FeedItem, Tag
+from models.diaries import PrivacyOptions
+from services import tag_stats
+from services.lru import TTLCache
+
+# feed_items holds, for every entry in a PUBLIC diary, one row in the
+# public feed (tag_id NULL) and one in the feed of each of its tags. Pages
+# are read newest first by (date_created, entry_id) from the feed index and
+# the entries are then fetched by primary key, so serving a feed never
+# touches more of "entries" than the page itself.
+#
+# The rows of an entry are re-derived whenever something that decides them
+# changes (entry created or deleted, tags added or removed, diary privacy
+# flipped, tag deleted): by the flush listener below for ORM writes, and by
+# the callers of refresh()/rebuild() for Core writes. Both keep the per-tag
+# totals of services.tag_stats in step.
+#
+# The newest FEED_HOT_WINDOW keys of each feed are also kept in memory for
+# FEED_HOT_TTL seconds, so the first pages of a busy feed need no feed
+# query at all. Commits in this process drop the windows right away; other
+# processes see changes once their windows expire.
+
+feed_items = FeedItem.__table__
+entries = Entry.__table__
+diaries = Diary.__table__
+entry_tags = EntryTag.__table__
+
+
+def _insert(connection, *where):
+    # INSERT ... SELECT the feed rows of the public entries matching `where`:
+    # one in the public feed and one per tag
+    public = entries.join(diaries, diaries.c.id == entries.c.diary_id)
+    tagged = public.join(entry_tags, entry_tags.c.entry_id == entries.c.id)
+
+    for tag_column, source in ((sa.cast(sa.null(), sa.Integer), public),
+                               (entry_tags.c.tag_id, tagged)):
+        connection.execute(feed_items.insert().from_select(
+            ["entry_id", "tag_id", "date_created"],
+            sa.select(entries.c.id, tag_column, entries.c.date_created)
+            .select_from(source)
+            .where(diaries.c.privacy == PrivacyOptions.PUBLIC, *where)
+        ))
+
+
+def refresh(connection, entry_ids=(), diary_ids=()):
+    # Re-derive the feed rows of the given entries and of every entry of the
+    # given diaries
+    entry_ids, diary_ids = set(entry_ids), set(diary_ids)
+    selected = []
+
+    if entry_ids:
+        selected.append(entries.c.id.in_(entry_ids))
+    if diary_ids:
+        selected.append(entries.c.diary_id.in_(diary_ids))
+    if not selected:
+        return
+
+    # Deleted entries are gone from "entries" by now, hence entry_ids on
+    # their own
+    stale = []
+    if entry_ids:
+        stale.append(feed_items.c.entry_id.in_(entry_ids))
+    if diary_ids:
+        stale.append(feed_items.c.entry_id.in_(
+            sa.select(entries.c.id).where(entries.c.diary_id.in_(diary_ids))))
+
+    # the refreshed entries' rows are exactly the stale ones, recounted
+    # once replaced
+    stale = sa.or_(*stale)
+    before = tag_stats.feed_counts(connection, stale)
+    connection.execute(feed_items.delete().where(stale))
+    _insert(connection, sa.or_(*selected))
+    after = tag_stats.feed_counts(connection, stale)
+
+    tag_stats.adjust(connection, {tag_id: after[tag_id] - before[tag_id]
+                                  for tag_id in before.keys() | after.keys()})
+
+
+def rebuild(connection):
+    # Re-populate feed_items from scratch, e.g. after bulk inserts
+    connection.execute(feed_items.delete())
+    _insert(connection)
+    tag_stats.rebuild(connection)
+
+
+def _feed_filter(tag_id):
+    if tag_id is None:
+        return feed_items.c.tag_id.is_(None)
+    return feed_items.c.tag_id == tag_id
+
+
+def _before(cursor):
+    # Keyset predicate "(date_created, entry_id) < cursor" for the
+    # descending feed order
+    date_created, entry_id = cursor
+    return sa.or_(feed_items.c.date_created < date_created,
+                  sa.and_(feed_items.c.date_created == date_created,
+                          feed_items.c.entry_id < entry_id))
+
+
+def _read(session, tag_id, cursor, limit):
+    # Up to `limit` (date_created, entry_id) keys after `cursor`, newest first
+    query = sa.select(feed_items.c.date_created, feed_items.c.entry_id) \
+        .where(_feed_filter(tag_id))
+
+    if cursor is not None:
+        query = query.where(_before(cursor))
+
+    query = query.order_by(feed_items.c.date_created.desc(),
+                           feed_items.c.entry_id.desc()).limit(limit)
+    return [tuple(row) for row in session.execute(query)]
+
+
+def _window(session, tag_id):
+    # (keys oldest first, whether they are the whole feed) of the newest
+    # FEED_HOT_WINDOW keys of a feed
+    windows = current_app.extensions["feed_windows"]
+    window = windows.get(tag_id)
+
+    if window is None:
+        size = current_app.config["FEED_HOT_WINDOW"]
+        keys = _read(session, tag_id, None, size + 1)
+        window = (keys[:size][::-1], len(keys) <= size)
+        windows.set(tag_id, window)
+
+    return window
+
+
+def page_keys(session, tag_id, cursor, limit):
+    # The keys of one page of a feed, newest first, and whether there are
+    # more after it
+    keys, complete = _window(session, tag_id) \
+        if current_app.config["FEED_HOT_WINDOW"] else ([], False)
+
+    end = len(keys) if cursor is None else bisect.bisect_left(keys, cursor)
+    start = end - limit
+
+    # Served from memory when the whole page, and the knowledge of whether
+    # another one follows, lie inside the window
+    if complete or start > 0:
+        return keys[max(start, 0):end][::-1], start > 0
+
+    found = _read(session, tag_id, cursor, limit + 1)
+    return found[:limit], len(found) > limit
+
+
+def _after_flush(session, flush_context):
+    entry_ids, diary_ids, tag_ids = set(), set(), set()
+
+    # In after_flush new/dirty/deleted and attribute histories still
+    # describe what was just flushed
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        state = sa.inspect(instance)
+
+        if isinstance(instance, Entry):
+            if instance in session.new or instance in session.deleted \
+                    or state.attrs.tags.history.has_changes():
+                entry_ids.add(instance.id)
+        elif isinstance(instance, Diary):
+            if instance not in session.new and instance not in \
+                    session.deleted and state.attrs.privacy.history \
+                    .has_changes():
+                diary_ids.add(instance.id)
+        elif isinstance(instance, Tag):
+            if instance in session.deleted:
+                tag_ids.add(instance.id)
+            history = state.attrs.entries.history
+            entry_ids |= {entry.id for entry in
+                          [*history.added, *history.deleted]}
+        elif isinstance(instance, EntryTag):
+            history = state.attrs.entry_id.history
+            entry_ids |= {*(history.added or ()), *(history.deleted or ()),
+                          *(history.unchanged or ())}
+
+    entry_ids.discard(None)
+    if not (entry_ids or diary_ids or tag_ids):
+        return
+
+    connection = session.connection()
+    if tag_ids:
+        connection.execute(feed_items.delete().where(
+            feed_items.c.tag_id.in_(tag_ids)))
+    refresh(connection, entry_ids, diary_ids)
+    tag_stats.remove_tags(connection, tag_ids)
+    session.info["feed_changed"] = True
+
+
+def refresh_entries(session, entry_ids):
+    # refresh() for entries written with Core through `session`
+    refresh(session.connection(), entry_ids)
+    session.info["feed_changed"] = True
+
+
+def _after_commit(session):
+    if session.info.pop("feed_changed", False) and has_app_context():
+        windows = current_app.extensions.get("feed_windows")
+        if windows is not None:
+            windows.clear()
+
+
+def _after_rollback(session):
+    session.info.pop("feed_changed", None)
+
+
+def init_feed(app):
+    app.extensions["feed_windows"] = TTLCache(
+        app.config["FEED_HOT_FEEDS"], ttl=app.config["FEED_HOT_TTL"])
+
+    for identifier, fn in (("after_flush", _after_flush),
+                           ("after_commit", _after_commit),
+                           ("after_rollback", _after_rollback)):
+        if not sa.event.contains(sa.orm.Session, identifier, fn):
+            sa.event.listen(sa.orm.Session, identifier, fn)
@@ -0,0 +1,55 @@
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from main import db
+from models.users import User
+from services.lru import TTLCache
+
+# JWT identity -> detached User snapshot. Merging a snapshot into the request
+# session costs no SQL, so a cache hit resolves the user without a query.
+user_cache = TTLCache(maxsize=1024, ttl=60)
+
+
+def _snapshot(user):
+    snapshot = User(id=user.id, email=user.email, password=user.password)
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def _query_user(identity):
+    # Tokens carry the numeric user id; tokens issued before that carried the
+    # email address and are still honoured until they expire
+    if isinstance(identity, int) or str(identity).isdigit():
+        return db.session.get(User, int(identity))
+
+    return db.session.query(User).filter_by(email=identity).first()
+
+
+def load_user(jwt_header, jwt_data):
+    identity = jwt_data[current_app.config["JWT_IDENTITY_CLAIM"]]
+    snapshot = user_cache.get(identity)
+
+    if snapshot is not None:
+        return db.session.merge(snapshot, load=False)
+
+    user = _query_user(identity)
+
+    if user is not None:
+        user_cache.set(identity, _snapshot(user))
+
+    return user
+
+
+def forget_user(user):
+    # Drop every cached identity of `user`; call before changing or deleting
+    for identity in (user.id, str(user.id), user.email):
+        user_cache.pop(identity)
+
+
+def init_user_loader(app, jwt):
+    user_cache.maxsize = app.config["USER_CACHE_SIZE"]
+    user_cache.ttl = app.config["USER_CACHE_TTL"]
+
+    # Exposes the resolved user as flask_jwt_extended.current_user, loaded
+    # once per request
+    jwt.user_lookup_loader(load_user)
@@ -0,0 +1,205 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import marshmallow
+import sqlalchemy as sa
+from flask import Blueprint, current_app, g, has_request_context, request
+
+# Slowest statements reported per request in the Server-Timing header
+SLOWEST_STATEMENTS = 3
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    # Cumulative Prometheus-style histogram, one series per blueprint
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            counts, total = self._series.get(
+                label, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[label] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            series = sorted(self._series.items())
+
+        for label, (counts, total) in series:
+            labels = f'blueprint="{label}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} '
+                    f'{cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+
+        return "\n".join(lines)
+
+
+histograms = {
+    "request": Histogram("diary_request_duration_seconds",
+                         "Time spent handling a request", LATENCY_BUCKETS),
+    "db": Histogram("diary_db_duration_seconds",
+                    "Time spent executing SQL per request", LATENCY_BUCKETS),
+    "ser": Histogram("diary_serialization_duration_seconds",
+                     "Time spent in schema dump/load per request",
+                     LATENCY_BUCKETS),
+    "sql": Histogram("diary_sql_statements",
+                     "SQL statements issued per request", STATEMENT_BUCKETS),
+}
+
+metrics = Blueprint("metrics", __name__)
+
+
+@metrics.route("/metrics", methods=["GET"])
+def get_metrics():
+    body = "\n".join(h.render() for h in histograms.values()) + "\n"
+    return current_app.response_class(
+        body, mimetype="text/plain; version=0.0.4")
+
+
+def _stats():
+    # Per-request measurements, None outside of an instrumented request
+    if has_request_context():
+        return g.get("instrumentation")
+    return None
+
+
+@contextmanager
+def timed_phase(name):
+    # Add the wall time of the block to the request's `name` phase. Nested
+    # phases (a schema dumping a nested schema) are only counted once.
+    # Streamed bodies are serialized after the headers went out, so their
+    # dump time is not reported.
+    stats = _stats()
+
+    if stats is None or stats["depth"]:
+        yield
+        return
+
+    stats["depth"] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats["depth"] -= 1
+        stats["phases"][name] = (stats["phases"].get(name, 0)
+                                 + time.perf_counter() - started)
+
+
+def _timed_method(method, phase):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with timed_phase(phase):
+            return method(*args, **kwargs)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _stats() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = _stats()
+    if stats is None or not conn.info.get("query_started"):
+        return
+
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+    stats["sql_count"] += 1
+    stats["sql_time"] += duration
+
+    slowest = stats["slowest"]
+    bisect.insort(slowest, (-duration, statement))
+    del slowest[SLOWEST_STATEMENTS:]
+
+
+def _server_timing(stats, total):
+    def entry(name, seconds, description=None):
+        value = f"{name};dur={seconds * 1000:.2f}"
+        if description:
+            description = description.replace("\\", "").replace('"', "'")
+            value += f';desc="{description}"'
+        return value
+
+    parts = [
+        entry("app", total),
+        entry("db", stats["sql_time"], f"{stats['sql_count']} sql"),
+    ]
+    parts += [entry(phase, seconds)
+              for phase, seconds in sorted(stats["phases"].items())]
+    parts += [
+        entry(f"sql-{rank}", -duration, " ".join(statement.split())[:100])
+        for rank, (duration, statement) in enumerate(stats["slowest"], 1)
+    ]
+    return ", ".join(parts)
+
+
+def init_instrumentation(app):
+    # Opt-in with INSTRUMENTATION=1: Server-Timing headers on every response
+    # and Prometheus histograms per blueprint on GET /metrics
+    if not app.config.get("INSTRUMENTATION"):
+        return
+
+    for identifier, fn in (("before_cursor_execute", _before_cursor_execute),
+                           ("after_cursor_execute", _after_cursor_execute)):
+        if not sa.event.contains(sa.engine.Engine, identifier, fn):
+            sa.event.listen(sa.engine.Engine, identifier, fn)
+
+    for name, phase in (("dump", "ser"), ("load", "load")):
+        method = getattr(marshmallow.Schema, name)
+        if not getattr(method, "instrumented", False):
+            setattr(marshmallow.Schema, name, _timed_method(method, phase))
+
+    app.register_blueprint(metrics)
+
+    @app.before_request
+    def start_instrumentation():
+        g.instrumentation = {
+            "started": time.perf_counter(),
+            "sql_count": 0,
+            "sql_time": 0.0,
+            "slowest": [],
+            "phases": {},
+            "depth": 0,
+        }
+
+    @app.after_request
+    def finish_instrumentation(response):
+        stats = g.pop("instrumentation", None)
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - stats["started"]
+        response.headers["Server-Timing"] = _server_timing(stats, total)
+
+        blueprint = request.blueprint or "app"
+        histograms["request"].observe(blueprint, total)
+        histograms["db"].observe(blueprint, stats["sql_time"])
+        histograms["ser"].observe(
+            blueprint, stats["phases"].get("ser", 0)
+            + stats["phases"].get("load", 0))
+        histograms["sql"].observe(blueprint, stats["sql_count"])
+        return response
@@ -0,0 +1,367 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from main import db
+from models import Comment, Diary, Entry, Job, Like
+from models.jobs import JobStatus
+from services import counters, deletion
+from services.async_mode import in_event_loop, spawn
+from services.response_cache import invalidate_all
+from services.search import rebuild_index
+from services.sqlite import writing
+
+# Work too big for a request (cascading deletes of whole diaries and users,
+# reindexing, counter reconciliation) is queued as a row in "jobs" and
+# answered with 202 Accepted; GET /jobs/<id> reports its progress.
+#
+# A handler is a generator: it does one chunk of work through db.session
+# and yields (done, total). The runner commits after every chunk, together
+# with the job's progress, so each transaction (and the SQLite write lock)
+# is short and a job cut off half way resumes from its last commit. The
+# value it returns is stored as the job's result. Handlers must therefore
+# be safe to run again from the start, which deleting "what is left" is.
+#
+# Each process runs JOB_WORKERS workers, claiming jobs from the table with
+# a conditional UPDATE, so the workers of every process share one queue.
+# A worker that dies mid-job stops heartbeating, and its job is taken over
+# once JOB_LEASE seconds have passed; a failing job is retried up to
+# JOB_MAX_ATTEMPTS times.
+
+jobs = Job.__table__
+
+# kind -> handler
+HANDLERS = {}
+
+
+class JobFailed(RuntimeError):
+    # Raised by a handler for a failure that retrying will not fix
+    pass
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+
+    return register
+
+
+def enqueue(session, kind, owner_id=None, **params):
+    # Add a job to `session`; it runs once the session commits. An
+    # unfinished job with the same kind and params is returned instead of
+    # queueing the work twice.
+    active = session.execute(sa.select(Job).where(
+        Job.status.in_((JobStatus.QUEUED, JobStatus.RUNNING)),
+        Job.kind == kind)).scalars()
+
+    for job in active:
+        if job.params == params:
+            return job
+
+    job = Job(kind=kind, params=params, owner_id=owner_id,
+              status=JobStatus.QUEUED, date_created=datetime.utcnow())
+    session.add(job)
+    session.info["jobs_enqueued"] = True
+    return job
+
+
+class JobRunner:
+    # The workers of this process: threads, or tasks on the event loop in
+    # ASYNC_MODE (where the engines only work from a loop greenlet). They
+    # start with the first request rather than at boot, so `flask` commands
+    # and the parent of a pre-forking server never run any.
+
+    def __init__(self):
+        self.workers = 0
+        self.poll_interval = 1.0
+        self.lease = 300
+        self.max_attempts = 3
+        self.chunk_size = 500
+        self._started = False
+        self._stopping = False
+        self._wakeup = None
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.workers = app.config["JOB_WORKERS"]
+        self.poll_interval = app.config["JOB_POLL_INTERVAL"]
+        self.lease = app.config["JOB_LEASE"]
+        self.max_attempts = app.config["JOB_MAX_ATTEMPTS"]
+        self.chunk_size = app.config["JOB_CHUNK_SIZE"]
+
+        app.before_request(self.start)
+
+    def start(self):
+        # Start the workers of the current app, once
+        if self._started or not self.workers:
+            return
+
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+            if in_event_loop():
+                self._wakeup = asyncio.Event()
+                loop = asyncio.get_running_loop()
+                self._tasks = [loop.create_task(self._serve_async(app))
+                               for _ in range(self.workers)]
+            else:
+                self._wakeup = threading.Event()
+                for i in range(self.workers):
+                    threading.Thread(target=self._serve, args=(app,),
+                                     name=f"job-worker-{i}",
+                                     daemon=True).start()
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def shutdown(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        self.wake()
+
+    def _serve(self, app):
+        while not self._stopping:
+            self._wakeup.clear()
+            self.drain(app)
+            self._wakeup.wait(self.poll_interval)
+
+    async def _serve_async(self, app):
+        while not self._stopping:
+            self._wakeup.clear()
+            await spawn(self.drain, app)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def drain(self, app):
+        # Run jobs until there is none left to claim; returns how many ran
+        ran = 0
+        try:
+            with app.app_context():
+                while not self._stopping:
+                    job = self._claim(db.session)
+                    if job is None:
+                        break
+                    self._run(db.session, job)
+                    ran += 1
+        except Exception:
+            app.logger.exception("Job worker failed")
+        return ran
+
+    def _claimable(self, now):
+        # Queued jobs, then running ones whose worker stopped heartbeating;
+        # each is served in id order by ix_jobs_status
+        return (jobs.c.status == JobStatus.QUEUED,
+                sa.and_(jobs.c.status == JobStatus.RUNNING,
+                        jobs.c.heartbeat < now - timedelta(
+                            seconds=self.lease)))
+
+    def _claim(self, session):
+        while True:
+            now = datetime.utcnow()
+            # A plain read first, so idle workers never take the write lock
+            for claimable in self._claimable(now):
+                job_id = session.execute(
+                    sa.select(jobs.c.id).where(claimable)
+                    .order_by(jobs.c.id).limit(1)).scalar()
+                if job_id is not None:
+                    break
+            session.rollback()
+            if job_id is None:
+                return None
+
+            with writing():
+                claimed = session.execute(
+                    jobs.update()
+                    .where(jobs.c.id == job_id, claimable)
+                    .values(status=JobStatus.RUNNING, heartbeat=now,
+                            attempts=jobs.c.attempts + 1,
+                            date_started=sa.func.coalesce(
+                                jobs.c.date_started, now))
+                ).rowcount
+                # Read in the claiming transaction: the handler's first
+                # chunk must begin a fresh (write) transaction
+                job = session.execute(
+                    sa.select(jobs.c.id, jobs.c.kind, jobs.c.params,
+                              jobs.c.attempts)
+                    .where(jobs.c.id == job_id)).one() if claimed else None
+                session.commit()
+
+            # Otherwise another worker got there first
+            if job is not None:
+                return job
+
+    def _update(self, session, job_id, **values):
+        session.execute(jobs.update().where(jobs.c.id == job_id)
+                        .values(heartbeat=datetime.utcnow(), **values))
+
+    def _run(self, session, job):
+        job_id, kind, params, attempts = job
+
+        try:
+            if kind not in HANDLERS:
+                raise JobFailed(f"Unknown job kind `{kind}`")
+            if attempts > self.max_attempts:
+                raise JobFailed(f"Gave up after {self.max_attempts} attempts")
+
+            steps = HANDLERS[kind](**params)
+            finished = False
+
+            while not finished:
+                with writing():
+                    try:
+                        done, total = next(steps)
+                        self._update(session, job_id, done=done, total=total)
+                    except StopIteration as stop:
+                        finished = True
+                        self._update(session, job_id,
+                                     status=JobStatus.SUCCEEDED,
+                                     result=stop.value,
+                                     date_finished=datetime.utcnow())
+                    session.commit()
+
+        except Exception as e:
+            session.rollback()
+            current_app.logger.exception("Job %s (%s) failed", job_id, kind)
+
+            retry = attempts < self.max_attempts and \
+                not isinstance(e, JobFailed)
+            with writing():
+                self._update(
+                    session, job_id, error=f"{type(e).__name__}: {e}",
+                    status=JobStatus.QUEUED if retry else JobStatus.FAILED,
+                    date_finished=None if retry else datetime.utcnow())
+                session.commit()
+
+
+runner = JobRunner()
+
+
+def _count(query):
+    return db.session.execute(
+        sa.select(sa.func.count()).select_from(query.subquery())).scalar()
+
+
+def _delete_in_chunks(query, delete):
+    # Pass the ids selected by `query` to `delete` JOB_CHUNK_SIZE at a time
+    # (services.deletion), yielding the number deleted after each chunk
+    while True:
+        ids = db.session.execute(
+            query.limit(runner.chunk_size)).scalars().all()
+        if not ids:
+            return
+        yield delete(db.session, ids)
+
+
+def _delete_rest(query, delete):
+    # Rows added since the chunks of `query` ran out (POST /entries/,
+    # /comments/ and /likes/ keep answering meanwhile), deleted in the final
+    # transaction so that the parent goes with nothing left referencing it
+    return delete(db.session, db.session.execute(query).scalars().all())
+
+
+@handler("delete_diary")
+def delete_diary(diary_id):
+    entries = sa.select(Entry.id).where(Entry.diary_id == diary_id)
+    total = _count(entries)
+    done = 0
+
+    for deleted in _delete_in_chunks(entries, deletion.delete_entries):
+        done += deleted
+        yield done, max(done, total)
+
+    # with the final commit
+    done += _delete_rest(entries, deletion.delete_entries)
+    deletion.delete_diaries(db.session, [diary_id])
+    return {"entries": done}
+
+
+@handler("delete_user")
+def delete_user(user_id):
+    own_entries = sa.select(Entry.id).join(Diary) \
+        .where(Diary.user_id == user_id)
+    parts = {
+        "entries": (own_entries, deletion.delete_entries),
+        # left on other users' entries, the rest go with the entries
+        "comments": (sa.select(Comment.id).where(
+            Comment.user_id == user_id, Comment.entry_id.not_in(own_entries)),
+            deletion.delete_comments),
+        "likes": (sa.select(Like.id).where(
+            Like.user_id == user_id, Like.entry_id.not_in(own_entries)),
+            deletion.delete_likes),
+    }
+    total = sum(_count(query) for query, _ in parts.values())
+    done = 0
+    result = {}
+
+    for name, (query, delete) in parts.items():
+        result[name] = 0
+        for deleted in _delete_in_chunks(query, delete):
+            result[name] += deleted
+            done += deleted
+            yield done, max(done, total)
+
+    # with the final commit; the entries go first, so the comments and likes
+    # queries then select every one the user has left
+    for name, (query, delete) in parts.items():
+        result[name] += _delete_rest(query, delete)
+    deletion.delete_diaries(db.session, db.session.execute(
+        sa.select(Diary.id).where(Diary.user_id == user_id)).scalars())
+    deletion.delete_users(db.session, [user_id])
+    return result
+
+
+@handler("reindex_search")
+def reindex_search():
+    rebuild_index(db.session.connection())
+    yield 1, 1
+
+
+@handler("reconcile_counters")
+def reconcile_counters():
+    # A range of entry ids per chunk
+    last = db.session.execute(sa.select(sa.func.max(Entry.id))).scalar() or 0
+    repaired = dict.fromkeys(counters.COUNTERS, 0)
+
+    for start in range(0, last, runner.chunk_size):
+        end = min(start + runner.chunk_size, last)
+        found = counters.reconcile(db.session.connection(),
+                                   Entry.id > start, Entry.id <= end)
+        for column, count in found.items():
+            repaired[column] += count
+        if any(found.values()):
+            invalidate_all(db.session)
+        yield end, last
+
+    return repaired
+
+
+def _after_commit(session):
+    if session.info.pop("jobs_enqueued", False) and has_app_context():
+        runner.start()
+        runner.wake()
+
+
+def _after_rollback(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def init_jobs(app):
+    runner.init_app(app)
+
+    for identifier, fn in (("after_commit", _after_commit),
+                           ("after_rollback", _after_rollback)):
+        if not sa.event.contains(sa.orm.Session, identifier, fn):
+            sa.event.listen(sa.orm.Session, identifier, fn)
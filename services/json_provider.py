@@ -0,0 +1,74 @@
+from datetime import datetime
+from enum import Enum
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, responses fall back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Flask's provider with two differences:
+    #  - with orjson installed, responses are encoded straight to UTF-8
+    #    bytes instead of an intermediate ASCII-escaped str;
+    #  - datetimes are written as ISO 8601 (like fields.DateTime) and Enum
+    #    members as their value, with or without orjson. The compiled
+    #    serializers rely on it to hand both over unconverted, see
+    #    services.serializers.
+    # Keys are still sorted and debug responses still indented.
+
+    native_values = True
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.fast = orjson is not None and app.config["JSON_PROVIDER"] == \
+            "orjson"
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        if isinstance(o, Enum):
+            return o.value
+        return DefaultJSONProvider.default(o)
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if not self.fast or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default,
+                            option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if not self.fast or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not self.fast:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None
+                                            and self._app.debug)
+        body = orjson.dumps(obj, default=self.default,
+                            option=self._options(indent)) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    # JSON_PROVIDER=orjson (default) uses orjson when it is installed,
+    # JSON_PROVIDER=json keeps Flask's own provider
+    if app.config["JSON_PROVIDER"] == "json":
+        return
+
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,71 @@
+import sqlalchemy as sa
+from flask import g, has_app_context, request
+from sqlalchemy.orm import joinedload, selectinload
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def eager(model, *paths):
+    # Build the loader options for the relationship graph a schema is going to
+    # serialize. Each path is a dotted chain of relationship names starting at
+    # `model`, e.g. eager(Entry, "diary.user", "comments.user").
+    #
+    # Many-to-one hops are JOINed into the parent SELECT, collections are
+    # fetched with one extra "SELECT ... WHERE fk IN (...)" per level, so the
+    # number of statements depends on the depth of the graph and not on the
+    # number of rows.
+    options = []
+    for path in paths:
+        option = None
+        owner = model
+        for name in path.split("."):
+            attribute = getattr(owner, name)
+            prop = attribute.property
+            strategy = selectinload if prop.uselist else joinedload
+
+            if option is None:
+                option = strategy(attribute)
+            else:
+                option = getattr(option, strategy.__name__)(attribute)
+
+            owner = prop.mapper.class_
+        options.append(option)
+
+    return options
+
+
+def _count_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    if has_app_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+def init_query_budget(app):
+    # Test mode: fail any request that issues more SQL statements than the
+    # configured QUERY_BUDGET, so an N+1 regression shows up as an error
+    # instead of a slow endpoint.
+    budget = app.config.get("QUERY_BUDGET")
+
+    if not budget:
+        return
+
+    if not sa.event.contains(sa.engine.Engine, "before_cursor_execute",
+                             _count_statement):
+        sa.event.listen(sa.engine.Engine, "before_cursor_execute",
+                        _count_statement)
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def enforce_query_budget(response):
+        count = g.get("query_count", 0)
+        if count > budget:
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} issued {count} SQL "
+                f"statements (budget: {budget})"
+            )
+        return response
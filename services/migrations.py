@@ -0,0 +1,137 @@
+import importlib
+import pkgutil
+from datetime import datetime
+
+import sqlalchemy as sa
+
+import migrations
+
+# Versions applied to a database are recorded here. Every migration is
+# written to be idempotent, so re-running one against a database that
+# already has its change (e.g. created by "flask db create") is harmless.
+schema_migrations = sa.Table(
+    "schema_migrations", sa.MetaData(),
+    sa.Column("version", sa.String(64), primary_key=True),
+    sa.Column("applied_at", sa.DateTime, nullable=False),
+)
+
+
+def discover():
+    # [(version, module)] of the migrations/NNNN_name.py modules, in order
+    found = []
+
+    for info in pkgutil.iter_modules(migrations.__path__):
+        version = info.name.split("_", 1)[0]
+        if version.isdigit():
+            module = importlib.import_module(f"migrations.{info.name}")
+            found.append((info.name, module))
+
+    return sorted(found)
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(
+        sa.select(schema_migrations.c.version)).scalars())
+
+
+def _record(connection, version):
+    connection.execute(schema_migrations.insert().values(
+        version=version, applied_at=datetime.utcnow()))
+
+
+def pending(engine):
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    return [(version, module) for version, module in discover()
+            if version not in done]
+
+
+def upgrade(engine, progress=print):
+    # Apply every pending migration, each in its own transaction. Migrations
+    # with TRANSACTIONAL = False (online index builds) run in autocommit
+    # mode instead, as CREATE INDEX CONCURRENTLY refuses a transaction.
+    applied = []
+
+    for version, module in pending(engine):
+        progress(f"Applying {version}")
+
+        if getattr(module, "TRANSACTIONAL", True):
+            with engine.begin() as connection:
+                module.upgrade(connection)
+                _record(connection, version)
+        else:
+            with engine.connect() as connection:
+                module.upgrade(
+                    connection.execution_options(isolation_level="AUTOCOMMIT"))
+            with engine.begin() as connection:
+                _record(connection, version)
+
+        applied.append(version)
+
+    return applied
+
+
+def stamp(engine):
+    # Mark every migration as applied, for databases just built from the
+    # models with create_all
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+        for version, _ in discover():
+            if version not in done:
+                _record(connection, version)
+
+
+# Helpers for the migration modules
+
+def has_column(connection, table, column):
+    columns = sa.inspect(connection).get_columns(table)
+    return column in {c["name"] for c in columns}
+
+
+def has_index(connection, table, columns):
+    # Whether an index or unique constraint already covers `columns`, in order
+    inspector = sa.inspect(connection)
+    existing = inspector.get_indexes(table) + \
+        inspector.get_unique_constraints(table)
+    return any(index["column_names"] == list(columns) for index in existing)
+
+
+def create_index(connection, table, name, columns, unique=False):
+    # Build an index on an existing table. In a TRANSACTIONAL = False
+    # migration Postgres builds it CONCURRENTLY, so writes to the table carry
+    # on meanwhile; inside a transaction, where CONCURRENTLY is refused, and
+    # on SQLite, which has no online variant, it is a plain build.
+    if has_index(connection, table, columns):
+        return False
+
+    online = connection.dialect.name == "postgresql" and \
+        connection.get_execution_options().get(
+            "isolation_level") == "AUTOCOMMIT"
+    concurrently = " CONCURRENTLY" if online else ""
+    quote = connection.dialect.identifier_preparer.quote
+    connection.exec_driver_sql(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX{concurrently} "
+        f"{quote(name)} ON {quote(table)} "
+        f"({', '.join(quote(column) for column in columns)})"
+    )
+    return True
+
+
+def create_model_index(connection, index):
+    # Build one of the sa.Index objects declared in the models
+    return create_index(connection, index.table.name, index.name,
+                        [column.name for column in index.columns],
+                        unique=index.unique)
+
+
+def delete_duplicates(connection, table, columns):
+    # Keep the oldest row (lowest id) of every group sharing `columns`
+    survivors = (
+        sa.select(sa.func.min(table.c.id))
+        .group_by(*(table.c[column] for column in columns))
+        .scalar_subquery()
+    )
+    return connection.execute(
+        table.delete().where(table.c.id.not_in(survivors))
+    ).rowcount
@@ -0,0 +1,97 @@
+import base64
+import json
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import current_app, jsonify, request, url_for
+from marshmallow import ValidationError
+
+from services.serializers import dump
+
+
+def page_limit():
+    # Requested page size, clamped to [1, PAGE_MAX_LIMIT]
+    limit = request.args.get("limit", type=int)
+
+    if limit is None:
+        return current_app.config["PAGE_DEFAULT_LIMIT"]
+
+    return max(1, min(limit, current_app.config["PAGE_MAX_LIMIT"]))
+
+
+def encode_cursor(values):
+    payload = json.dumps([
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ], separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, keys):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(token)
+
+        return [
+            datetime.fromisoformat(value)
+            if key.type.python_type is datetime else key.type.python_type(value)
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, TypeError):
+        raise ValidationError("Invalid pagination cursor", "cursor")
+
+
+def _after(keys, values):
+    # Keyset predicate "(k1, k2, ...) > (v1, v2, ...)", spelled out with
+    # AND/OR so it works on every backend
+    key, *rest = keys
+    value, *rest_values = values
+
+    if not rest:
+        return key > value
+
+    return sa.or_(key > value,
+                  sa.and_(key == value, _after(rest, rest_values)))
+
+
+def paginate(query, *keys):
+    # Fetch one page of `query` ordered by the unique key tuple `keys`.
+    # Returns the rows and the cursor of the next page (None on the last).
+    limit = page_limit()
+    cursor = request.args.get("cursor")
+
+    if cursor:
+        query = query.filter(_after(keys, decode_cursor(cursor, keys)))
+
+    rows = query.order_by(*keys).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, key.key) for key in keys])
+
+
+def paginated_response(query, schema, *keys):
+    # Dump one page with `schema` (a many=True schema) and advertise the next
+    # page through a Link header so the response body stays a plain list
+    rows, next_cursor = paginate(query, *keys)
+    response = jsonify(dump(schema, rows))
+    return link_next_page(response, next_cursor)
+
+
+def link_next_page(response, next_cursor):
+    # Point the Link header at the same view with `cursor` set
+    if next_cursor:
+        args = request.args.to_dict()
+        args.update(request.view_args or {})
+        args["cursor"] = next_cursor
+        next_url = url_for(request.endpoint, **args)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+    return response
@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from services.async_mode import acquire, offload, wait
+from services.instrumentation import timed_phase
+
+
+class PasswordServiceBusy(RuntimeError):
+    pass
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+def cost_of(password_hash):
+    # "$2b$12$<salt+digest>" -> 12
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    # Runs bcrypt on a bounded process pool so a burst of logins cannot pin
+    # every request thread on CPU. At most PASSWORD_WORKERS hashes run at once
+    # and PASSWORD_QUEUE_SIZE more may wait; beyond that callers block for up
+    # to PASSWORD_QUEUE_TIMEOUT seconds and then get PasswordServiceBusy.
+    # PASSWORD_WORKERS = 0 hashes inline on the calling thread (on the thread
+    # pool in ASYNC_MODE, to keep the event loop free).
+
+    def __init__(self):
+        self.rounds = 12
+        self.workers = 0
+        self.timeout = None
+        self._slots = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config["BCRYPT_LOG_ROUNDS"]
+        self.workers = app.config["PASSWORD_WORKERS"]
+        self.timeout = app.config["PASSWORD_QUEUE_TIMEOUT"]
+        self._slots = threading.BoundedSemaphore(
+            self.workers + app.config["PASSWORD_QUEUE_SIZE"]
+        )
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, fn, *args):
+        # Queueing for a worker counts towards the request's bcrypt time too
+        with timed_phase("bcrypt"):
+            if not self.workers:
+                return offload(fn, *args)
+
+            if not acquire(self._slots, self.timeout):
+                raise PasswordServiceBusy(
+                    "Too many password operations queued")
+
+            try:
+                return wait(self._pool().submit(fn, *args))
+            finally:
+                self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password.encode("utf-8"), self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run(_check, password.encode("utf-8"),
+                         password_hash.encode("utf-8"))
+
+    def needs_rehash(self, password_hash):
+        return cost_of(password_hash) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+passwords = PasswordHasher()
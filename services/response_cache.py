@@ -0,0 +1,393 @@
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context, request
+from werkzeug.http import unquote_etag
+
+from services.compression import compress, encoding_for, variant_etag
+from services.lru import TTLCache
+from services.streaming import wants_stream
+
+# Cached responses are tagged with the dependency tokens they were built
+# from, together with each token's version at the time. Commits touching a
+# row bump the versions of the tokens that row feeds:
+#
+#   tag:<id>    the tag, its entry_tags rows and every entry carrying it
+#   tags        any tag:<id> (GET /tags/ lists them all)
+#   entry:<id>  the entry, its comments, likes and tags
+#   diaries     updates/deletes of any diary (title, privacy are nested)
+#   users       updates/deletes of any user (email is nested)
+#   *           everything, for Core bulk writes (see touch_all)
+#
+# A hit is only served while all of its versions are still current. Versions
+# are read before the view queries the database, so a response built while a
+# write commits is stored under the old versions and never served.
+GLOBAL_TOKENS = ("*", "diaries", "users")
+
+
+class MemoryBackend:
+    # Per-process LRU: only correct when a single process serves writes
+
+    def __init__(self, maxsize):
+        self._entries = TTLCache(maxsize)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+    def versions(self, tokens):
+        with self._lock:
+            return {token: self._versions.get(token, 0) for token in tokens}
+
+    def bump(self, tokens):
+        with self._lock:
+            for token in tokens:
+                self._versions[token] = self._versions.get(token, 0) + 1
+
+
+class FileSystemBackend:
+    # One pickle per key under `path`, shared by every process on the host.
+    # A token's version is the size of its file, bumped by appending a byte:
+    # O_APPEND writes are atomic, so concurrent bumps are never lost.
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "versions"), exist_ok=True)
+
+    def _file(self, *parts):
+        return os.path.join(self.path, *parts)
+
+    @staticmethod
+    def _digest(value):
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        try:
+            with open(self._file(self._digest(key)), "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        target = self._file(self._digest(key))
+        temporary = f"{target}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "wb") as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, target)
+
+    def versions(self, tokens):
+        found = {}
+        for token in tokens:
+            try:
+                found[token] = os.stat(
+                    self._file("versions", self._digest(token))).st_size
+            except FileNotFoundError:
+                found[token] = 0
+        return found
+
+    def bump(self, tokens):
+        for token in tokens:
+            fd = os.open(self._file("versions", self._digest(token)),
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, b".")
+            finally:
+                os.close(fd)
+
+
+class SQLiteBackend:
+    # A SQLite file shared by every process on the host; keeps the
+    # `maxsize` most recently stored responses
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_versions "
+                "(token TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._connection() as connection:
+            # REPLACE gives the row a new, highest rowid: the oldest rows
+            # are always the ones with the lowest rowids
+            cursor = connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value) "
+                "VALUES (?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            connection.execute(
+                "DELETE FROM cache_entries WHERE rowid <= ?",
+                (cursor.lastrowid - self.maxsize,))
+
+    def versions(self, tokens):
+        tokens = list(tokens)
+        placeholders = ", ".join("?" * len(tokens))
+        found = dict(self._connection().execute(
+            f"SELECT token, version FROM cache_versions "
+            f"WHERE token IN ({placeholders})", tokens))
+        return {token: found.get(token, 0) for token in tokens}
+
+    def bump(self, tokens):
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO cache_versions (token, version) VALUES (?, 1) "
+                "ON CONFLICT (token) DO UPDATE SET version = version + 1",
+                [(token,) for token in tokens])
+
+
+def _backend():
+    if has_app_context():
+        return current_app.extensions.get("response_cache")
+    return None
+
+
+def _etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _respond(backend, key, entry):
+    # With compression on, the encoded body is stored next to the plain one
+    # the first time it is asked for and served as is afterwards
+    headers = dict(entry["headers"])
+    encoding = encoding_for(entry["body"], headers.get("Content-Type"))
+    etag = entry["etag"] if encoding is None else \
+        variant_etag(entry["etag"], encoding)
+
+    # If-None-Match uses the weak comparison
+    if request.if_none_match.contains_weak(unquote_etag(etag)[0]):
+        response = current_app.response_class(status=304)
+    else:
+        body = entry["body"]
+        if encoding is not None:
+            encoded = entry.setdefault("encoded", {})
+            if encoding not in encoded:
+                encoded[encoding] = compress(body, encoding)
+                backend.set(key, entry)
+            body = encoded[encoding]
+            headers["Content-Encoding"] = encoding
+
+        response = current_app.response_class(body, status=200)
+        for name, value in headers.items():
+            response.headers[name] = value
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def cached(*dependencies):
+    # Cache the 200 responses of a public GET view. `dependencies` are token
+    # templates formatted with the view arguments, e.g. "tag:{tag_id}".
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = _backend()
+            if backend is None or wants_stream():
+                return view(*args, **kwargs)
+
+            tokens = GLOBAL_TOKENS + tuple(
+                dependency.format(**kwargs) for dependency in dependencies)
+            key = request.full_path
+            versions = backend.versions(tokens)
+
+            entry = backend.get(key)
+            if entry is not None and entry["versions"] == versions:
+                return _respond(backend, key, entry)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            body = response.get_data()
+            entry = {
+                "versions": versions,
+                "etag": _etag(body),
+                "body": body,
+                "headers": [(name, value)
+                            for name, value in response.headers.items()
+                            if name not in ("Content-Length", "ETag")],
+            }
+            backend.set(key, entry)
+            return _respond(backend, key, entry)
+
+        return wrapper
+
+    return decorator
+
+
+def _entry_tokens(session, entry_ids):
+    # entry:<id> plus tag:<id> of every tag the entries carry
+    from models.entrytags import EntryTag
+
+    entry_ids = {entry_id for entry_id in entry_ids if entry_id is not None}
+    if not entry_ids:
+        return set()
+
+    table = EntryTag.__table__
+    tag_ids = session.connection().execute(
+        sa.select(table.c.tag_id).where(table.c.entry_id.in_(entry_ids))
+    ).scalars()
+    return {f"entry:{entry_id}" for entry_id in entry_ids} | \
+        {f"tag:{tag_id}" for tag_id in tag_ids}
+
+
+def _history_values(instance, attribute):
+    # Current and previous values of a column attribute
+    history = sa.inspect(instance).attrs[attribute].history
+    return set(history.added or ()) | set(history.deleted or ()) | \
+        set(history.unchanged or ())
+
+
+def _tagged_entry_ids(session, tag_id):
+    from models.entrytags import EntryTag
+
+    table = EntryTag.__table__
+    return set(session.connection().execute(
+        sa.select(table.c.entry_id).where(table.c.tag_id == tag_id)
+    ).scalars())
+
+
+def _collect_tokens(session, flush_context, instances):
+    from models import Comment, Diary, Entry, EntryTag, Like, Tag, User
+
+    tokens = set()
+    entry_ids = set()
+
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        if isinstance(instance, Tag):
+            tokens.add("tags")
+            if instance.id is not None:
+                tokens.add(f"tag:{instance.id}")
+            if instance not in session.new:
+                # a rename or delete changes every entry nesting the tag,
+                # and so every response nesting one of those entries
+                entry_ids |= _tagged_entry_ids(session, instance.id)
+            history = sa.inspect(instance).attrs.entries.history
+            entry_ids |= {entry.id for entry in
+                          [*history.added, *history.deleted]}
+        elif isinstance(instance, Entry):
+            entry_ids.add(instance.id)
+            history = sa.inspect(instance).attrs.tags.history
+            tokens |= {f"tag:{tag.id}" for tag in
+                       [*history.added, *history.deleted]
+                       if tag.id is not None}
+        elif isinstance(instance, (Comment, Like)):
+            entry_ids |= _history_values(instance, "entry_id")
+        elif isinstance(instance, EntryTag):
+            entry_ids |= _history_values(instance, "entry_id")
+            tokens |= {f"tag:{tag_id}" for tag_id in
+                       _history_values(instance, "tag_id")}
+        elif isinstance(instance, (Diary, User)) and \
+                instance not in session.new:
+            # new diaries and users cannot be nested in a cached response
+            tokens.add("diaries" if isinstance(instance, Diary) else "users")
+
+    tokens |= _entry_tokens(session, entry_ids)
+    if any(token.startswith("tag:") for token in tokens):
+        tokens.add("tags")
+
+    session.info.setdefault("response_cache_tokens", set()).update(tokens)
+
+
+def _bump_tokens(session):
+    tokens = session.info.pop("response_cache_tokens", None)
+    backend = _backend()
+    if tokens and backend is not None:
+        backend.bump(tokens)
+
+
+def _discard_tokens(session):
+    session.info.pop("response_cache_tokens", None)
+
+
+def invalidate_entries(session, entry_ids):
+    # For Core writes through `session`, which _collect_tokens never sees:
+    # the entries' tokens are bumped when the session commits
+    if _backend() is None:
+        return
+
+    tokens = _entry_tokens(session, entry_ids)
+    if tokens:
+        tokens.add("tags")
+    session.info.setdefault("response_cache_tokens", set()).update(tokens)
+
+
+def invalidate(session, *tokens):
+    # touch(*tokens) once `session` commits
+    if _backend() is not None:
+        session.info.setdefault("response_cache_tokens", set()).update(tokens)
+
+
+def invalidate_all(session):
+    invalidate(session, "*")
+
+
+def touch(*tokens):
+    # Invalidate after writes that bypass the ORM, once they are committed
+    backend = _backend()
+    if backend is not None and tokens:
+        backend.bump(tokens)
+
+
+def touch_all():
+    touch("*")
+
+
+def init_response_cache(app):
+    # Opt-in with RESPONSE_CACHE=memory|filesystem|sqlite
+    kind = app.config["RESPONSE_CACHE"]
+    if not kind:
+        return
+
+    path = app.config["RESPONSE_CACHE_PATH"]
+    size = app.config["RESPONSE_CACHE_SIZE"]
+
+    if kind == "memory":
+        backend = MemoryBackend(size)
+    elif kind == "filesystem":
+        backend = FileSystemBackend(path or os.path.join(
+            app.instance_path, "response-cache"))
+    elif kind == "sqlite":
+        if not path:
+            os.makedirs(app.instance_path, exist_ok=True)
+        backend = SQLiteBackend(path or os.path.join(
+            app.instance_path, "response-cache.db"), size)
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE backend {kind!r}")
+
+    app.extensions["response_cache"] = backend
+
+    for identifier, fn in (("before_flush", _collect_tokens),
+                           ("after_commit", _bump_tokens),
+                           ("after_rollback", _discard_tokens)):
+        if not sa.event.contains(sa.orm.Session, identifier, fn):
+            sa.event.listen(sa.orm.Session, identifier, fn)
@@ -0,0 +1,50 @@
+import functools
+
+import sqlalchemy as sa
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+
+# Bind key of the read replica in SQLALCHEMY_BINDS
+REPLICA = "replica"
+
+
+class RoutingSession(Session):
+    # Sends the queries of views marked with read_replica to the replica
+    # bind. Flushes, and every query after the request's first flush or
+    # commit, go to the primary so a request always reads its own writes.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reads_from_replica():
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+def _reads_from_replica():
+    return (has_request_context() and g.get("read_replica", False)
+            and not g.get("primary_only", False))
+
+
+def read_replica(view):
+    # Let the reads of a GET view be served by the replica, when configured
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def _stick_to_primary(session, *args):
+    if has_request_context():
+        g.primary_only = True
+
+
+def init_routing(app):
+    for identifier in ("after_flush", "after_commit"):
+        if not sa.event.contains(RoutingSession, identifier,
+                                 _stick_to_primary):
+            sa.event.listen(RoutingSession, identifier, _stick_to_primary)
@@ -0,0 +1,153 @@
+import sqlalchemy as sa
+
+from models.diaries import Diary, PrivacyOptions
+from models.entries import Entry
+
+# SQLite keeps a standalone FTS5 table whose rowid is the entry id, kept in
+# sync by the mapper events below. Postgres needs no side table: a GIN index
+# over to_tsvector(content) is maintained by the database itself.
+FTS_TABLE = "entries_fts"
+TSV_INDEX = "ix_entries_content_tsv"
+TSV_CONFIG = sa.literal_column("'english'")
+
+fts = sa.table(FTS_TABLE, sa.column("rowid"), sa.column("content"))
+
+
+def create_index(connection):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(content, tokenize='porter unicode61')"
+        )
+    elif connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS {TSV_INDEX} ON entries "
+            f"USING GIN (to_tsvector('english', content))"
+        )
+
+
+def rebuild_index(connection):
+    # Re-populate the SQLite FTS table from scratch, e.g. after bulk inserts
+    # that bypassed the ORM events
+    create_index(connection)
+
+    if connection.dialect.name == "sqlite":
+        connection.execute(fts.delete())
+        connection.execute(
+            fts.insert().from_select(
+                ["rowid", "content"], sa.select(Entry.id, Entry.content)
+            )
+        )
+
+
+def index_entries(connection, entries):
+    # Add (id, content) pairs of entries inserted with Core, which skip the
+    # mapper events below
+    if connection.dialect.name == "sqlite" and entries:
+        connection.execute(fts.insert(), [
+            {"rowid": entry_id, "content": content}
+            for entry_id, content in entries
+        ])
+
+
+def unindex_entries(connection, entry_ids):
+    # Drop entries deleted with Core, which skip the mapper events below
+    if connection.dialect.name == "sqlite" and entry_ids:
+        connection.execute(fts.delete().where(fts.c.rowid.in_(entry_ids)))
+
+
+def _create_index(target, connection, **kwargs):
+    create_index(connection)
+
+
+def _drop_index(target, connection, **kwargs):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _index_entry(mapper, connection, entry):
+    if connection.dialect.name == "sqlite":
+        connection.execute(
+            fts.insert().values(rowid=entry.id, content=entry.content)
+        )
+
+
+def _reindex_entry(mapper, connection, entry):
+    if connection.dialect.name != "sqlite":
+        return
+
+    if sa.inspect(entry).attrs.content.history.has_changes():
+        connection.execute(
+            fts.update().where(fts.c.rowid == entry.id)
+            .values(content=entry.content)
+        )
+
+
+def _unindex_entry(mapper, connection, entry):
+    if connection.dialect.name == "sqlite":
+        connection.execute(fts.delete().where(fts.c.rowid == entry.id))
+
+
+def init_search_index(app):
+    listeners = [
+        (Entry.__table__, "after_create", _create_index),
+        (Entry.__table__, "after_drop", _drop_index),
+        (Entry, "after_insert", _index_entry),
+        (Entry, "after_update", _reindex_entry),
+        (Entry, "after_delete", _unindex_entry),
+    ]
+
+    for target, identifier, fn in listeners:
+        if not sa.event.contains(target, identifier, fn):
+            sa.event.listen(target, identifier, fn)
+
+
+def _match_expression(terms):
+    # Quote every word so user input can never be parsed as FTS5 syntax;
+    # space separated phrases are ANDed together
+    return " ".join('"' + word.replace('"', '""') + '"'
+                    for word in terms.split())
+
+
+def search_entries(query, user, terms=None, date_from=None, date_to=None):
+    # Restrict `query` (over Entry) to the entries `user` may read that match
+    # the search terms and date range, best match first
+    query = query.join(Entry.diary).filter(
+        sa.or_(Diary.user_id == user.id,
+               Diary.privacy == PrivacyOptions.PUBLIC)
+    )
+
+    if date_from is not None:
+        query = query.filter(Entry.date_created >= date_from)
+
+    if date_to is not None:
+        query = query.filter(Entry.date_created < date_to)
+
+    if not terms or not terms.split():
+        return query.order_by(Entry.date_created.desc(), Entry.id.desc())
+
+    dialect = query.session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        match = sa.literal_column(FTS_TABLE).op("MATCH")(
+            _match_expression(terms)
+        )
+        rank = sa.func.bm25(sa.literal_column(FTS_TABLE))
+        return (
+            query.join(fts, fts.c.rowid == Entry.id)
+            .filter(match)
+            .order_by(rank, Entry.id)
+        )
+
+    if dialect == "postgresql":
+        vector = sa.func.to_tsvector(TSV_CONFIG, Entry.content)
+        tsquery = sa.func.plainto_tsquery(TSV_CONFIG, terms)
+        return (
+            query.filter(vector.op("@@")(tsquery))
+            .order_by(sa.func.ts_rank(vector, tsquery).desc(), Entry.id)
+        )
+
+    # Other backends fall back to a substring scan
+    for word in terms.split():
+        query = query.filter(Entry.content.contains(word, autoescape=True))
+    return query.order_by(Entry.date_created.desc(), Entry.id.desc())
@@ -0,0 +1,216 @@
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import sqlalchemy as sa
+
+from models.diaries import PrivacyOptions
+
+WORDS = (
+    "today morning evening walk coffee work friend family dinner rain sun "
+    "book film music garden train city quiet tired happy busy plan trip "
+    "letter dream memory school project meeting weekend holiday river park "
+    "kitchen market bread tea late early long short new old little big "
+    "wrote read cooked visited called missed remembered finished started"
+).split()
+
+# Rows generated per unit of work handed to a worker
+USERS_PER_CHUNK = 50
+
+
+def zipf_weights(n, s=1.1):
+    # Cumulative weights of ranks 0..n-1 under a Zipf(s) law, for
+    # random.choices(cum_weights=...)
+    return list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+def _text(rng, mu, sigma):
+    # Log-normal word count: most entries are short, a few are very long
+    length = max(1, int(rng.lognormvariate(mu, sigma)))
+    return " ".join(rng.choices(WORDS, k=length)).capitalize() + "."
+
+
+def generate_chunk(task):
+    # Build every row owned by users [first, last) of the plan. Ids of users,
+    # diaries and entries are computed from their position so chunks can be
+    # generated independently and in parallel.
+    plan, first, last = task
+    rng = random.Random(plan["seed"] * 1_000_003 + first)
+
+    diaries_per_user = plan["diaries_per_user"]
+    entries_per_diary = plan["entries_per_diary"]
+    user_ids = range(plan["first_user_id"],
+                     plan["first_user_id"] + plan["users"])
+    tag_ids = range(plan["first_tag_id"], plan["first_tag_id"] + plan["tags"])
+    like_counts = range(plan["max_likes"] + 1)
+    comment_counts = range(plan["max_comments"] + 1)
+    like_weights = zipf_weights(len(like_counts))
+    comment_weights = zipf_weights(len(comment_counts))
+    tag_weights = zipf_weights(len(tag_ids))
+    start = plan["start"]
+    span = plan["days"] * 86400
+
+    rows = {"diaries": [], "entries": [], "entry_tags": [], "likes": [],
+            "comments": []}
+
+    for user_index in range(first, last):
+        user_id = plan["first_user_id"] + user_index
+
+        for diary_index in range(diaries_per_user):
+            diary_number = user_index * diaries_per_user + diary_index
+            diary_id = plan["first_diary_id"] + diary_number
+            diary_created = start + timedelta(seconds=rng.randrange(span))
+            rows["diaries"].append({
+                "id": diary_id,
+                "title": _text(rng, 1, 0.5)[:255],
+                "privacy": (PrivacyOptions.PUBLIC
+                            if rng.random() < plan["public_ratio"]
+                            else PrivacyOptions.PRIVATE).name,
+                "date_created": diary_created,
+                "user_id": user_id,
+            })
+
+            for entry_index in range(entries_per_diary):
+                entry_id = (plan["first_entry_id"]
+                            + diary_number * entries_per_diary + entry_index)
+                entry_created = diary_created + timedelta(
+                    seconds=rng.randrange(span))
+
+                likers = rng.sample(user_ids, min(
+                    len(user_ids),
+                    rng.choices(like_counts, cum_weights=like_weights)[0]
+                ))
+                comment_count = rng.choices(
+                    comment_counts, cum_weights=comment_weights)[0]
+                tags = set(rng.choices(
+                    tag_ids, cum_weights=tag_weights,
+                    k=rng.randrange(plan["max_tags_per_entry"] + 1)
+                )) if tag_ids else set()
+
+                rows["entries"].append({
+                    "id": entry_id,
+                    "content": _text(rng, 3.5, 0.9),
+                    "date_created": entry_created,
+                    "diary_id": diary_id,
+                    "like_count": len(likers),
+                    "comment_count": comment_count,
+                })
+                rows["entry_tags"].extend(
+                    {"entry_id": entry_id, "tag_id": tag_id}
+                    for tag_id in tags
+                )
+                rows["likes"].extend(
+                    {"user_id": liker, "entry_id": entry_id,
+                     "date_created": entry_created}
+                    for liker in likers
+                )
+                rows["comments"].extend(
+                    {"content": _text(rng, 2, 0.7),
+                     "user_id": rng.choice(user_ids),
+                     "entry_id": entry_id,
+                     "date_created": entry_created}
+                    for _ in range(comment_count)
+                )
+
+    return rows
+
+
+def _next_id(connection, table):
+    return (connection.execute(
+        sa.select(sa.func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _advance_sequences(connection, tables):
+    # The rows above carry explicit ids, which Postgres sequences don't
+    # see; move them past the new ids so the next ORM insert gets a free
+    # one. SQLite takes max(id) + 1 by itself.
+    if connection.dialect.name != "postgresql":
+        return
+
+    for table in tables:
+        connection.execute(sa.select(sa.func.setval(
+            sa.func.pg_get_serial_sequence(table.name, "id"),
+            sa.select(sa.func.max(table.c.id)).scalar_subquery())))
+
+
+def _insert(connection, table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        connection.execute(table.insert(), rows[start:start + batch_size])
+
+
+def seed_bulk(engine, metadata, plan, password_hash, workers=0,
+              batch_size=10000, progress=print):
+    tables = metadata.tables
+    started = time.perf_counter()
+
+    with engine.begin() as connection:
+        plan["first_user_id"] = _next_id(connection, tables["users"])
+        plan["first_diary_id"] = _next_id(connection, tables["diaries"])
+        plan["first_entry_id"] = _next_id(connection, tables["entries"])
+        plan["first_tag_id"] = _next_id(connection, tables["tags"])
+
+        # Users and tags go in first so every later row can reference them
+        _insert(connection, tables["users"], [
+            {"id": plan["first_user_id"] + index,
+             "email": f"user{plan['first_user_id'] + index}@example.com",
+             "password": password_hash}
+            for index in range(plan["users"])
+        ], batch_size)
+        _insert(connection, tables["tags"], [
+            {"id": plan["first_tag_id"] + index,
+             "name": f"tag{plan['first_tag_id'] + index}"}
+            for index in range(plan["tags"])
+        ], batch_size)
+
+    tasks = [
+        (plan, first, min(first + USERS_PER_CHUNK, plan["users"]))
+        for first in range(0, plan["users"], USERS_PER_CHUNK)
+    ]
+    totals = dict.fromkeys(
+        ["diaries", "entries", "entry_tags", "likes", "comments"], 0)
+
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        chunks = (pool.imap(generate_chunk, tasks) if pool
+                  else map(generate_chunk, tasks))
+
+        for done, rows in enumerate(chunks, start=1):
+            with engine.begin() as connection:
+                for name in totals:
+                    _insert(connection, tables[name], rows[name], batch_size)
+                    totals[name] += len(rows[name])
+
+            if done % 20 == 0 or done == len(tasks):
+                elapsed = time.perf_counter() - started
+                progress(f"{done}/{len(tasks)} chunks, "
+                         f"{totals['entries']} entries, "
+                         f"{totals['entries'] / elapsed:.0f} entries/s")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    with engine.begin() as connection:
+        _advance_sequences(connection, [tables[name] for name in (
+            "users", "tags", "diaries", "entries")])
+
+    return totals
+
+
+def make_plan(users, diaries_per_user, entries_per_diary, tags, max_likes,
+              max_comments, max_tags_per_entry, public_ratio, days, seed):
+    return {
+        "users": users,
+        "diaries_per_user": diaries_per_user,
+        "entries_per_diary": entries_per_diary,
+        "tags": tags,
+        "max_likes": max_likes,
+        "max_comments": max_comments,
+        "max_tags_per_entry": max_tags_per_entry,
+        "public_ratio": public_ratio,
+        "days": days,
+        "seed": seed,
+        "start": datetime.utcnow() - timedelta(days=2 * days),
+    }
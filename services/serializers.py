@@ -0,0 +1,179 @@
+import marshmallow
+from flask import current_app, has_app_context
+from marshmallow import fields, utils
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+
+from services.async_mode import in_event_loop, offload
+from services.instrumentation import timed_phase
+
+# marshmallow walks every field of every row through Field.serialize,
+# get_value and _serialize. For a schema tree that is fixed once the schema
+# classes are imported that dispatch can be done ahead of time: compiled()
+# generates one plain function per (nested) schema that reads the attributes
+# directly and builds the dict in dump_fields order, e.g. for TagSchema with
+# exclude=("entries",):
+#
+#   def dump_TagSchema(obj):
+#       v0 = obj.id
+#       v1 = obj.name
+#       return {
+#           "id": None if v0 is None else f_1(v0),
+#           "name": None if v1 is None else text(v1),
+#       }
+#
+# Int, String and ISO DateTime fields and Nested schemas are inlined, any
+# other field is called through its own _serialize. The output is identical
+# to schema.dump(), see benchmarks/bench_serializers.py --check.
+#
+# With native=True datetimes of ISO DateTime fields and the values of fields
+# flagged `json_native` are passed through unconverted, for a JSON provider
+# that encodes them itself (services.json_provider). The JSON text is the
+# same.
+#
+# The functions only need attribute access, so they dump ORM rows as well as
+# Core result rows whose columns are named like the schema's fields. Unlike
+# schema.dump() an attribute missing from the row raises AttributeError
+# instead of dropping the key.
+
+# Compiled dump functions of the top-level schemas
+_compiled = {}
+
+
+def _text(value):
+    return value if type(value) is str else utils.ensure_text_type(value)
+
+
+def _compilable(schema):
+    # Schemas keep their own dump when compiling them would change the
+    # result: dump hooks, custom attribute lookup or dotted attributes
+    return (not schema._has_processors(PRE_DUMP)
+            and not schema._has_processors(POST_DUMP)
+            and type(schema).get_attribute is marshmallow.Schema.get_attribute
+            and all(type(field).serialize is fields.Field.serialize
+                    and type(field).get_value is fields.Field.get_value
+                    and field._CHECK_ATTRIBUTE
+                    and "." not in (field.attribute or name)
+                    for name, field in schema.dump_fields.items()))
+
+
+def _field_expression(attr_name, field, value, namespace, native):
+    # Expression serializing the local `value` of the field, and whether
+    # it still has to be guarded against None
+    kind = type(field)
+    name = f"f_{len(namespace)}"
+
+    if native and getattr(field, "json_native", False):
+        return value, False
+
+    if isinstance(field, fields.Nested) \
+            and kind._serialize is fields.Nested._serialize:
+        schema = field.schema
+        namespace[name] = _single(schema, native)
+        if schema.many or field.many:
+            return f"[{name}(item) for item in {value}]", True
+        return f"{name}({value})", True
+
+    if isinstance(field, fields.Number) \
+            and kind._serialize is fields.Number._serialize \
+            and kind._format_num is fields.Number._format_num \
+            and not field.as_string:
+        namespace[name] = field.num_type
+        return f"{name}({value})", True
+
+    if isinstance(field, fields.String) \
+            and kind._serialize is fields.String._serialize:
+        return f"text({value})", True
+
+    if isinstance(field, fields.DateTime) \
+            and kind._serialize is fields.DateTime._serialize:
+        data_format = field.format or field.DEFAULT_FORMAT
+        function = field.SERIALIZATION_FUNCS.get(data_format)
+        if function is utils.isoformat and native:
+            return value, False
+        if function is utils.isoformat:
+            return f"{value}.isoformat()", True
+        if function is not None:
+            namespace[name] = function
+            return f"{name}({value})", True
+        return f"{value}.strftime({data_format!r})", True
+
+    # Anything else goes through the field itself, minus get_value
+    namespace[name] = field
+    return f"{name}._serialize({value}, {attr_name!r}, obj)", False
+
+
+def _generate(schema, native):
+    namespace = {"text": _text}
+    lines = [f"def dump_{type(schema).__name__}(obj):"]
+    items = []
+
+    for index, (attr_name, field) in enumerate(schema.dump_fields.items()):
+        attribute = field.attribute or attr_name
+        key = field.data_key if field.data_key is not None else attr_name
+        value = f"v{index}"
+
+        if attribute.isidentifier():
+            lines.append(f"    {value} = obj.{attribute}")
+        else:
+            lines.append(f"    {value} = getattr(obj, {attribute!r})")
+
+        expression, guard = _field_expression(attr_name, field, value,
+                                             namespace, native)
+        if guard:
+            expression = f"None if {value} is None else {expression}"
+        items.append(f"{key!r}: {expression}")
+
+    lines.append("    return {")
+    lines.extend(f"        {item}," for item in items)
+    lines.append("    }")
+
+    source = "\n".join(lines) + "\n"
+    exec(compile(source, f"<serializer {type(schema).__name__}>", "exec"),
+         namespace)
+    function = namespace[f"dump_{type(schema).__name__}"]
+    function.source = source
+    return function
+
+
+def _single(schema, native):
+    # Function dumping one object the way `schema` would
+    if not _compilable(schema):
+        return lambda obj: schema.dump(obj, many=False)
+    return _generate(schema, native)
+
+
+def compiled(schema, native=False):
+    # Compiled equivalent of `schema.dump`, honouring schema.many. Built on
+    # first use, once all schema classes are registered, and kept per schema.
+    function = _compiled.get((schema, native))
+
+    if function is None:
+        single = _single(schema, native)
+        if schema.many:
+            def function(objs):
+                return [single(obj) for obj in objs]
+        else:
+            function = single
+        _compiled[schema, native] = function
+
+    return function
+
+
+def native_values():
+    # Whether the app's JSON provider encodes datetimes and enums itself
+    return has_app_context() and getattr(current_app.json, "native_values",
+                                         False)
+
+
+def dump(schema, obj):
+    # Drop-in for schema.dump(obj) on the hot paths, ahead of jsonify. In
+    # ASYNC_MODE long lists are dumped on the loop's thread pool, so the
+    # other requests keep being served meanwhile; the rows must be loaded
+    # already (the hot paths use eager loaders), as a lazy load off the loop
+    # has no greenlet to wait in.
+    function = compiled(schema, native_values())
+    with timed_phase("ser"):
+        if schema.many and in_event_loop() and \
+                len(obj) >= current_app.config["ASYNC_OFFLOAD_ITEMS"]:
+            return offload(function, obj)
+        return function(obj)
@@ -0,0 +1,138 @@
+import contextvars
+import functools
+import threading
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+from services.async_mode import acquire, sleep
+
+# SQLite allows one writer at a time. In production mode:
+#  - every connection runs in WAL mode, so readers never block the writer
+#    and the writer never blocks readers;
+#  - pysqlite's implicit transaction handling is replaced by our own BEGIN,
+#    so a request marked as writing (see write_transaction) takes the write
+#    lock up front with BEGIN IMMEDIATE instead of failing when it upgrades
+#    a read transaction half way through;
+#  - writers of this process queue on a lock rather than spinning on
+#    busy_timeout, and a "database is locked" from another process is
+#    retried with backoff.
+# The waits go through services.async_mode, so in ASYNC_MODE a queued writer
+# yields to the event loop instead of blocking the writer it waits for.
+
+# Messages of the OperationalErrors worth retrying
+LOCKED = ("database is locked", "database is busy")
+
+_writer = threading.Lock()
+# Per thread, and per request greenlet in ASYNC_MODE
+_write_pending = contextvars.ContextVar("write_pending", default=False)
+_settings = {"retries": 3}
+
+
+def _pragmas(app):
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": app.config["SQLITE_MMAP_SIZE"],
+        "cache_size": app.config["SQLITE_CACHE_SIZE"],
+        "busy_timeout": app.config["SQLITE_BUSY_TIMEOUT"],
+    }
+
+
+def _on_connect(pragmas):
+    def connect(dbapi_connection, connection_record):
+        # Stop pysqlite from issuing BEGIN itself, see _on_begin
+        dbapi_connection.isolation_level = None
+
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return connect
+
+
+def _on_begin(conn):
+    if conn.get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+        return
+
+    if not _write_pending.get():
+        conn.exec_driver_sql("BEGIN")
+        return
+
+    # Only the first transaction of a writing() block writes; reloading
+    # attributes after its commit is a plain read
+    _write_pending.set(False)
+    acquire(_writer)
+    try:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    except Exception:
+        _writer.release()
+        raise
+    conn.info["holds_writer"] = True
+
+
+def _on_end(conn):
+    if conn.info.pop("holds_writer", False):
+        _writer.release()
+
+
+def is_locked(error):
+    return isinstance(error, OperationalError) and any(
+        message in str(error.orig) for message in LOCKED)
+
+
+@contextmanager
+def writing():
+    # The next transaction begun on this thread takes the write lock up
+    # front. It is released on commit or rollback; views that return without
+    # committing release it when the app context tears the session down.
+    token = _write_pending.set(True)
+    try:
+        yield
+    finally:
+        _write_pending.reset(token)
+
+
+def write_transaction(view):
+    # Run a create/update/delete view on the single-writer path, retrying it
+    # while another process holds the database lock. Has no effect on other
+    # databases or when SQLITE_PRODUCTION is off.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from main import db
+
+        for attempt in range(_settings["retries"] + 1):
+            try:
+                with writing():
+                    return view(*args, **kwargs)
+            except OperationalError as e:
+                if not is_locked(e) or attempt == _settings["retries"]:
+                    raise
+                db.session.rollback()
+                sleep(0.05 * 2 ** attempt)
+
+    return wrapper
+
+
+def init_sqlite(app):
+    # Opt-in with SQLITE_PRODUCTION=1 (the default in production)
+    if not app.config.get("SQLITE_PRODUCTION"):
+        return
+
+    from main import db
+
+    _settings["retries"] = app.config["SQLITE_WRITE_RETRIES"]
+    connect = _on_connect(_pragmas(app))
+
+    with app.app_context():
+        engines = [engine for engine in db.engines.values()
+                   if engine.dialect.name == "sqlite"]
+
+    for engine in engines:
+        sa.event.listen(engine, "connect", connect)
+        for identifier, fn in (("begin", _on_begin), ("commit", _on_end),
+                               ("rollback", _on_end)):
+            if not sa.event.contains(engine, identifier, fn):
+                sa.event.listen(engine, identifier, fn)
@@ -0,0 +1,46 @@
+import threading
+
+
+def register_controllers(app):
+    from controllers import registered_controllers
+
+    for controller in registered_controllers:
+        app.register_blueprint(controller)
+
+
+class LazyBlueprints:
+    # WSGI middleware that imports and registers the controller blueprints
+    # (and with them the marshmallow schemas) right before the first request
+    # is dispatched, instead of while the app is being built
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.loaded:
+            return
+
+        with self._lock:
+            if not self.loaded:
+                register_controllers(self.app)
+                self.loaded = True
+
+    def __call__(self, environ, start_response):
+        self.load()
+        return self.wsgi_app(environ, start_response)
+
+
+def defer_controllers(app):
+    lazy = LazyBlueprints(app)
+    app.wsgi_app = lazy
+    app.extensions["lazy_blueprints"] = lazy
+
+
+def load_controllers(app):
+    # Make sure the routes are registered, e.g. before walking app.url_map
+    lazy = app.extensions.get("lazy_blueprints")
+    if lazy is not None:
+        lazy.load()
@@ -0,0 +1,30 @@
+from flask import current_app, request, stream_with_context
+
+from services.serializers import compiled, native_values
+
+NDJSON = "application/x-ndjson"
+
+
+def wants_stream():
+    # Streaming is opted into with "?stream=1" or "Accept: application/x-ndjson"
+    if request.args.get("stream") == "1":
+        return True
+
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    return best == NDJSON
+
+
+def stream_response(query, schema):
+    # Write one JSON document per row as newline-delimited JSON. Rows are
+    # fetched `STREAM_BATCH_SIZE` at a time with yield_per and dumped with the
+    # single-object `schema`, so memory stays flat whatever the result size.
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+    dump = compiled(schema, native_values())
+
+    def generate():
+        for row in query.yield_per(batch_size):
+            yield current_app.json.dumps(dump(row)) + "\n"
+
+    return current_app.response_class(
+        stream_with_context(generate()), mimetype=NDJSON
+    )
@@ -0,0 +1,203 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from models import Tag
+
+
+class ReloadingIndex(ABC):
+    # An in-memory structure built from the database by _build(), rebuilt
+    # once it is `ttl` seconds old and patched by apply() in between. State
+    # is replaced whole, so readers never take the lock, and the lock is
+    # never held across the reload query: in ASYNC_MODE requests share a
+    # thread, and one blocking on a lock whose holder waits for the database
+    # would stall all of them. Commits applied while a reload reads are
+    # patched onto the current state and replayed onto the reloaded one;
+    # _patch must be idempotent, as the reload may already have seen them.
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._state = self._build_empty()
+        self._loaded_at = None
+        # one list of changes per reload in progress
+        self._replays = []
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _build_empty(self):
+        # The state before the first load
+        pass
+
+    @abstractmethod
+    def _build(self, session):
+        # A new state read from the database
+        pass
+
+    @abstractmethod
+    def _patch(self, state, changes):
+        # A copy of `state` with the changes of one commit applied
+        pass
+
+    def _expired(self):
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.ttl
+
+    def load(self, session):
+        replay = []
+        with self._lock:
+            self._replays.append(replay)
+
+        try:
+            state = self._build(session)
+        except BaseException:
+            with self._lock:
+                self._replays.remove(replay)
+            raise
+
+        with self._lock:
+            self._replays.remove(replay)
+            for changes in replay:
+                state = self._patch(state, changes)
+            self._state = state
+            self._loaded_at = time.monotonic()
+
+    def _current(self, session):
+        if self._expired():
+            with self._lock:
+                # one caller reloads, the others keep the previous state
+                claimed = self._loaded_at is None or not self._reloading
+                self._reloading = True
+            if claimed:
+                try:
+                    self.load(session)
+                finally:
+                    self._reloading = False
+        return self._state
+
+    def apply(self, changes):
+        with self._lock:
+            for replay in self._replays:
+                replay.append(changes)
+            if self._loaded_at is not None:
+                self._state = self._patch(self._state, changes)
+
+
+# Tag names sorted by their casefolded form, so every tag starting with a
+# prefix is one bisect away.
+#
+# Commits in this process apply their tag inserts, renames and deletes right
+# away (collected at flush, applied on commit). Other processes' writes and
+# Core inserts (seed-bulk) are picked up by reloading the whole index once it
+# is TAG_INDEX_TTL seconds old; a reload is one query over "tags".
+
+
+def _sorted(tags):
+    # {id: name} -> (casefolded names, [(id, name)]) in the same order
+    ordered = sorted((name.casefold(), name, tag_id)
+                     for tag_id, name in tags.items())
+    return ([key for key, _, _ in ordered],
+            [(tag_id, name) for _, name, tag_id in ordered])
+
+
+class TagIndex(ReloadingIndex):
+
+    def _build_empty(self):
+        return [], []
+
+    def _build(self, session):
+        return _sorted(dict(session.execute(sa.select(Tag.id, Tag.name))
+                            .all()))
+
+    def _patch(self, state, changes):
+        # changes: {id: name, or None for a deleted tag}
+        tags = dict(state[1])
+        for tag_id, name in changes.items():
+            if name is None:
+                tags.pop(tag_id, None)
+            else:
+                tags[tag_id] = name
+        return _sorted(tags)
+
+    def suggest(self, session, prefix, limit):
+        # [(id, name)] of up to `limit` tags starting with `prefix`, ignoring
+        # case, in name order
+        keys, tags = self._current(session)
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(keys, prefix)
+
+        found = []
+        for key, tag in zip(keys[start:start + limit],
+                            tags[start:start + limit]):
+            if not key.startswith(prefix):
+                break
+            found.append(tag)
+        return found
+
+    def find(self, session, name):
+        # Id of the tag named exactly `name`, or None
+        keys, tags = self._current(session)
+        key = name.casefold()
+        index = bisect.bisect_left(keys, key)
+
+        while index < len(keys) and keys[index] == key:
+            tag_id, tag_name = tags[index]
+            if tag_name == name:
+                return tag_id
+            index += 1
+        return None
+
+
+def tag_index():
+    return current_app.extensions["tag_index"]
+
+
+def _after_flush(session, flush_context):
+    changes = {}
+
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        if not isinstance(instance, Tag):
+            continue
+        if instance in session.deleted:
+            changes[instance.id] = None
+        elif instance in session.new or \
+                sa.inspect(instance).attrs.name.history.has_changes():
+            changes[instance.id] = instance.name
+
+    if changes:
+        session.info.setdefault("tag_index_changes", {}).update(changes)
+
+
+def _after_commit(session):
+    changes = session.info.pop("tag_index_changes", None)
+    if changes and has_app_context():
+        index = current_app.extensions.get("tag_index")
+        if index is not None:
+            index.apply(changes)
+
+
+def _after_rollback(session):
+    session.info.pop("tag_index_changes", None)
+
+
+def warm_tag_index(app):
+    # Load the index at boot rather than on the first suggestion
+    from main import db
+
+    with app.app_context():
+        app.extensions["tag_index"].load(db.session)
+        db.session.remove()
+
+
+def init_tag_index(app):
+    app.extensions["tag_index"] = TagIndex(app.config["TAG_INDEX_TTL"])
+
+    for identifier, fn in (("after_flush", _after_flush),
+                           ("after_commit", _after_commit),
+                           ("after_rollback", _after_rollback)):
+        if not sa.event.contains(sa.orm.Session, identifier, fn):
+            sa.event.listen(sa.orm.Session, identifier, fn)
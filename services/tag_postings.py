@@ -0,0 +1,213 @@
+import bisect
+import itertools
+from array import array
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from models import Entry, EntryTag, Tag
+from services.tag_index import ReloadingIndex
+
+# In-process inverted index: tag id -> sorted array("q") of the ids of the
+# entries carrying it, built from entry_tags (one scan of its tag_id index).
+# Set queries walk the lists from the cursor a block at a time, intersecting
+# C-level slices of them, and stop as soon as the caller has a page.
+#
+# Commits in this process apply their entry_tags changes (collected at flush,
+# applied on commit, in order). Each modified list is copied and the copy
+# swapped in, so readers never lock. Other processes' writes and Core writes
+# made without add()/remove() are picked up by the ReloadingIndex reload,
+# every TAG_POSTINGS_TTL seconds; callers re-check matches against the
+# database rows they load, so a stale index can only hide new matches.
+
+EMPTY = array("q")
+
+# Candidates narrowed per round by TagPostings.matches
+BLOCK = 1024
+
+
+def _contains(ids, entry_id):
+    index = bisect.bisect_left(ids, entry_id)
+    return index < len(ids) and ids[index] == entry_id
+
+
+def _between(ids, low, high):
+    # The ids in (low, high], sliced in C; high None means no upper bound
+    start = bisect.bisect_right(ids, low)
+    if high is None:
+        return ids[start:]
+    return ids[start:bisect.bisect_right(ids, high, start)]
+
+
+class TagPostings(ReloadingIndex):
+
+    def _build_empty(self):
+        return {}
+
+    def _build(self, session):
+        rows = session.execute(
+            sa.select(EntryTag.tag_id, EntryTag.entry_id)
+            .order_by(EntryTag.tag_id, EntryTag.entry_id))
+
+        return {
+            tag_id: array("q", (entry_id for _, entry_id in group))
+            for tag_id, group in itertools.groupby(rows, key=lambda r: r[0])
+        }
+
+    def matches(self, session, all_of=(), any_of=(), none_of=(), after=0):
+        # Ids > `after` of the entries carrying every tag of `all_of`, at
+        # least one of `any_of` and none of `none_of`, ascending and lazily
+        lists = self._current(session)
+        required = sorted((lists.get(tag_id, EMPTY) for tag_id in all_of),
+                          key=len)
+        optional = [lists.get(tag_id, EMPTY) for tag_id in any_of]
+        excluded = [lists.get(tag_id, EMPTY) for tag_id in none_of]
+
+        # The candidates come from the shortest required list, or from the
+        # union of the optional ones, and are narrowed with set operations
+        # a block of at most BLOCK candidates per list at a time
+        if required:
+            drivers, required = required[:1], required[1:]
+        else:
+            drivers, optional = optional, []
+
+        low = after
+        while True:
+            starts = [bisect.bisect_right(ids, low) for ids in drivers]
+            if all(start == len(ids) for start, ids in zip(starts, drivers)):
+                return
+
+            # up to the nearest BLOCK-th next id of any driver
+            high = min((ids[start + BLOCK - 1]
+                        for start, ids in zip(starts, drivers)
+                        if start + BLOCK <= len(ids)), default=None)
+
+            block = set()
+            for ids in drivers:
+                block.update(_between(ids, low, high))
+            for ids in required:
+                block.intersection_update(_between(ids, low, high))
+            if optional:
+                block.intersection_update(set().union(
+                    *(_between(ids, low, high) for ids in optional)))
+            for ids in excluded:
+                block.difference_update(_between(ids, low, high))
+
+            yield from sorted(block)
+            if high is None:
+                return
+            low = high
+
+    def _patch(self, lists, changes):
+        # changes: [("add" | "remove", entry id, tag id),
+        #           ("entry", entry id, None), ("tag", None, tag id)]
+        lists = dict(lists)
+        copied = set()
+
+        def writable(tag_id):
+            if tag_id not in copied:
+                lists[tag_id] = array("q", lists.get(tag_id, EMPTY))
+                copied.add(tag_id)
+            return lists[tag_id]
+
+        for op, entry_id, tag_id in changes:
+            if op == "add":
+                if not _contains(lists.get(tag_id, EMPTY), entry_id):
+                    bisect.insort(writable(tag_id), entry_id)
+            elif op == "remove":
+                if _contains(lists.get(tag_id, EMPTY), entry_id):
+                    ids = writable(tag_id)
+                    del ids[bisect.bisect_left(ids, entry_id)]
+            elif op == "entry":
+                # a deleted entry leaves every list; cheap to probe
+                for other in [other for other, ids in lists.items()
+                              if _contains(ids, entry_id)]:
+                    ids = writable(other)
+                    del ids[bisect.bisect_left(ids, entry_id)]
+            elif op == "tag":
+                lists.pop(tag_id, None)
+                copied.discard(tag_id)
+
+        return {tag_id: ids for tag_id, ids in lists.items() if ids}
+
+
+def tag_postings():
+    return current_app.extensions["tag_postings"]
+
+
+def _record(session, changes):
+    if changes:
+        session.info.setdefault("tag_postings", []).extend(changes)
+
+
+def add(session, entry_id, tag_ids):
+    # Record entry_tags rows inserted with Core through `session`
+    _record(session, [("add", entry_id, tag_id) for tag_id in tag_ids])
+
+
+def remove(session, entry_id, tag_ids):
+    _record(session, [("remove", entry_id, tag_id) for tag_id in tag_ids])
+
+
+def _after_flush(session, flush_context):
+    changes = []
+
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        if isinstance(instance, Entry):
+            if instance in session.deleted:
+                changes.append(("entry", instance.id, None))
+                continue
+            history = sa.inspect(instance).attrs.tags.history
+            changes += [("add", instance.id, tag.id)
+                        for tag in history.added]
+            changes += [("remove", instance.id, tag.id)
+                        for tag in history.deleted]
+        elif isinstance(instance, Tag):
+            if instance in session.deleted:
+                changes.append(("tag", None, instance.id))
+                continue
+            history = sa.inspect(instance).attrs.entries.history
+            changes += [("add", entry.id, instance.id)
+                        for entry in history.added]
+            changes += [("remove", entry.id, instance.id)
+                        for entry in history.deleted]
+        elif isinstance(instance, EntryTag):
+            if instance in session.new:
+                changes.append(("add", instance.entry_id, instance.tag_id))
+            elif instance in session.deleted:
+                changes.append(("remove", instance.entry_id,
+                                instance.tag_id))
+
+    _record(session, changes)
+
+
+def _after_commit(session):
+    changes = session.info.pop("tag_postings", None)
+    if changes and has_app_context():
+        postings = current_app.extensions.get("tag_postings")
+        if postings is not None:
+            postings.apply(changes)
+
+
+def _after_rollback(session):
+    session.info.pop("tag_postings", None)
+
+
+def warm_tag_postings(app):
+    # Build the index at boot rather than on the first query
+    from main import db
+
+    with app.app_context():
+        app.extensions["tag_postings"].load(db.session)
+        db.session.remove()
+
+
+def init_tag_postings(app):
+    app.extensions["tag_postings"] = TagPostings(
+        app.config["TAG_POSTINGS_TTL"])
+
+    for identifier, fn in (("after_flush", _after_flush),
+                           ("after_commit", _after_commit),
+                           ("after_rollback", _after_rollback)):
+        if not sa.event.contains(sa.orm.Session, identifier, fn):
+            sa.event.listen(sa.orm.Session, identifier, fn)
@@ -0,0 +1,81 @@
+from collections import Counter
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import FeedItem, TagStat
+
+# tag_stats.public_entries counts the rows of each tag feed in feed_items.
+# services.feed counts the tag rows it replaces before and after every
+# refresh and hands the difference to adjust(), so the totals change in the
+# same transaction as the feed itself and are never recounted per request.
+
+feed_items = FeedItem.__table__
+tag_stats = TagStat.__table__
+
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def feed_counts(connection, where):
+    # Counter of the tag feed rows matching `where`, by tag id. Only used for
+    # the few rows of the entries being refreshed, so counted here rather
+    # than grouped by the database.
+    return Counter(connection.execute(
+        sa.select(feed_items.c.tag_id)
+        .where(feed_items.c.tag_id.is_not(None), where)
+    ).scalars())
+
+
+def adjust(connection, deltas):
+    # Add `deltas` (tag id -> amount) to the totals, creating missing rows
+    deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    rows = [{"tag_id": tag_id, "public_entries": delta}
+            for tag_id, delta in deltas.items()]
+    upsert = UPSERTS.get(connection.dialect.name)
+
+    if upsert is not None:
+        statement = upsert(tag_stats)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[tag_stats.c.tag_id],
+            set_={"public_entries": tag_stats.c.public_entries
+                  + statement.excluded.public_entries},
+        ), rows)
+    else:
+        existing = set(connection.execute(
+            sa.select(tag_stats.c.tag_id)
+            .where(tag_stats.c.tag_id.in_(deltas))).scalars())
+        if existing:
+            connection.execute(
+                sa.update(tag_stats)
+                .where(tag_stats.c.tag_id == sa.bindparam("id"))
+                .values(public_entries=tag_stats.c.public_entries
+                        + sa.bindparam("delta")),
+                [{"id": row["tag_id"], "delta": row["public_entries"]}
+                 for row in rows if row["tag_id"] in existing])
+        missing = [row for row in rows if row["tag_id"] not in existing]
+        if missing:
+            connection.execute(sa.insert(tag_stats), missing)
+
+    # rows dropping to zero go, so the table only holds tags in use
+    connection.execute(tag_stats.delete().where(
+        tag_stats.c.tag_id.in_(deltas), tag_stats.c.public_entries <= 0))
+
+
+def remove_tags(connection, tag_ids):
+    if tag_ids:
+        connection.execute(tag_stats.delete().where(
+            tag_stats.c.tag_id.in_(tag_ids)))
+
+
+def rebuild(connection):
+    # Recount every tag from feed_items, e.g. after feed.rebuild()
+    connection.execute(tag_stats.delete())
+    connection.execute(tag_stats.insert().from_select(
+        ["tag_id", "public_entries"],
+        sa.select(feed_items.c.tag_id, sa.func.count())
+        .where(feed_items.c.tag_id.is_not(None))
+        .group_by(feed_items.c.tag_id)
+    ))